@@ -5,11 +5,21 @@ import requests
 from requests.exceptions import ConnectionError
 import logging
 import time
-from requests.auth import HTTPDigestAuth
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
 import argparse
 import subprocess
+import threading
+import SensePro_Profiler
+import SensePro_History
+import SensePro_State
+import SensePro_Reload
+import SensePro_Config
+import SensePro_Engine
+import SensePro_Remote
+import SensePro_Sources
+import SensePro_Trace
+import SensePro_Outputs
 
 # ANSI Color codes for logging
 red_start = "\033[91m"  # ANSI code for Red text
@@ -29,11 +39,20 @@ reset = "\033[0m"  # ANSI reset code
 parser = argparse.ArgumentParser()
 parser.add_argument("--test-mode", help="Activate test mode", action="store_true")
 parser.add_argument("--test-mode-armed", help="Simulate system being armed in test mode", action="store_true")
+parser.add_argument("--replay", help="Replay recorded trigger events from a JSON lines file or edge trace; needs --test-mode. "
+                    "Replayed intrusions only log their outputs, and history and state go to separate replay files", metavar="PATH")
+parser.add_argument("--replay-speed", help="Replay speed factor, 0 for as fast as possible", type=float, default=1.0)
+parser.add_argument("--trace", help="Record every input edge to a binary edge trace (see SensePro_Trace.py)", metavar="PATH")
 args = parser.parse_args()
 
 # Set TEST_MODE based on the command-line argument
 TEST_MODE = args.test_mode
 TEST_MODE_ARMED = args.test_mode_armed
+# A replay drives the live runtime, so it must never reach the relay, the devices, the production
+# history or the server; offline, SensePro_Trace.py replays without any of them
+REPLAY = args.replay is not None
+if REPLAY and not TEST_MODE:
+    parser.error("--replay drives the live runtime and needs --test-mode; use SensePro_Trace.py to replay offline")
 
 # Logging setup
 script_dir = os.path.dirname(os.path.realpath(__file__))
@@ -71,6 +90,26 @@ load_env_variables(env_file_path)
 USER = os.getenv('NVR_USERNAME', 'default_username')
 PASSWORD = os.getenv('NVR_PASSWORD', 'default_password')
 
+# Seconds to connect to a camera, NVR or LED device, and then to get its answer; a device that
+# hangs must not block arming, disarming or the alarm outputs
+DEVICE_TIMEOUT = (3, 5)
+NVR_RETRY_DELAY_LIMIT = 60  # Longest wait between two attempts to set an NVR's alarm state
+
+# SIGUSR1 profiles all threads and dumps their stacks, SIGUSR2 writes a tracemalloc diff
+SensePro_Profiler.install_signal_handlers(logs_dir)
+
+# Every trigger, intrusion and arm/disarm is recorded to a local SQLite history
+SensePro_History.start(os.path.join(logs_dir, 'SensePro_replay_history.db' if REPLAY else 'SensePro_history.db'))
+
+# Events also go upstream over AMQP, through a local spool that rides out broker outages; a replay
+# sends nothing upstream
+event_uplink = None if REPLAY else SensePro_Remote.start_event_uplink(os.path.join(logs_dir, 'spool'))
+
+# Function to queue an event for the server
+def send_event(event_type, **fields):
+    if event_uplink is not None:
+        event_uplink.publish(event_type, **fields)
+
 # Load configuration from config.json file
 def load_configuration(config_file_path):
     if not os.path.exists(config_file_path):
@@ -78,68 +117,118 @@ def load_configuration(config_file_path):
         exit(1)
 
     try:
-        with open(config_file_path, 'r') as config_file:
-            config = json.load(config_file)
-            # Initialize last_triggered key for cameras and detectors
-            for camera_info in config['ipcctv'].values():
-                camera_info['last_triggered'] = None
-            for detector_info in config['detectors'].values():
-                detector_info['last_triggered'] = None
-        return config
-    except KeyError as e:
-        logging.error(f"{red_start}Missing key in config data: {e}{reset}")
+        return SensePro_Config.load_configuration(config_file_path, USER, PASSWORD)
+    except SensePro_Config.ConfigError as e:
+        for error in e.errors:
+            logging.error(f"{red_start}Invalid config data: {error}{reset}")
         exit(1)
     except json.JSONDecodeError as e:
         logging.error(f"{red_start}Error decoding JSON: {e}{reset}")
         exit(1)
 
 config_file_path = os.path.join(script_dir, 'config.json')
-config = load_configuration(config_file_path)
-
-# Extract configurations from config.json file
-IPCCTV = config['ipcctv']
-DETECTORS = config['detectors']
-TIME_THRESHOLD = timedelta(minutes=config['time_threshold'])
-ARM_DISARM_PIN = config['system_settings']['arm_disarm_pin']
-COUNTDOWN_DURATION = config['system_settings']['countdown_duration']
-RELAY_OUTPUT_PIN = config['system_settings']['relay_output_pin']
-RESET_BUTTON_PIN = config['system_settings']['reset_button_pin']
-RULES = config['rules']
-LED_PATTERN = config['LED_Pattern']
+
+# The compiled configuration is immutable; trigger times live in STATE
+CONFIG = load_configuration(config_file_path)
+STATE = SensePro_Engine.RuntimeState(CONFIG)
+
+# Held while a reloaded configuration is swapped in
+config_lock = threading.Lock()
+# Serialises config.json reloads and server pushes
+reload_lock = threading.Lock()
+
+# Function to read the configuration and runtime state as one consistent snapshot
+def active_configuration():
+    with config_lock:
+        return CONFIG, STATE
+
+# Armed flag and trigger windows survive restarts in a small memory-mapped state file
+# (a replay starts from a fresh state file of its own every time)
+state_file_path = os.path.join(script_dir, 'SensePro_replay_state.bin' if REPLAY else 'SensePro_state.bin')
+if REPLAY and os.path.exists(state_file_path):
+    os.remove(state_file_path)
+warm_state = SensePro_State.StateFile(state_file_path, CONFIG.slot_keys)
+
+# Optional edge trace of every input, for replaying an incident offline
+trace = SensePro_Trace.TraceWriter(args.trace, CONFIG.slot_keys) if args.trace else None
+
+# Function to record a system input (arm switch, reset button, remote command) in the edge trace
+def trace_system_input(key, edge):
+    if trace is not None:
+        trace.record(key, edge)
 
 # Initialize GPIO for arming/disarming using the pin from the configuration
-arm_disarm_button = gpiozero.Button(ARM_DISARM_PIN, pull_up=True, bounce_time=0.5)
-relay_output = gpiozero.OutputDevice(RELAY_OUTPUT_PIN, active_high=True, initial_value=False)
-reset_button = gpiozero.Button(RESET_BUTTON_PIN, hold_time=5)
+arm_disarm_button = gpiozero.Button(CONFIG.settings.arm_disarm_pin, pull_up=True, bounce_time=0.5)
+relay_output = gpiozero.OutputDevice(CONFIG.settings.relay_output_pin, active_high=True, initial_value=False)
+reset_button = gpiozero.Button(CONFIG.settings.reset_button_pin, hold_time=5)
 armed = False
 countdown_in_progress = False
+# Held while the armed/countdown flags are checked and changed; the button and remote commands both change them
+arming_lock = threading.Lock()
+
+# Intrusion outputs run on one lane per camera, relay and LED device, never two at once on a target
+output_lanes = SensePro_Outputs.OutputLanes()
+relay_pulse = SensePro_Outputs.RelayPulse(output_lanes, relay_output.on, relay_output.off)
 
-# Function to trigger the relay
+# Function to trigger the relay; an intrusion during a pulse extends it
 def trigger_relay(duration):
-    relay_output.on()
-    time.sleep(duration)
-    relay_output.off()
+    relay_pulse.trigger(duration)
+
+# Function to handle an input from the engine queue; only presses trigger, and a press already
+# reported by another source within the fusion window is not counted again
+def handle_input(event):
+    if event.edge == SensePro_Sources.PRESS and not fusion.accept(event):
+        return
+    if trace is not None:
+        trace.record(event.key, event.edge, event.ts)
+    kind, _, device_id = event.key.partition(':')
+    if event.edge != SensePro_Sources.PRESS:
+        on_device_released(kind, device_id, event.ts, event.source)
+    elif kind == 'camera':
+        on_camera_triggered(device_id, event.ts, event.source)
+    elif kind == 'detector':
+        on_detector_triggered(device_id, event.ts, event.source)
 
 # Function to disable event callbacks for all GPIO inputs
 def disable_event_callbacks():
-    for camera_info in IPCCTV.values():
-        camera_info['device'].when_pressed = None
-    for detector_info in DETECTORS.values():
-        detector_info['device'].when_pressed = None
+    with config_lock:
+        gpio_source.set_enabled(False)
 
 # Function to enable event callbacks for all GPIO inputs
 def enable_event_callbacks():
-    for camera_name, camera_info in IPCCTV.items():
-        camera_info['device'].when_pressed = lambda name=camera_name: on_camera_triggered(name)
-    for detector_id, detector_info in DETECTORS.items():
-        detector_info['device'].when_pressed = lambda id=detector_id: on_detector_triggered(id)
+    with config_lock:
+        gpio_source.set_enabled(True)
 
 # Function to reset the last triggered times for all cameras and detectors
 def reset_trigger_times():
-    for camera_info in IPCCTV.values():
-        camera_info['last_triggered'] = None
-    for detector_info in DETECTORS.values():
-        detector_info['last_triggered'] = None
+    with config_lock:
+        STATE.last_triggered[:] = [None] * CONFIG.slot_count
+    warm_state.clear_triggers()
+
+# Function to restore trigger times from the previous run that are still within the time threshold
+def restore_trigger_times():
+    config, state = active_configuration()
+    oldest = time.time() - config.time_threshold
+    restored = 0
+    for device in config.devices:
+        ts = warm_state.restored_times.get(device.key)
+        if ts and ts >= oldest:
+            state.last_triggered[device.slot] = ts
+            restored += 1
+        else:
+            state.last_triggered[device.slot] = None
+            warm_state.set_triggered(device.key, None)
+    return restored
+
+# Function to resume the armed state of the previous run; the NVRs are still armed, so they are not contacted
+def resume_armed_state():
+    global armed
+    armed = True
+    restored = restore_trigger_times()
+    trace_system_input(SensePro_Trace.RESUMED_KEY, SensePro_Sources.PRESS)
+    warm_state.set_armed(True)
+    send_curl_command("armed")
+    logging.info(f"{lime_green_start}Resumed armed state from previous run with {restored} open trigger windows.{reset}")
 
 # Function to handle immediate arming without countdown
 def arm_system_immediately():
@@ -149,85 +238,130 @@ def arm_system_immediately():
         armed = True
         disable_event_callbacks()
         reset_trigger_times()
+        trace_system_input(SensePro_Trace.ARMED_KEY, SensePro_Sources.PRESS)
         enable_event_callbacks()
+        warm_state.set_armed(True)
         set_nvr_alarm_state("arm")
         send_curl_command("armed")
+        SensePro_History.record_system_event("armed")
+        send_event("armed")
         logging.info(f"{lime_green_start}System armed immediately at startup.{reset}")
 
 # Function to check the initial state at startup
 def check_initial_state():
-    if TEST_MODE_ARMED:
-        logging.info(f"{red_bg_bold_white_text}Test mode armed: ARMED{reset}")
-        arm_system_immediately()
-        send_curl_command("armed")
-    elif arm_disarm_button.is_pressed:
-        logging.info(f"{red_bg_bold_white_text}Initial state check: ARMED{reset}")
-        arm_system_immediately()
-        send_curl_command("armed")
+    global armed
+    if TEST_MODE_ARMED or arm_disarm_button.is_pressed:
+        logging.info(f"{red_bg_bold_white_text}{'Test mode armed' if TEST_MODE_ARMED else 'Initial state check'}: ARMED{reset}")
+        if warm_state.restored_armed:
+            resume_armed_state()
+        else:
+            arm_system_immediately()
+            send_curl_command("armed")
     else:
         logging.info(f"{green_bg_bold_white_text}Initial state check: DISARMED{reset}")
+        if warm_state.restored_armed:
+            # Disarmed while we were down; the NVRs were left armed and need disarming
+            armed = True
+        else:
+            restore_trigger_times()
         disarm_system()
         send_curl_command("idle")
 
 # Arm Function
 def arm_system():
-    global armed, countdown_in_progress
-    if not countdown_in_progress and not armed:
+    trace_system_input(SensePro_Trace.ARM_KEY, SensePro_Sources.PRESS)
+    if begin_arming():
+        complete_arming()
+
+# Function to start arming; returns True when a countdown has been started
+def begin_arming():
+    global countdown_in_progress
+    with arming_lock:
+        if countdown_in_progress or armed:
+            if armed:
+                logging.info(f"{red_start}System is already armed.{reset}")
+            if countdown_in_progress:
+                logging.info(f"{red_start}Arming process is already in progress.{reset}")
+            return False
         logging.info(f"{red_bg_bold_white_text}Arming system...{reset}")
         countdown_in_progress = True
-        disable_event_callbacks()  # Disable triggers during countdown
-        reset_trigger_times()  # Reset all last triggered times to ensure a clean state
-        send_curl_command("arming")  # Send the arming command to the LED device at the start of the countdown
-        for remaining in range(COUNTDOWN_DURATION, 0, -1):
-            if not countdown_in_progress:  # Check if countdown was interrupted
-                logging.info(f"{red_start}Arming interrupted.{reset}")
-                enable_event_callbacks()  # Re-enable if interrupted
-                return
-            logging.info(f"{red_start}System arms in {remaining} seconds...{reset}")
-            time.sleep(1)
-        armed = True
-        countdown_in_progress = False
-        enable_event_callbacks()  # Re-enable after arming
-        logging.info(f"{lime_green_start}System armed.{reset}")
-        set_nvr_alarm_state("arm")
-    else:
-        if armed:
-            logging.info(f"{red_start}System is already armed.{reset}")
-        if countdown_in_progress:
-            logging.info(f"{red_start}Arming process is already in progress.{reset}")
+    disable_event_callbacks()  # Disable triggers during countdown
+    reset_trigger_times()  # Reset all last triggered times to ensure a clean state
+    return True
+
+# Function to run the arming countdown and arm the system
+def complete_arming():
+    global armed, countdown_in_progress
+    send_curl_command("arming")  # Send the arming command to the LED device at the start of the countdown
+    for remaining in range(CONFIG.settings.countdown_duration, 0, -1):
+        if not countdown_in_progress:  # Check if countdown was interrupted
+            logging.info(f"{red_start}Arming interrupted.{reset}")
+            enable_event_callbacks()  # Re-enable if interrupted
+            return
+        logging.info(f"{red_start}System arms in {remaining} seconds...{reset}")
+        time.sleep(1)
+    with arming_lock:
+        interrupted = not countdown_in_progress  # Disarmed during the last second
+        if not interrupted:
+            armed = True
+            countdown_in_progress = False
+    if interrupted:
+        logging.info(f"{red_start}Arming interrupted.{reset}")
+        enable_event_callbacks()
+        return
+    enable_event_callbacks()  # Re-enable after arming
+    warm_state.set_armed(True)
+    SensePro_History.record_system_event("armed")
+    send_event("armed")
+    logging.info(f"{lime_green_start}System armed.{reset}")
+    set_nvr_alarm_state("arm")
 
 # Disarm Function
 def disarm_system():
+    trace_system_input(SensePro_Trace.ARM_KEY, SensePro_Sources.RELEASE)
+    if begin_disarming():
+        apply_disarm_outputs()
+
+# Function to leave the armed or arming state; returns True when the system was armed or arming
+def begin_disarming():
     global armed, countdown_in_progress
-    if armed or countdown_in_progress:
+    with arming_lock:
+        if not (armed or countdown_in_progress):
+            logging.info(f"{red_bg_bold_white_text}System is already disarmed or no arming in progress.{reset}")
+            return False
         logging.info(f"{amber_start}Disarming system...{reset}")
         countdown_in_progress = False  # Interrupt countdown if in progress
         armed = False
-        reset_trigger_times()
-        logging.info(f"{lime_green_start}System disarmed.{reset}")
-        set_nvr_alarm_state("disarm")
-        send_curl_command("disarm")
-    else:
-        logging.info(f"{red_bg_bold_white_text}System is already disarmed or no arming in progress.{reset}")
+    reset_trigger_times()
+    warm_state.set_armed(False)
+    SensePro_History.record_system_event("disarmed")
+    send_event("disarmed")
+    logging.info(f"{lime_green_start}System disarmed.{reset}")
+    return True
+
+# Function to tell the NVRs and the LED device that the system is disarmed
+def apply_disarm_outputs():
+    set_nvr_alarm_state("disarm")
+    send_curl_command("disarm")
 
 def send_curl_command(action):
-    if action in LED_PATTERN:
-        ip = LED_PATTERN[action]["ip"]
-        protocol = LED_PATTERN[action]["protocol"]
-        url = f"{protocol}://{ip}/{action}"
+    pattern = CONFIG.led_patterns.get(action)
+    if pattern is not None:
+        ip = pattern.ip
         logging.info(f"Sending {action} command to LED device at {ip}")
 
         try:
-            # Log the URL and the authentication details for debugging purposes (be careful with sensitive data)
-            logging.debug(f"URL: {url}, User: SensePro, Password: SensePro")
+            logging.debug(f"URL: {pattern.url}")
 
-            response = requests.get(url, auth=requests.auth.HTTPBasicAuth("SensePro", "SensePro"))
+            response = requests.get(pattern.url, auth=pattern.auth, timeout=DEVICE_TIMEOUT, verify=pattern.verify)
 
             # Check if the response is OK (status code 200)
             if response.status_code == 200:
                 logging.info(f"{pink_text}Sent {action} command to {ip}{reset}")
             else:
                 logging.error(f"{red_start}Failed to send {action} command to {ip}. Status Code: {response.status_code}, Response: {response.text}{reset}")
+        except requests.exceptions.Timeout:
+            logging.error(f"{red_start}LED device at {ip} did not answer the {action} command in time.{reset}")
         except ConnectionError:
             logging.error(f"{red_start}Unable to communicate with device at {ip} for {action} command.{reset}")
         except Exception as e:
@@ -235,45 +369,50 @@ def send_curl_command(action):
     else:
         logging.warning(f"{yellow_start}No LED pattern found for action: {action}{reset}")
 
+# Function to set every NVR's alarm state; the NVRs are contacted side by side, so one that is
+# down or slow does not hold back the others, and this returns once all have finished
 def set_nvr_alarm_state(mode):
-    for nvr_id, nvr_info in config["NVRs"].items():
-        ip = nvr_info["ip"]
-        protocol = nvr_info["protocol"]
-        action = nvr_info[mode]
-        input = action["input"]
-        relay = action["relay"]
-        logging.info(f"{amber_start}Setting NVR {nvr_id} alarm state to {relay} for mode {mode} at IP {ip}{reset}")
-        change_nvr_alarm_state(protocol, ip, input, relay, USER, PASSWORD, nvr_id)
+    threads = []
+    for nvr in CONFIG.nvrs:
+        alarm_state = getattr(nvr, mode)
+        logging.info(f"{amber_start}Setting NVR {nvr.id} alarm state to {alarm_state.relay} for mode {mode} at IP {nvr.ip}{reset}")
+        thread = threading.Thread(target=change_nvr_alarm_state, args=(nvr, alarm_state), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
 
 arm_disarm_button.when_pressed = arm_system
 arm_disarm_button.when_released = disarm_system
 
-def change_camera_alarm_state(protocol, camera_ip, sensor_state, user, password, camera_name):
-    relay_channel = 0
-    url = f"{protocol}://{camera_ip}/cgi-bin/configManager.cgi?action=setConfig&Alarm[{relay_channel}].SensorType={sensor_state}"
+def change_camera_alarm_state(camera, url, sensor_state):
     try:
-        response = requests.get(url, auth=HTTPDigestAuth(user, password))
+        response = requests.get(url, auth=camera.auth, timeout=DEVICE_TIMEOUT, verify=camera.verify)
         if response.status_code == 200:
-            logging.info(f"Alarm state set to {sensor_state} for camera at {camera_ip}.")
+            logging.info(f"Alarm state set to {sensor_state} for camera at {camera.ip}.")
         else:
-            logging.error(f"Failed to set alarm state for camera at {camera_ip}. Status Code: {response.status_code}, Response: {response.text}")
+            logging.error(f"Failed to set alarm state for camera at {camera.ip}. Status Code: {response.status_code}, Response: {response.text}")
+    except requests.exceptions.Timeout:
+        logging.error(f"Camera {camera.id} at {camera.ip} did not answer in time; alarm state {sensor_state} not confirmed.")
     except ConnectionError:
-        logging.error(f"Unable to communicate with camera {camera_name} at {camera_ip}.")
+        logging.error(f"Unable to communicate with camera {camera.id} at {camera.ip}.")
     except Exception as e:
-        logging.error(f"Error when changing alarm state for camera at {camera_ip}: {e}")
+        logging.error(f"Error when changing alarm state for camera at {camera.ip}: {e}")
 
-def change_nvr_alarm_state(protocol, ip, input, relay, user, password, nvr_id, retries=10, delay=5):
-    url = f"{protocol}://{ip}/cgi-bin/configManager.cgi?action=setConfig&{input}={relay}"
+def change_nvr_alarm_state(nvr, alarm_state, retries=10, delay=5):
+    ip = nvr.ip
     attempt = 0
     while attempt < retries:
         if ping_device(ip):
             try:
-                response = requests.get(url, auth=HTTPDigestAuth(user, password))
+                response = requests.get(alarm_state.url, auth=nvr.auth, timeout=DEVICE_TIMEOUT, verify=nvr.verify)
                 if response.status_code == 200:
-                    logging.info(f"{amber_start}Alarm state set to {relay} for NVR {nvr_id} at {ip}.{reset}")
+                    logging.info(f"{amber_start}Alarm state set to {alarm_state.relay} for NVR {nvr.id} at {ip}.{reset}")
                     return
                 else:
                     logging.error(f"Failed to set alarm state for NVR at {ip}. Status Code: {response.status_code}, Response: {response.text}")
+            except requests.exceptions.Timeout:
+                logging.error(f"NVR at {ip} did not answer in time. Retrying in {delay} seconds...")
             except ConnectionError:
                 logging.error(f"Unable to communicate with NVR at {ip}. Retrying in {delay} seconds...")
             except Exception as e:
@@ -282,112 +421,246 @@ def change_nvr_alarm_state(protocol, ip, input, relay, user, password, nvr_id, r
             logging.error(f"NVR at {ip} is unreachable. Retrying in {delay} seconds...")
         attempt += 1
         time.sleep(delay)
-        delay *= 2  # Exponential backoff
+        delay = min(delay * 2, NVR_RETRY_DELAY_LIMIT)  # Exponential backoff, capped
     logging.error(f"All retry attempts to communicate with NVR at {ip} have failed.")
 
 def ping_device(ip):
+    host = ip.partition(':')[0]  # ping takes the host only; an NVR may be configured as ip:port
     try:
-        result = subprocess.run(["ping", "-c", "1", "-W", "1", ip], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        result = subprocess.run(["ping", "-c", "1", "-W", "1", host], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         return result.returncode == 0
     except Exception as e:
         logging.error(f"Error pinging device at {ip}: {e}")
         return False
 
-def send_alarm_to_camera(protocol, camera_ip, camera_name):
+def send_alarm_to_camera(camera):
     if TEST_MODE:
-        logging.info(f"{lime_green_start}Test Mode ON - Alarm not sent to {camera_name} at {camera_ip}{reset}")
+        logging.info(f"{lime_green_start}Test Mode ON - Alarm not sent to {camera.id} at {camera.ip}{reset}")
     else:
-        change_camera_alarm_state(protocol, camera_ip, "NO", USER, PASSWORD, camera_name)
+        change_camera_alarm_state(camera, camera.alarm_on_url, "NO")
         time.sleep(2)
-        change_camera_alarm_state(protocol, camera_ip, "NC", USER, PASSWORD, camera_name)
+        change_camera_alarm_state(camera, camera.alarm_off_url, "NC")
+
+# Function to move a device's trigger time back when another source reported the same press
+# earlier, and evaluate the rules again: the earlier time can complete a sequence, or fall in a window
+def keep_earliest_trigger(key, ts):
+    kind, _, device_id = key.partition(':')
+    with config_lock:
+        device = (CONFIG.cameras_by_id if kind == 'camera' else CONFIG.detectors_by_id).get(device_id)
+        if device is None or STATE.last_triggered[device.slot] is None or STATE.last_triggered[device.slot] <= ts:
+            return
+        STATE.last_triggered[device.slot] = ts
+    warm_state.set_triggered(key, ts)
+    if countdown_in_progress:
+        return
+    check_for_confirmed_intrusion()
 
-def on_detector_triggered(detector_id):
+# Function to record a trigger time; returns (device, time), or (None, None) when the device is no longer configured
+def record_trigger(devices_by_id, device_id, triggered_at=None):
+    with config_lock:
+        device = getattr(CONFIG, devices_by_id).get(device_id)
+        if device is None:  # Removed by a configuration reload
+            return None, None
+        triggered_at = triggered_at or time.time()
+        STATE.last_triggered[device.slot] = triggered_at
+    warm_state.set_triggered(device.key, triggered_at)
+    return device, triggered_at
+
+def on_detector_triggered(detector_id, triggered_at=None, source='gpio'):
     global countdown_in_progress
     if countdown_in_progress:
         return
 
-    detector_id_str = str(detector_id)
-    detector_name = DETECTORS[detector_id_str]["name"]
-    logging.info(f"{yellow_bg_black_text}Detector {detector_name} triggered{reset}")
-    DETECTORS[detector_id_str]["last_triggered"] = datetime.now()
-    logging.info(f"{pink_bg_black_text}Detector {detector_id_str} last triggered time set to {DETECTORS[detector_id_str]['last_triggered']}{reset}")
+    detector, triggered_at = record_trigger('detectors_by_id', str(detector_id), triggered_at)
+    if detector is None:
+        return
+    logging.info(f"{yellow_bg_black_text}Detector {detector.name} triggered{reset}")
+    SensePro_History.record_trigger(detector.id, "detector", source=source, ts=triggered_at)
+    send_event("trigger", device=detector.id, kind="detector", source=source, ts=triggered_at)
+    logging.info(f"{pink_bg_black_text}Detector {detector.id} last triggered time set to {datetime.fromtimestamp(triggered_at)}{reset}")
     check_for_confirmed_intrusion()
 
-def on_camera_triggered(camera_id):
+def on_camera_triggered(camera_id, triggered_at=None, source='gpio'):
     global countdown_in_progress
     if countdown_in_progress:
         return
 
-    camera_ip = IPCCTV[camera_id]["ip"]
-    logging.info(f"{cyan_bg_black_text}{camera_id} - {camera_ip} triggered{reset}")
-    IPCCTV[camera_id]["last_triggered"] = datetime.now()
-    logging.info(f"{pink_bg_black_text}Camera {camera_id} last triggered time set to {IPCCTV[camera_id]['last_triggered']}{reset}")
+    camera, triggered_at = record_trigger('cameras_by_id', camera_id, triggered_at)
+    if camera is None:
+        return
+    logging.info(f"{cyan_bg_black_text}{camera.id} - {camera.ip} triggered{reset}")
+    SensePro_History.record_trigger(camera.id, "camera", source=source, ts=triggered_at)
+    send_event("trigger", device=camera.id, kind="camera", source=source, ts=triggered_at)
+    logging.info(f"{pink_bg_black_text}Camera {camera.id} last triggered time set to {datetime.fromtimestamp(triggered_at)}{reset}")
     check_for_confirmed_intrusion()
 
+# Function to record a release edge in the history and upstream; a release does not change the
+# trigger windows, so no rule is evaluated
+def on_device_released(kind, device_id, released_at, source):
+    if countdown_in_progress:
+        return
+    config, _ = active_configuration()
+    device = (config.cameras_by_id if kind == 'camera' else config.detectors_by_id).get(device_id)
+    if device is None:
+        return
+    SensePro_History.record_trigger(device.id, kind, edge=0, source=source, ts=released_at)
+    send_event("trigger", device=device.id, kind=kind, edge=SensePro_Sources.RELEASE, source=source, ts=released_at)
+
 def check_for_confirmed_intrusion():
-    current_time = datetime.now()
-    recent_cameras = {camera_id: camera for camera_id, camera in IPCCTV.items() if camera["last_triggered"] and (current_time - camera["last_triggered"]) <= TIME_THRESHOLD}
-    recent_detectors = {detector_id: detector for detector_id, detector in DETECTORS.items() if detector["last_triggered"] and (current_time - detector["last_triggered"]) <= TIME_THRESHOLD}
-
-    logging.debug(f"Recent cameras: {recent_cameras}")
-    logging.debug(f"Recent detectors: {recent_detectors}")
-
-    for rule in RULES:
-        ipcctvs_triggered = [ipcctv for ipcctv in rule["ipcctvs"] if ipcctv in recent_cameras]
-        detectors_triggered = [detector for detector in rule["detectors"] if str(detector) in recent_detectors]
-
-        logging.debug(f"Checking rule: {rule['name']}")
-        logging.debug(f"Triggered IPCCTVs: {ipcctvs_triggered}")
-        logging.debug(f"Triggered Detectors: {detectors_triggered}")
-
-        if rule["type"] == "any":
-            if ipcctvs_triggered and detectors_triggered:
-                logging.info(f"{red_bg_bold_white_text}Confirmed intrusion detected by rule: {rule['name']}{reset}")
-                for ipcctv in ipcctvs_triggered:
-                    send_alarm_to_camera(IPCCTV[ipcctv]["protocol"], IPCCTV[ipcctv]["ip"], ipcctv)
-                for detector in detectors_triggered:
-                    for camera_name in DETECTORS[str(detector)]["associated_cameras"]:
-                        send_alarm_to_camera(IPCCTV[camera_name]["protocol"], IPCCTV[camera_name]["ip"], camera_name)
-                    recent_detectors[str(detector)]["last_triggered"] = None
-                if "relay_duration" in rule:
-                    trigger_relay(rule["relay_duration"])
-                send_curl_command("intrusion")
-                break
-        elif rule["type"] == "all":
-            if len(ipcctvs_triggered) == len(rule["ipcctvs"]) and len(detectors_triggered) == len(rule["detectors"]):
-                logging.info(f"{red_bg_bold_white_text}Confirmed intrusion detected by rule: {rule['name']}{reset}")
-                for ipcctv in ipcctvs_triggered:
-                    send_alarm_to_camera(IPCCTV[ipcctv]["protocol"], IPCCTV[ipcctv]["ip"], ipcctv)
-                for detector in detectors_triggered:
-                    for camera_name in DETECTORS[str(detector)]["associated_cameras"]:
-                        send_alarm_to_camera(IPCCTV[camera_name]["protocol"], IPCCTV[camera_name]["ip"], camera_name)
-                    recent_detectors[str(detector)]["last_triggered"] = None
-                if "relay_duration" in rule:
-                    trigger_relay(rule["relay_duration"])
-                send_curl_command("intrusion")
-                break
-
-# Initialize GPIO devices for each camera and detector
-for camera_name, camera_info in IPCCTV.items():
-    camera_info['device'] = gpiozero.Button(camera_info['pin'], pull_up=True)
-    camera_info['device'].when_pressed = lambda name=camera_name: on_camera_triggered(name)
-
-for detector_id, detector_info in DETECTORS.items():
-    detector_info['device'] = gpiozero.Button(detector_info['pin'], pull_up=True)
-    detector_info['device'].when_pressed = lambda id=detector_id: on_detector_triggered(id)
+    config, state = active_configuration()
+    intrusion = SensePro_Engine.find_confirmed_intrusion(config, state.last_triggered, time.time())
+    if intrusion is None:
+        return
+
+    rule = intrusion.rule
+    camera_ids = [config.devices[slot].id for slot in intrusion.cameras]
+    detector_ids = [config.devices[slot].id for slot in intrusion.detectors]
+    logging.debug(f"Rule {rule.name} ({rule.type}): triggered IPCCTVs {camera_ids}, detectors {detector_ids}")
+    logging.info(f"{red_bg_bold_white_text}Confirmed intrusion detected by rule: {rule.name}{reset}")
+    SensePro_History.record_intrusion(rule.name, camera_ids, detector_ids)
+    send_event("intrusion", rule=rule.name, cameras=camera_ids, detectors=detector_ids)
+
+    SensePro_Engine.consume_detectors(state, intrusion)
+    for slot in intrusion.detectors:
+        warm_state.set_triggered(config.devices[slot].key, None)
+    # The outputs take seconds (camera alarm pulses, relay); the engine queue keeps moving meanwhile
+    run_intrusion_outputs(config, intrusion)
+
+# Function to queue the camera alarms, the relay pulse and the LED intrusion pattern on their output
+# lanes; a camera still being alarmed by an earlier intrusion is not alarmed again
+def run_intrusion_outputs(config, intrusion):
+    for output, target in SensePro_Engine.intrusion_outputs(config, intrusion):
+        if REPLAY:
+            logging.info(f"{lime_green_start}Replay - {output} output not sent: {getattr(target, 'id', target)}{reset}")
+            continue
+        if output == 'camera':
+            output_lanes.submit(f'camera:{target.id}', 'alarm', send_alarm_to_camera, target)
+        elif output == 'relay':
+            trigger_relay(target)
+        else:
+            output_lanes.submit('led', target, send_curl_command, target)
+
+# Inputs from every source go through one queue to the engine thread: GPIO pins, the eventManager
+# streams of pinless cameras, RabbitMQ and an optional replay. on_camera_triggered and
+# on_detector_triggered drop inputs during the arming countdown, when the GPIO callbacks are also removed.
+engine_queue = SensePro_Sources.EventQueue()
+fusion = SensePro_Sources.Fusion(CONFIG.settings.fusion_window, keep_earliest_trigger)
+gpio_source = SensePro_Sources.GpioSource(lambda pin: gpiozero.Button(pin, pull_up=True))
+input_sources = [gpio_source, SensePro_Sources.StreamSource(USER, PASSWORD), SensePro_Sources.AmqpSource()]
+if args.replay:
+    replay_source = SensePro_Trace.TraceSource if SensePro_Trace.is_trace(args.replay) else SensePro_Sources.ReplaySource
+    input_sources.append(replay_source(args.replay, args.replay_speed))
+
+# Function to apply a changed config.json without restarting
+def reload_configuration(path):
+    with reload_lock:
+        try:
+            new_config = SensePro_Config.load_configuration(path, USER, PASSWORD)
+        except SensePro_Config.ConfigError as e:
+            for error in e.errors:
+                logging.error(f"{red_start}Config reload rejected: {error}{reset}")
+            return
+        except (OSError, ValueError) as e:
+            logging.error(f"{red_start}Config reload rejected: {e}{reset}")
+            return
+        apply_configuration(new_config)
+
+# Function to apply a configuration pushed by the server: it is translated onto the site settings
+# of config.json, compiled, saved as the new config.json and applied. Raises if it is rejected.
+def apply_server_configuration(document, version):
+    with reload_lock:
+        with open(config_file_path, 'r') as config_file:
+            base = json.load(config_file)
+        raw = SensePro_Remote.translate_server_config(document, base)
+        new_config = SensePro_Config.compile_configuration(raw, USER, PASSWORD)
+        SensePro_Config.save_configuration(config_file_path, raw, new_config)
+        logging.info(f"{cyan_start}Configuration {version[:12]} received from the server.{reset}")
+        apply_configuration(new_config)
+
+# Function to swap in a compiled configuration: only changed inputs are rebound,
+# unchanged devices keep their GPIO binding and trigger window
+def apply_configuration(new_config):
+    global CONFIG, STATE
+    diff = SensePro_Reload.diff_configurations(CONFIG, new_config)
+    if not SensePro_Reload.has_changes(diff):
+        logging.info("Configuration rewritten without changes.")
+        return
+    logging.info(f"{amber_start}Applying configuration change: {SensePro_Reload.describe_changes(diff)}{reset}")
+
+    with config_lock:
+        new_state = STATE.carry_over(CONFIG, new_config)
+        SensePro_Sources.update_sources(input_sources, new_config)
+        CONFIG, STATE = new_config, new_state
+
+    warm_state.rekey(CONFIG.slot_keys)
+    if trace is not None:
+        trace.rekey(CONFIG.slot_keys)
+
+    fusion.window = CONFIG.settings.fusion_window
+    restart_settings = [key for key in diff['system_settings'] if key not in ('countdown_duration', 'fusion_window')]
+    if restart_settings:
+        logging.warning(f"{yellow_start}Changed {', '.join(restart_settings)} take effect after a restart.{reset}")
+    if armed and diff['nvrs_changed']:
+        for nvr in CONFIG.nvrs:
+            if nvr.id in diff['nvrs_changed']:
+                threading.Thread(target=change_nvr_alarm_state, args=(nvr, nvr.arm), daemon=True).start()
+    logging.info(f"{lime_green_start}Configuration reloaded.{reset}")
 
 # Reset Button Functionality
 def reset_system():
+    trace_system_input(SensePro_Trace.RESET_KEY, SensePro_Sources.PRESS)
+    if begin_reset():
+        apply_disarm_outputs()
+
+# Function to reset the system state; returns True when the NVRs and LED device still need disarming
+def begin_reset():
     logging.info(f"{red_bg_bold_white_text}System reset initiated.{reset}")
-    disarm_system()
+    SensePro_History.record_system_event("reset")
+    send_event("reset")
+    disarming = begin_disarming()
     reset_trigger_times()
     enable_event_callbacks()
     logging.info(f"{green_bg_bold_white_text}System reset complete.{reset}")
+    return disarming
 
 reset_button.when_held = reset_system
 
+# Function to describe the system state for remote commands
+def system_status():
+    config, state = active_configuration()
+    return {
+        'armed': armed,
+        'arming': countdown_in_progress,
+        'devices': config.slot_count,
+        'open_trigger_windows': sum(ts is not None for ts in state.last_triggered),
+        'fused_duplicates': fusion.duplicates,
+        'source_skew': fusion.skew_report(),
+    }
+
+# Function to apply a remote command through the same state machine as the buttons; the state
+# changes before this returns, the countdown and NVR/LED requests continue in the background
+def run_remote_command(command):
+    if command == 'arm':
+        trace_system_input(SensePro_Trace.ARM_KEY, SensePro_Sources.PRESS)
+        if begin_arming():
+            threading.Thread(target=complete_arming, daemon=True).start()
+    elif command == 'disarm':
+        trace_system_input(SensePro_Trace.ARM_KEY, SensePro_Sources.RELEASE)
+        if begin_disarming():
+            threading.Thread(target=apply_disarm_outputs, daemon=True).start()
+    elif command == 'reset':
+        trace_system_input(SensePro_Trace.RESET_KEY, SensePro_Sources.PRESS)
+        if begin_reset():
+            threading.Thread(target=apply_disarm_outputs, daemon=True).start()
+    return system_status()
+
 # Main loop
+SensePro_Sources.start_sources(input_sources, engine_queue, CONFIG)
+engine_queue.start(handle_input)
 check_initial_state()
+SensePro_Reload.watch(config_file_path, reload_configuration)
+SensePro_Remote.start(apply_server_configuration, os.path.join(script_dir, 'SensePro_remote.json'))
+SensePro_Remote.start_commands(run_remote_command, os.path.join(script_dir, 'SensePro_commands.json'))
 
 logging.info(
     f"{cyan_start}Running in {'test mode' if TEST_MODE else 'normal mode'}. Use --test-mode to activate test mode.{reset}\n\n{yellow_start}   _____                      ____           \n  / ___/___  ____  ________  / __ \\_________ \n  \\__ \\/ _ \\/ __ \\/ ___/ _ \\/ /_/ / ___/ __ \\\n ___/ /  __/ / / (__  )  __/ ____/ /  / /_/ /\n/____/\\___/_/ /_/____/\\___/_/   /_/   \\____/ \n                                             V1\n{reset}\nSensePro is now running. Press CTRL+C to exit.\n\n"
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# SensePro_Batch.py - Rule evaluation for many sites at once as NumPy array operations.
+#
+# The trigger windows of all sites are one array of trigger times, sites x device slots (NaN
+# when idle), and their rules are membership masks, sites x rules x slots, one for cameras and
+# one for detectors. A tick compares every window against its site's threshold, counts the
+# triggered members of every rule with a batched matrix product, applies the 'any', 'all',
+# 'one', 'majority' and 'sequence' conditions to the whole sites x rules grid, and takes the
+# first confirmed rule of each site: the same result find_confirmed_intrusion gives site by site.
+# step() then consumes the detectors of every intrusion, as check_for_confirmed_intrusion does.
+#
+# Sites with different configs share the arrays, padded to the largest site; rules and slots
+# past the end of a site are empty and never confirm. Thresholds are an array of their own, so
+# a what-if (other thresholds, other rules) is a different evaluator over the same times.
+#
+# NumPy is optional: the runtime, replay and central service evaluate with SensePro_Engine and
+# do not need it; only this module does.
+#
+# The benchmark builds synthetic sites as SensePro_Benchmark does and feeds their presses one
+# per site per tick, checking the intrusions against SensePro_Engine site by site.
+#
+#   python3 SensePro_Batch.py --sites 20000 --devices 26 --rules 10 --events 50
+import sys
+import time
+import argparse
+import SensePro_Config
+import SensePro_Engine
+import SensePro_Benchmark
+
+try:
+    import numpy
+except ImportError:  # Only batch evaluation needs NumPy
+    numpy = None
+
+RULE_CODES = {'any': 1, 'all': 2, 'majority': 3, 'sequence': 4, 'one': 5}  # 0 is a padding rule
+
+
+class BatchEvaluator:
+    def __init__(self, configs):
+        if numpy is None:
+            raise RuntimeError("Batch evaluation needs NumPy; install numpy.")
+        self.configs = list(configs)
+        sites = len(self.configs)
+        slots = max((config.slot_count for config in self.configs), default=0)
+        rules = max((len(config.rules) for config in self.configs), default=0)
+        path = max((len(rule.cameras) + len(rule.detectors) for config in self.configs for rule in config.rules), default=1)
+
+        self.cameras = numpy.zeros((sites, rules, slots), numpy.float32)
+        self.detectors = numpy.zeros((sites, rules, slots), numpy.float32)
+        self.types = numpy.zeros((sites, rules), numpy.int8)
+        self.paths = numpy.full((sites, rules, path), slots, numpy.intp)  # Sequence order; slots is an idle padding slot
+        self.thresholds = numpy.array([config.time_threshold for config in self.configs], numpy.float64)
+        for site, config in enumerate(self.configs):
+            for index, rule in enumerate(config.rules):
+                self.types[site, index] = RULE_CODES[rule.type]
+                self.cameras[site, index, list(rule.cameras)] = 1
+                self.detectors[site, index, list(rule.detectors)] = 1
+                members = rule.cameras + rule.detectors
+                self.paths[site, index, :len(members)] = members
+        self.camera_totals = self.cameras.sum(axis=2)
+        self.detector_totals = self.detectors.sum(axis=2)
+        self.pairs = self.paths[:, :, 1:] < slots  # Consecutive sequence members to compare
+        self.times = numpy.full((sites, slots + 1), numpy.nan)  # Last column stays idle
+
+    def record(self, sites, slots, ts):
+        self.times[sites, slots] = ts
+
+    # Clear the windows of sites, as arming, disarming and reset do
+    def clear(self, sites):
+        self.times[sites] = numpy.nan
+
+    # Index of the first confirmed rule of each of sites at now (per site), -1 for none
+    def evaluate(self, now, sites=None):
+        if sites is None:
+            sites = numpy.arange(len(self.configs))
+        times = self.times[sites]
+        with numpy.errstate(invalid='ignore'):
+            recent = times[:, :-1] >= (now - self.thresholds[sites])[:, None]  # NaN is never recent
+        hits = recent.astype(numpy.float32)[:, :, None]
+        camera_hits = numpy.matmul(self.cameras[sites], hits)[:, :, 0]
+        detector_hits = numpy.matmul(self.detectors[sites], hits)[:, :, 0]
+        camera_totals, detector_totals = self.camera_totals[sites], self.detector_totals[sites]
+
+        types = self.types[sites]
+        every = (camera_hits == camera_totals) & (detector_hits == detector_totals)
+        confirmed = numpy.where(types == RULE_CODES['any'], (camera_hits > 0) & (detector_hits > 0), False)
+        confirmed |= (types == RULE_CODES['all']) & every
+        confirmed |= (types == RULE_CODES['one']) & (camera_hits + detector_hits > 0)
+        confirmed |= (types == RULE_CODES['majority']) & (2 * (camera_hits + detector_hits) > camera_totals + detector_totals)
+        sequences = (types == RULE_CODES['sequence']) & every
+        if sequences.any():
+            path_times = times[numpy.arange(len(sites))[:, None, None], self.paths[sites]]
+            ordered = (path_times[:, :, :-1] <= path_times[:, :, 1:]) | ~self.pairs[sites]
+            confirmed |= sequences & ordered.all(axis=2)
+
+        first = confirmed.argmax(axis=1)
+        return numpy.where(confirmed.any(axis=1), first, -1), recent
+
+    # Evaluate sites at now and consume the detectors of their intrusions; returns (sites, rules)
+    # of the intrusions
+    def step(self, now, sites=None):
+        if sites is None:
+            sites = numpy.arange(len(self.configs))
+        rules, recent = self.evaluate(now, sites)
+        fired = rules >= 0
+        sites, rules, recent = sites[fired], rules[fired], recent[fired]
+        consumed = (self.detectors[sites, rules] > 0) & recent
+        window = self.times[sites, :-1]
+        window[consumed] = numpy.nan
+        self.times[sites, :-1] = window
+        return sites, rules
+
+    # The SensePro_Engine.Intrusion for one site and rule, with its triggered devices at now
+    # (call before step() consumes them)
+    def intrusion(self, site, rule_index, now):
+        config = self.configs[site]
+        rule = config.rules[rule_index]
+        oldest = now - config.time_threshold
+        recent = [slot for slot in rule.cameras + rule.detectors if self.times[site, slot] >= oldest]
+        return SensePro_Engine.Intrusion(rule, [slot for slot in recent if slot in rule.cameras],
+                                         [slot for slot in recent if slot in rule.detectors])
+
+
+# Feed presses [[(ts, slot), ...] per site] through evaluator one press per site per tick, as
+# the runtime evaluates after every trigger; returns (intrusions per site [[rule index, ...]], ticks)
+def run_presses(evaluator, presses):
+    found = [[] for _ in presses]
+    ticks = max(map(len, presses), default=0)
+    for tick in range(ticks):
+        sites = numpy.array([site for site, site_presses in enumerate(presses) if tick < len(site_presses)], numpy.intp)
+        ts = numpy.array([presses[site][tick][0] for site in sites])
+        evaluator.record(sites, [presses[site][tick][1] for site in sites], ts)
+        for site, rule in zip(*evaluator.step(ts, sites)):
+            found[site].append(int(rule))
+    return found, ticks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch rule evaluation of many SensePro sites with NumPy.")
+    parser.add_argument("--sites", type=int, default=10000)
+    parser.add_argument("--devices", type=int, default=26, help="Devices per site")
+    parser.add_argument("--rules", type=int, default=10, help="Rules per site")
+    parser.add_argument("--events", type=int, default=50, help="Presses per site")
+    parser.add_argument("--templates", type=int, default=100, help="Distinct synthetic site configs the sites are drawn from")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-check", action="store_true", help="Skip the site by site comparison with SensePro_Engine")
+    args = parser.parse_args()
+
+    if numpy is None:
+        print("NumPy is not installed; install numpy to use batch evaluation.")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    templates = [SensePro_Config.compile_configuration(SensePro_Benchmark.synthetic_site(args.devices, args.rules, args.seed + number), None, None)
+                 for number in range(min(args.templates, args.sites))]
+    configs = [templates[site % len(templates)] for site in range(args.sites)]
+    presses = [SensePro_Benchmark.synthetic_presses(configs[site], args.events, args.seed + site) for site in range(args.sites)]
+    evaluator = BatchEvaluator(configs)
+    events = sum(map(len, presses))
+    print(f"{args.sites} sites of {args.devices} devices and {args.rules} rules, {events} presses; "
+          f"set up in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    found, ticks = run_presses(evaluator, presses)
+    elapsed = time.perf_counter() - started
+    intrusions = sum(map(len, found))
+    print(f"Batch: {ticks} ticks in {elapsed:.3f}s: {events / elapsed:,.0f} site evaluations/s, "
+          f"{elapsed / max(ticks, 1) * 1e3:.2f} ms/tick, {intrusions} intrusions")
+
+    if args.no_check:
+        return
+    started = time.perf_counter()
+    expected = []
+    for config, site_presses in zip(configs, presses):
+        state = SensePro_Engine.RuntimeState(config)
+        rule_indexes = {id(rule): index for index, rule in enumerate(config.rules)}
+        site_found = []
+        for ts, slot in site_presses:
+            intrusion = SensePro_Benchmark._evaluate(config, state, slot, ts)
+            if intrusion is not None:
+                site_found.append(rule_indexes[id(intrusion.rule)])
+        expected.append(site_found)
+    elapsed = time.perf_counter() - started
+    mismatched = sum(site_found != site_expected for site_found, site_expected in zip(found, expected))
+    print(f"Engine: {events / elapsed:,.0f} evaluations/s, {sum(map(len, expected))} intrusions; "
+          + (f"{mismatched} sites DIFFER" if mismatched else "every site matches"))
+    if mismatched:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
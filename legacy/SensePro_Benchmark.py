@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# SensePro_Benchmark.py - Rule evaluation benchmark across device and rule counts.
+#
+# Every case builds a synthetic site of N devices (half cameras, half detectors) and R rules
+# mixing 'any', 'all', 'sequence' and 'majority' over 2 to 8 devices each, generates traffic
+# for it with SensePro_Traffic (background noise, rule bursts and sequence walks), and feeds
+# the presses through what check_for_confirmed_intrusion does per trigger: record the trigger
+# time, find the confirmed rule, consume its detectors. It reports latency percentiles per
+# event, throughput, and the bytes allocated per event (a separate pass under tracemalloc, so
+# the timings are not affected).
+#
+# Results can be saved as a baseline; later runs are compared against it and a case whose p50
+# or p99 latency grew, or whose throughput fell, by more than the tolerance is flagged, and
+# the run exits with status 1.
+#
+#   python3 SensePro_Benchmark.py --save-baseline
+#   python3 SensePro_Benchmark.py --devices 8 26 256 --rules 1 100 --events 20000
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+import SensePro_Config
+import SensePro_Engine
+import SensePro_Sources
+import SensePro_Traffic
+
+DEVICE_COUNTS = (8, 26, 64, 256, 1024, 4096)
+RULE_COUNTS = (1, 10, 100, 1000)
+RULE_TYPES = ('any', 'all', 'sequence', 'majority')
+RULE_SIZES = (1, 4)  # Cameras, and detectors, per rule
+EVENTS = 20000
+ALLOCATION_EVENTS = 2000
+TOLERANCE = 0.25
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+# Raw config.json for a synthetic site of devices devices and rules rules
+def synthetic_site(devices, rules, seed=1):
+    randomizer = random.Random(seed)
+    camera_count = devices // 2
+    cameras = {f'Camera {number}': {'protocol': 'http', 'ip': f'10.{number // 250}.{number % 250}.1', 'pin': None}
+               for number in range(camera_count)}
+    detectors = {str(number): {'pin': number, 'name': f'Detector {number}', 'associated_cameras': []}
+                 for number in range(devices - camera_count)}
+    camera_ids, detector_ids = list(cameras), list(detectors)
+    rule_list = []
+    for number in range(rules):
+        rule_list.append({
+            'name': f'Rule {number}',
+            'type': RULE_TYPES[number % len(RULE_TYPES)],
+            'ipcctvs': randomizer.sample(camera_ids, min(randomizer.randint(*RULE_SIZES), len(camera_ids))),
+            'detectors': randomizer.sample(detector_ids, min(randomizer.randint(*RULE_SIZES), len(detector_ids))),
+        })
+    return {
+        'system_settings': {'arm_disarm_pin': 27, 'countdown_duration': 90, 'relay_output_pin': 26, 'reset_button_pin': 25},
+        'NVRs': {},
+        'ipcctv': cameras,
+        'detectors': detectors,
+        'time_threshold': 1,
+        'rules': rule_list,
+        'LED_Pattern': {},
+    }
+
+
+# About events presses of realistic traffic for config: a third each of noise, rule bursts and walks
+def synthetic_presses(config, events, seed=1):
+    hours = 1.0
+    generator = SensePro_Traffic.TrafficGenerator(config, hours * 3600, seed)
+    generator.noise(events / 3 / config.slot_count / hours)
+    sequences = sum(rule.type == 'sequence' for rule in config.rules)
+    others = len(config.rules) - sequences
+    mean_size = sum(RULE_SIZES)  # Devices in an average rule
+    if others:
+        generator.bursts(events / 3 / others / mean_size / hours, 20)
+    if sequences:
+        generator.walks(events / 3 / sequences / mean_size / hours, 20, 0.2)
+    slots = {device.key: device.slot for device in config.devices}
+    return [(ts, slots[key]) for ts, key, edge in generator.sorted_edges() if edge == SensePro_Sources.PRESS][:events]
+
+
+# One trigger as the runtime handles it: record it, evaluate, consume the detectors of an intrusion
+def _evaluate(config, state, slot, ts):
+    state.last_triggered[slot] = ts
+    intrusion = SensePro_Engine.find_confirmed_intrusion(config, state.last_triggered, ts)
+    if intrusion is not None:
+        SensePro_Engine.consume_detectors(state, intrusion)
+    return intrusion
+
+
+def run_case(devices, rules, events, seed=1):
+    config = SensePro_Config.compile_configuration(synthetic_site(devices, rules, seed), None, None)
+    presses = synthetic_presses(config, events, seed)
+
+    state = SensePro_Engine.RuntimeState(config)
+    clock = time.perf_counter_ns
+    latencies = []
+    intrusions = 0
+    started = clock()
+    for ts, slot in presses:
+        before = clock()
+        if _evaluate(config, state, slot, ts) is not None:
+            intrusions += 1
+        latencies.append(clock() - before)
+    elapsed = (clock() - started) / 1e9
+
+    state = SensePro_Engine.RuntimeState(config)
+    sample = presses[:ALLOCATION_EVENTS]
+    allocated = 0
+    tracemalloc.start()
+    for ts, slot in sample:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        _evaluate(config, state, slot, ts)
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    latencies.sort()
+    result = {'devices': config.slot_count, 'rules': len(config.rules), 'events': len(presses), 'intrusions': intrusions,
+              'events_per_second': round(len(presses) / elapsed) if elapsed > 0 else 0,
+              'max_us': round(latencies[-1] / 1000, 2) if latencies else 0.0,
+              'bytes_per_event': round(allocated / len(sample)) if sample else 0}
+    for percentile in PERCENTILES:
+        index = min(int(len(latencies) * percentile / 100), len(latencies) - 1)
+        result[f'p{percentile:g}_us'] = round(latencies[index] / 1000, 2) if latencies else 0.0
+    return result
+
+
+def case_name(result):
+    return f"{result['devices']}d/{result['rules']}r"
+
+
+# Regressions of result against its baseline, as text
+def regressions(result, baseline, tolerance):
+    found = []
+    for key in ('p50_us', 'p99_us'):
+        if baseline.get(key) and result[key] > baseline[key] * (1 + tolerance):
+            found.append(f"{key} {baseline[key]} -> {result[key]}")
+    if baseline.get('events_per_second') and result['events_per_second'] < baseline['events_per_second'] * (1 - tolerance):
+        found.append(f"events/s {baseline['events_per_second']} -> {result['events_per_second']}")
+    return found
+
+
+def main():
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="Benchmark SensePro rule evaluation across device and rule counts.")
+    parser.add_argument("--devices", type=int, nargs='+', default=DEVICE_COUNTS)
+    parser.add_argument("--rules", type=int, nargs='+', default=RULE_COUNTS)
+    parser.add_argument("--events", type=int, default=EVENTS, help="Presses per case")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", default=os.path.join(script_dir, 'logs', 'SensePro_benchmark_baseline.json'))
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed slowdown against the baseline, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file).get('cases', {})
+
+    columns = ['p50_us', 'p90_us', 'p99_us', 'p99.9_us', 'max_us']
+    print(f"{'case':>12} {'events/s':>10} " + ' '.join(f'{column:>9}' for column in columns) + f" {'B/event':>8} {'intrusions':>10}")
+    results, flagged = {}, 0
+    for devices in args.devices:
+        for rules in args.rules:
+            result = run_case(devices, rules, args.events, args.seed)
+            name = case_name(result)
+            results[name] = result
+            found = regressions(result, baseline[name], args.tolerance) if name in baseline and not args.save_baseline else []
+            flagged += bool(found)
+            print(f"{name:>12} {result['events_per_second']:>10,} " + ' '.join(f'{result[column]:>9}' for column in columns)
+                  + f" {result['bytes_per_event']:>8} {result['intrusions']:>10}" + (f"  REGRESSION: {', '.join(found)}" if found else ''))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'saved': time.time(),
+                       'events': args.events, 'cases': {**baseline, **results}}, baseline_file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif flagged:
+        print(f"{flagged} cases regressed by more than {args.tolerance:.0%} against {args.baseline}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
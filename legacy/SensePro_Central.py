@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+# SensePro_Central.py - Server-side rule evaluation for many sites, sharded across CPU cores.
+#
+# Controllers send their triggers, arm/disarm/reset and intrusions upstream as newline-delimited
+# JSON batches with a 'controller' header (SensePro_Remote.EventUplink). This service takes
+# those batches from the central-events queue (the server forwards them there unchanged; give
+# --queue controller-events when this service is that queue's only consumer) and evaluates
+# every site's rules itself, with the same semantics as check_for_confirmed_intrusion on the
+# controller: trigger windows per device, the first confirmed rule wins, an intrusion consumes
+# its detectors, and arming, disarming an armed site and reset clear the windows
+# (SensePro_Trace.Replay).
+# Evaluation runs on event time, so batching and queueing delays do not change the result.
+#
+# Sites are spread over a pool of worker processes by a stable hash of the site id, so every
+# batch of a site goes to the same process, in order. Each worker compiles the configs of its
+# own sites on first use (sites/<site id>.json: a config.json, or a server document translated
+# onto --base) and keeps their windows in memory; nothing is shared between workers, so
+# throughput grows with the number of cores. A changed config file is picked up within
+# RELOAD_SECONDS, keeping the windows of devices that are still there. A site whose config
+# cannot be used is skipped, and a batch that fails is logged and dropped; neither stops the
+# worker. A worker process that dies anyway is restarted within WATCH_SECONDS with an empty
+# backlog, and the windows of its sites start over.
+#
+# Intrusions are published to the central-intrusions queue as JSON lines {"ts", "site", "rule",
+# "devices"} (camera, then detector ids), with the site in the 'controller' header. They are
+# first appended to a local spool (SensePro_Spool, --spool) and published from there with
+# publisher confirms, so a broker outage delays them instead of losing them.
+#
+# A batch is acknowledged only once its worker has evaluated it and its intrusions are in the
+# spool; batches in flight when the connection drops are redelivered, and those lost with a
+# dead worker are returned to the queue. Each site remembers its last RECENT_BATCHES batches,
+# so a redelivered batch it has already evaluated is not fed twice.
+#
+#   python3 SensePro_Central.py --sites /srv/sensepro/sites --workers 8
+#
+# --benchmark generates that many synthetic sites with SensePro_Traffic traffic and feeds it
+# through 1, 2, 4, ... workers without RabbitMQ, reporting events per second for each and
+# checking that every worker count finds the same intrusions as a single in-process replay.
+#
+#   python3 SensePro_Central.py --benchmark 2000 --workers 1 2 4 8
+import os
+import re
+import sys
+import json
+import time
+import queue
+import zlib
+import signal
+import hashlib
+import itertools
+import logging
+import argparse
+import tempfile
+import threading
+import multiprocessing
+import SensePro_Config
+import SensePro_Remote
+import SensePro_Spool
+import SensePro_Sources
+import SensePro_Trace
+import SensePro_Benchmark
+
+pika = SensePro_Remote.pika  # None without RabbitMQ support; --benchmark still works
+
+CENTRAL_QUEUE = 'central-events'
+INTRUSIONS_QUEUE = 'central-intrusions'
+CENTRAL_PREFETCH_COUNT = 200  # Unacknowledged batches; below SHARD_BACKLOG, so the consumer never waits on a worker
+SHARD_BACKLOG = 1000  # Batches waiting per worker before dispatch blocks
+RELOAD_SECONDS = 10
+RECENT_BATCHES = 64  # Batches per site remembered to recognise a redelivery
+WATCH_SECONDS = 1  # How often worker processes are checked, and how long a dispatch waits before checking again
+SITE_ID = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]*')
+
+# Upstream event type -> the system input it stands for
+SYSTEM_EVENTS = {
+    'armed': (SensePro_Trace.ARMED_KEY, SensePro_Sources.PRESS),
+    'disarmed': (SensePro_Trace.ARM_KEY, SensePro_Sources.RELEASE),
+    'reset': (SensePro_Trace.RESET_KEY, SensePro_Sources.PRESS),
+}
+
+
+# Worker index of site_id; the same on every run and in every process
+def shard_of(site_id, workers):
+    return zlib.crc32(site_id.encode()) % workers
+
+
+class IntrusionSink:
+    # Keeps the intrusions of a Replay; the camera, relay, LED and NVR outputs stay on the controller
+    def __init__(self):
+        self.intrusions = []
+
+    def output(self, ts, output, target, action):
+        if output == 'intrusion':
+            self.intrusions.append((ts, target, action))
+
+
+class Site:
+    __slots__ = ('path', 'mtime', 'checked', 'replay', 'sink', 'recent', 'recent_order')
+
+    def __init__(self, path, mtime, config):
+        self.path = path
+        self.mtime = mtime
+        self.checked = time.monotonic()
+        self.sink = IntrusionSink()
+        self.replay = SensePro_Trace.Replay(config, self.sink)
+        self.recent = set()  # Digests of the last RECENT_BATCHES batches
+        self.recent_order = []
+
+    # Remember a batch; returns False if it was already seen
+    def remember(self, body):
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        if digest in self.recent:
+            return False
+        self.recent.add(digest)
+        self.recent_order.append(digest)
+        if len(self.recent_order) > RECENT_BATCHES:
+            self.recent.discard(self.recent_order.pop(0))
+        return True
+
+
+class Shard:
+    # The sites of one worker: their compiled configs and trigger windows
+    def __init__(self, index, sites_dir, base_path=None):
+        self.index = index
+        self.sites_dir = sites_dir
+        self.base_path = base_path
+        self.sites = {}  # Site id -> Site
+        self.missing_checked = {}  # Site id -> when its config was last looked for
+        self.events = 0
+        self.skipped = 0  # Events of sites without a config, and malformed lines
+        self.device_intrusions = 0  # Intrusions the controllers reported themselves
+        self.failed = 0  # Batches dropped because evaluating them raised
+        self.duplicates = 0  # Redelivered batches that had already been evaluated
+
+    def _compile(self, path):
+        with open(path, 'r') as site_file:
+            raw = json.load(site_file)
+        if 'devices' in raw and 'system_settings' not in raw:
+            if self.base_path is None:
+                raise ValueError("server document without --base site settings")
+            with open(self.base_path, 'r') as base_file:
+                return SensePro_Config.compile_configuration(SensePro_Remote.translate_server_config(raw, json.load(base_file)), None, None)
+        return SensePro_Config.load_configuration(path, None, None)
+
+    def _load(self, site_id):
+        now = time.monotonic()
+        if now - self.missing_checked.get(site_id, -RELOAD_SECONDS) < RELOAD_SECONDS:
+            return None
+        path = os.path.join(self.sites_dir, f'{site_id}.json')
+        try:
+            mtime = os.stat(path).st_mtime
+            site = Site(path, mtime, self._compile(path))
+        except Exception as e:  # Any malformed site file; other sites go on
+            logging.warning(f"Worker {self.index}: no usable config for site {site_id} ({e!r}); its events are skipped.")
+            self.missing_checked[site_id] = now
+            return None
+        self.missing_checked.pop(site_id, None)
+        self.sites[site_id] = site
+        return site
+
+    def _refresh(self, site_id, site):
+        now = time.monotonic()
+        if now - site.checked < RELOAD_SECONDS:
+            return
+        site.checked = now
+        try:
+            mtime = os.stat(site.path).st_mtime
+        except OSError as e:
+            logging.warning(f"Worker {self.index}: keeping the current config of site {site_id}; {e}.")
+            return
+        if mtime == site.mtime:
+            return
+        site.mtime = mtime  # A config that does not compile is tried again once it changes again
+        try:
+            site.replay.reconfigure(self._compile(site.path))
+            logging.info(f"Worker {self.index}: reloaded the config of site {site_id}.")
+        except Exception as e:
+            logging.warning(f"Worker {self.index}: keeping the current config of site {site_id}; reload failed ({e!r}).")
+
+    # Evaluate one uplink batch of site_id; returns its intrusions as dicts
+    def handle(self, site_id, body):
+        site = self.sites.get(site_id)
+        if site is None:
+            site = self._load(site_id)
+        else:
+            self._refresh(site_id, site)
+        lines = body.splitlines()
+        if site is None:
+            self.skipped += len(lines)
+            return []
+        if not site.remember(body):
+            self.duplicates += 1
+            return []
+
+        feed = site.replay.feed
+        for line in lines:
+            try:
+                event = json.loads(line)
+                event_type, ts = event['type'], float(event['ts'])
+                if event_type == 'trigger':
+                    feed(f"{event['kind']}:{event['device']}", event.get('edge', SensePro_Sources.PRESS), ts)
+                elif event_type in SYSTEM_EVENTS:
+                    feed(*SYSTEM_EVENTS[event_type], ts)
+                elif event_type == 'intrusion':
+                    self.device_intrusions += 1
+                    continue
+                else:
+                    continue
+            except (ValueError, KeyError, TypeError, AttributeError):
+                self.skipped += 1
+                continue
+            self.events += 1
+
+        found, site.sink.intrusions = site.sink.intrusions, []
+        return [{'ts': ts, 'site': site_id, 'rule': rule, 'devices': devices} for ts, rule, devices in found]
+
+    def stats(self):
+        return {'sites': len(self.sites), 'events': self.events, 'skipped': self.skipped,
+                'intrusions': sum(site.replay.intrusions for site in self.sites.values()),
+                'device_intrusions': self.device_intrusions, 'failed': self.failed, 'duplicates': self.duplicates}
+
+
+def _worker(index, sites_dir, base_path, inbox, outbox):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent shuts the workers down
+    shard = Shard(index, sites_dir, base_path)
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        sequence, site_id, body = item
+        try:
+            intrusions = shard.handle(site_id, body)
+        except Exception:
+            logging.exception(f"Worker {index}: a batch of site {site_id} failed; dropped.")
+            shard.failed += 1
+            intrusions = []
+        outbox.put(('done', index, sequence, site_id, intrusions))  # Every batch, so it can be acknowledged
+    outbox.put(('stats', index, shard.stats()))
+
+
+class CentralService:
+    # on_result(site_id, token, intrusions) is called for every dispatched batch once it has been
+    # evaluated, and on_lost([token, ...]) for the batches lost with a dead worker; both from
+    # background threads of this process. Tokens are the dispatcher's own and stay in this process.
+    def __init__(self, sites_dir, base_path, workers, on_result, on_lost=None):
+        self.sites_dir = sites_dir
+        self.base_path = base_path
+        self.workers = workers
+        self.on_result = on_result
+        self.on_lost = on_lost
+        self.sequence = itertools.count()
+        self.in_flight = [{} for _ in range(workers)]  # Per worker: sequence -> token of batches not yet evaluated
+        self.inboxes = [None] * workers
+        self.outbox = multiprocessing.Queue()
+        self.processes = [None] * workers
+        self.lock = threading.Lock()  # Held while a worker is (re)started
+        self.stopping = threading.Event()
+        self.restarts = 0
+        self.stats = {}  # Worker index -> its counters, once it has stopped
+        self.thread = None
+        self.watcher = None
+
+    def _collect(self):
+        while True:
+            message = self.outbox.get()
+            if message[0] == 'done':
+                _, index, sequence, site_id, intrusions = message
+                with self.lock:
+                    if sequence not in self.in_flight[index]:
+                        continue  # Already given up as lost with a dead worker
+                    token = self.in_flight[index].pop(sequence)
+                try:
+                    self.on_result(site_id, token, intrusions)
+                except Exception:
+                    logging.exception(f"Site {site_id}: handling the result of a batch failed.")
+            elif message[0] == 'stats':
+                self.stats[message[1]] = message[2]
+            else:  # 'stopped', after every worker has exited
+                return
+
+    # Start worker index on a new, empty inbox
+    def _start_worker(self, index):
+        inbox = multiprocessing.Queue(SHARD_BACKLOG)
+        process = multiprocessing.Process(target=_worker, args=(index, self.sites_dir, self.base_path, inbox, self.outbox),
+                                          name=f'SensePro-central-{index}', daemon=True)
+        process.start()
+        self.inboxes[index], self.processes[index] = inbox, process
+
+    # Restart worker index if its process has died; the batches it had not finished go to on_lost
+    def _check_worker(self, index):
+        with self.lock:
+            process = self.processes[index]
+            if process.is_alive() or self.stopping.is_set():
+                return
+            lost = list(self.in_flight[index].values())
+            self.in_flight[index].clear()
+            logging.error(f"Central worker {index} died (exit code {process.exitcode}); restarting it. "
+                          f"{len(lost)} unfinished batches are given back and the windows of its sites start over.")
+            self.inboxes[index].cancel_join_thread()  # Nobody will read what is left in it
+            self.inboxes[index].close()
+            self.restarts += 1
+            self._start_worker(index)
+        if lost and self.on_lost is not None:
+            self.on_lost(lost)
+
+    def _watch(self):
+        while not self.stopping.wait(WATCH_SECONDS):
+            for index in range(self.workers):
+                self._check_worker(index)
+
+    def start(self):
+        for index in range(self.workers):
+            self._start_worker(index)
+        self.thread = threading.Thread(target=self._collect, name='SensePro-central-results', daemon=True)
+        self.thread.start()
+        self.watcher = threading.Thread(target=self._watch, name='SensePro-central-watch', daemon=True)
+        self.watcher.start()
+
+    # Hand one uplink batch to its site's worker; token comes back with its result. Blocks while
+    # that worker is SHARD_BACKLOG behind, checking that it is still alive
+    def dispatch(self, site_id, body, token=None):
+        index = shard_of(site_id, self.workers)
+        sequence = next(self.sequence)
+        with self.lock:
+            self.in_flight[index][sequence] = token
+        while True:
+            try:
+                self.inboxes[index].put((sequence, site_id, body), timeout=WATCH_SECONDS)
+                return
+            except (queue.Full, ValueError):  # ValueError: the inbox of a worker that was just restarted
+                self._check_worker(index)
+                with self.lock:
+                    if sequence not in self.in_flight[index]:
+                        return  # Given to on_lost with the worker
+
+    # Let the workers finish what they were given; returns their counters summed
+    def stop(self):
+        self.stopping.set()
+        self.watcher.join()
+        for index, inbox in enumerate(self.inboxes):
+            if self.processes[index].is_alive():
+                inbox.put(None)
+        for process in self.processes:
+            process.join()
+        self.outbox.put(('stopped',))
+        self.thread.join()
+        totals = {}
+        for stats in self.stats.values():
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+class IntrusionUplink:
+    # Publishes the spooled intrusion batches (one record per site and evaluated batch) with
+    # publisher confirms, moving the spool's cursor once the broker has them
+    def __init__(self, spool, batch_size=SensePro_Remote.EVENT_BATCH):
+        self.spool = spool
+        self.batch_size = batch_size
+        self.thread = None
+
+    def _drain(self, connection, channel):
+        while True:
+            payloads, position = self.spool.read_batch(self.batch_size)
+            if not payloads:
+                self.spool.sync()
+                connection.process_data_events(time_limit=0)  # Heartbeats while idle
+                self.spool.wait(1.0)
+                continue
+            for body in payloads:
+                site_id = json.loads(body.split(b'\n', 1)[0])['site']
+                properties = pika.BasicProperties(content_type='application/x-ndjson', delivery_mode=2, headers={'controller': site_id})
+                # Raises (and the batch is sent again after reconnecting) unless the broker confirms it
+                channel.basic_publish(exchange='', routing_key=INTRUSIONS_QUEUE, body=body, properties=properties, mandatory=True)
+            self.spool.commit(position)
+
+    def _run(self):
+        outage_logged = False
+        while True:
+            try:
+                connection = pika.BlockingConnection(SensePro_Remote.connection_parameters())
+                try:
+                    channel = connection.channel()
+                    channel.queue_declare(queue=INTRUSIONS_QUEUE, durable=True)
+                    channel.confirm_delivery()
+                    backlog = self.spool.backlog_bytes()
+                    if backlog:
+                        logging.info(f"Sending {backlog / 1e3:.1f} kB of spooled intrusions to {INTRUSIONS_QUEUE}.")
+                    outage_logged = False
+                    self._drain(connection, channel)
+                finally:
+                    if connection.is_open:
+                        connection.close()
+            except Exception as e:
+                if not outage_logged:
+                    logging.warning(f"Intrusion uplink unavailable ({e}); intrusions are spooled until it is back.")
+                    outage_logged = True
+            time.sleep(SensePro_Remote.RECONNECT_SECONDS)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='SensePro-central-intrusions', daemon=True)
+        self.thread.start()
+        return self.thread
+
+
+class CentralConsumer:
+    def __init__(self, service, queue, spool):
+        self.service = service
+        self.queue = queue
+        self.spool = spool
+        self.connection = None
+        self.channel = None
+
+    # Runs on the service's results thread once a batch has been evaluated: its intrusions go to
+    # the spool, then the batch is acknowledged. pika channels belong to the consuming thread.
+    def on_result(self, site_id, token, intrusions):
+        if intrusions:
+            for intrusion in intrusions:
+                logging.info(f"Site {site_id}: intrusion by rule {intrusion['rule']} on {intrusion['devices']}.")
+            self.spool.append('\n'.join(json.dumps(intrusion, separators=(',', ':')) for intrusion in intrusions).encode())
+            self.spool.sync()  # On disk before the batch that produced them is acknowledged
+        self._settle(token, lambda channel, tag: channel.basic_ack(delivery_tag=tag))
+
+    # Batches lost with a dead worker go back to the queue to be evaluated again
+    def on_lost(self, tokens):
+        for token in tokens:
+            self._settle(token, lambda channel, tag: channel.basic_nack(delivery_tag=tag, requeue=True))
+
+    def _settle(self, token, settle):
+        channel, tag = token
+        connection = self.connection
+        # A batch from a channel that has since closed is redelivered by the broker instead
+        if channel is not self.channel or connection is None or not connection.is_open:
+            return
+        connection.add_callback_threadsafe(lambda: settle(channel, tag) if channel.is_open else None)
+
+    def _on_message(self, channel, method, properties, body):
+        site_id = str((properties.headers or {}).get('controller', ''))
+        if SITE_ID.fullmatch(site_id):
+            self.service.dispatch(site_id, body, (channel, method.delivery_tag))
+        else:
+            logging.error(f"Batch on {self.queue} without a valid controller header ({site_id!r}); dropped.")
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+
+    def _consume(self):
+        connection = pika.BlockingConnection(SensePro_Remote.connection_parameters())
+        try:
+            channel = connection.channel()
+            channel.queue_declare(queue=self.queue, durable=True)
+            channel.basic_qos(prefetch_count=CENTRAL_PREFETCH_COUNT)
+            channel.basic_consume(queue=self.queue, on_message_callback=self._on_message)
+            self.connection, self.channel = connection, channel
+            logging.info(f"Evaluating site events from {self.queue} on {self.service.workers} workers.")
+            channel.start_consuming()
+        finally:
+            self.connection = self.channel = None
+            if connection.is_open:
+                connection.close()
+
+    def run(self):
+        while True:
+            try:
+                self._consume()
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                logging.warning(f"RabbitMQ connection for {self.queue} lost ({e}); retrying in {SensePro_Remote.RECONNECT_SECONDS}s.")
+            time.sleep(SensePro_Remote.RECONNECT_SECONDS)
+
+
+# sites synthetic sites in sites_dir and their uplink batches [(site id, body)], interleaved
+# across sites as they would arrive; returns (batches, events, intrusions of an in-process replay)
+def benchmark_sites(sites_dir, sites, devices, rules, events, seed):
+    streams, total_events, expected = [], 0, 0
+    start = time.time()
+    for number in range(sites):
+        site_id = f'site-{number:05d}'
+        raw = SensePro_Benchmark.synthetic_site(devices, rules, seed + number)
+        with open(os.path.join(sites_dir, f'{site_id}.json'), 'w') as site_file:
+            json.dump(raw, site_file)
+        config = SensePro_Config.compile_configuration(raw, None, None)
+        presses = SensePro_Benchmark.synthetic_presses(config, events, seed + number)
+        lines = [json.dumps({'ts': start, 'type': 'armed'}, separators=(',', ':'))]
+        for ts, slot in presses:
+            kind, _, device_id = config.devices[slot].key.partition(':')
+            lines.append(json.dumps({'ts': round(start + ts, 6), 'type': 'trigger', 'device': device_id, 'kind': kind},
+                                    separators=(',', ':')))
+        replay = SensePro_Trace.Replay(config, IntrusionSink())
+        replay.feed(SensePro_Trace.ARMED_KEY, SensePro_Sources.PRESS, start)
+        for ts, slot in presses:
+            replay.feed(config.devices[slot].key, SensePro_Sources.PRESS, start + ts)
+        expected += replay.intrusions
+        total_events += len(lines)
+        batch = SensePro_Remote.EVENT_BATCH
+        streams.append([(site_id, '\n'.join(lines[index:index + batch]).encode()) for index in range(0, len(lines), batch)])
+
+    batches = []
+    for round_batches in zip(*[stream + [None] * (max(map(len, streams)) - len(stream)) for stream in streams]):
+        batches.extend(batch for batch in round_batches if batch is not None)
+    return batches, total_events, expected
+
+
+def run_benchmark(args):
+    with tempfile.TemporaryDirectory(prefix='SensePro-central-') as sites_dir:
+        started = time.perf_counter()
+        batches, events, expected = benchmark_sites(sites_dir, args.benchmark, args.devices, args.rules, args.events, args.seed)
+        print(f"{args.benchmark} sites of {args.devices} devices and {args.rules} rules: {events} events in "
+              f"{len(batches)} batches, {expected} intrusions in-process; generated in {time.perf_counter() - started:.1f}s")
+        print(f"{'workers':>8} {'events/s':>12} {'speed-up':>9} {'intrusions':>11}")
+        single = None
+        failed = False
+        for workers in args.workers:
+            found = []
+            service = CentralService(sites_dir, args.base, workers, lambda site_id, token, intrusions: found.extend(intrusions))
+            service.start()
+            started = time.perf_counter()
+            for site_id, body in batches:
+                service.dispatch(site_id, body)
+            totals = service.stop()
+            elapsed = time.perf_counter() - started
+            rate = totals.get('events', 0) / elapsed if elapsed > 0 else 0.0
+            single = single or rate
+            failed |= len(found) != expected
+            print(f"{workers:>8} {rate:>12,.0f} {rate / single:>8.2f}x {len(found):>11}"
+                  + ('' if len(found) == expected else f"  MISMATCH: expected {expected}"))
+        print(f"({os.cpu_count()} CPUs; each run includes compiling the site configs on first use)")
+        if failed:
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the rules of many SensePro sites centrally, sharded across CPU cores.")
+    parser.add_argument("--sites", help="Directory of site configs, <site id>.json")
+    parser.add_argument("--base", help="config.json whose site settings server documents are translated onto")
+    parser.add_argument("--workers", type=int, nargs='+', default=[os.cpu_count() or 1],
+                        help="Worker processes (several with --benchmark, to compare)")
+    parser.add_argument("--queue", default=CENTRAL_QUEUE, help="Queue of controller event batches")
+    parser.add_argument("--spool", help="Spool directory for intrusions waiting to be published (default: central-spool next to --sites)")
+    parser.add_argument("--benchmark", type=int, metavar="SITES", help="Benchmark this many synthetic sites instead of consuming")
+    parser.add_argument("--devices", type=int, default=26, help="Devices per benchmark site")
+    parser.add_argument("--rules", type=int, default=10, help="Rules per benchmark site")
+    parser.add_argument("--events", type=int, default=500, help="Presses per benchmark site")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.benchmark:
+        run_benchmark(args)
+        return
+
+    if pika is None:
+        print("pika is not installed; install it to consume from RabbitMQ, or use --benchmark.")
+        sys.exit(1)
+    if not args.sites or not os.path.isdir(args.sites):
+        print("--sites must name the directory of site configs.")
+        sys.exit(1)
+    spool = SensePro_Spool.Spool(args.spool or os.path.join(os.path.dirname(os.path.abspath(args.sites)), 'central-spool'))
+    consumer = None
+    service = CentralService(args.sites, args.base, args.workers[0],
+                             lambda site_id, token, intrusions: consumer.on_result(site_id, token, intrusions),
+                             lambda tokens: consumer.on_lost(tokens))
+    consumer = CentralConsumer(service, args.queue, spool)
+    IntrusionUplink(spool).start()
+    service.start()
+    try:
+        consumer.run()
+    except KeyboardInterrupt:
+        totals = service.stop()
+        logging.info(f"Stopped: {totals.get('events', 0)} events of {totals.get('sites', 0)} sites, "
+                     f"{totals.get('intrusions', 0)} intrusions ({totals.get('device_intrusions', 0)} reported by controllers), "
+                     f"{totals.get('failed', 0)} failed and {totals.get('duplicates', 0)} redelivered batches, {service.restarts} worker restarts.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+# SensePro_Config.py - Typed, immutable configuration model compiled once from config.json.
+#
+# compile_configuration() validates the raw json.load() dict and turns it into frozen,
+# slotted dataclasses with everything the hot path needs precomputed: request URLs, auth
+# objects and integer device slots. Cameras occupy slots 0..len(cameras)-1 and detectors
+# follow, so runtime state (see SensePro_Engine.RuntimeState) is a flat list indexed by slot
+# and never aliases the configuration.
+#
+# The compiled model is cached next to config.json as a versioned binary snapshot (marshal
+# of flat field tuples) keyed by the content hash of the file, so a normal start skips JSON
+# parsing, validation and cross-referencing, and only a changed config.json is compiled
+# again. Auth objects are not stored; they are rebuilt from the current credentials.
+#
+# Cameras, NVRs and LED devices take an optional "verify" for https, with the meaning of the
+# requests argument of the same name: true (the default) checks the device's certificate
+# against the system CAs, a path checks it against that CA bundle, and false accepts any
+# certificate, for devices with the self-signed certificate they ship with.
+import os
+import json
+import marshal
+import hashlib
+import logging
+from types import MappingProxyType
+from dataclasses import dataclass, fields
+
+try:
+    from requests.auth import HTTPDigestAuth, HTTPBasicAuth
+except ImportError:  # Offline tools (replay, benchmarks) do not need to talk to devices
+    HTTPDigestAuth = HTTPBasicAuth = None
+
+RULE_TYPES = ('any', 'all', 'sequence', 'majority', 'one')  # See Documentation/Rule-types-explained.txt
+SNAPSHOT_MAGIC = b'SPCS'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = '.snapshot'
+FUSION_WINDOW = 2.0
+LED_USER = "SensePro"
+LED_PASSWORD = "SensePro"
+
+
+class ConfigError(ValueError):
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+@dataclass(frozen=True, slots=True)
+class SystemSettings:
+    arm_disarm_pin: int
+    countdown_duration: int
+    relay_output_pin: int
+    reset_button_pin: int
+    fusion_window: float  # Seconds within which presses of one device from different sources are one event
+
+
+@dataclass(frozen=True, slots=True)
+class NvrAlarmState:
+    input: str
+    relay: str
+    url: str
+
+
+@dataclass(frozen=True, slots=True)
+class NVR:
+    id: str
+    ip: str
+    protocol: str
+    arm: NvrAlarmState
+    disarm: NvrAlarmState
+    verify: object  # requests' verify: True, False or a CA bundle path
+    auth: object
+
+
+@dataclass(frozen=True, slots=True)
+class Camera:
+    id: str
+    slot: int
+    key: str
+    name: str
+    ip: str
+    protocol: str
+    pin: object  # GPIO pin, or None when motion comes from an event stream
+    nvr: object  # NVR id whose event stream reports this camera, or None for the camera's own stream
+    channel: object  # NVR channel index (0 based), or None to find it by ChannelTitle
+    alarm_on_url: str
+    alarm_off_url: str
+    verify: object
+    auth: object
+
+
+@dataclass(frozen=True, slots=True)
+class Detector:
+    id: str
+    slot: int
+    key: str
+    name: str
+    pin: int
+    associated_cameras: tuple  # Camera slots
+
+
+@dataclass(frozen=True, slots=True)
+class Rule:
+    name: str
+    type: str
+    cameras: tuple  # Camera slots, in configured order
+    detectors: tuple  # Detector slots, in configured order
+    relay_duration: object  # Seconds, or None when the rule does not drive the relay
+
+
+@dataclass(frozen=True, slots=True)
+class LedPattern:
+    action: str
+    ip: str
+    protocol: str
+    url: str
+    verify: object
+    auth: object
+
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    settings: SystemSettings
+    time_threshold: float  # Seconds
+    nvrs: tuple
+    cameras: tuple
+    detectors: tuple
+    devices: tuple  # cameras + detectors, indexed by slot
+    rules: tuple
+    led_patterns: MappingProxyType  # action -> LedPattern
+    cameras_by_id: MappingProxyType
+    detectors_by_id: MappingProxyType
+
+    @property
+    def slot_count(self):
+        return len(self.devices)
+
+    @property
+    def slot_keys(self):
+        return tuple(device.key for device in self.devices)
+
+
+def camera_key(camera_id):
+    return f'camera:{camera_id}'
+
+
+def detector_key(detector_id):
+    return f'detector:{detector_id}'
+
+
+def _digest_auth(user, password):
+    return HTTPDigestAuth(user, password) if HTTPDigestAuth is not None else None
+
+
+def _basic_auth(user, password):
+    return HTTPBasicAuth(user, password) if HTTPBasicAuth is not None else None
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _valid_verify(value):
+    return isinstance(value, bool) or (isinstance(value, str) and value != '')
+
+
+def _as_pin(value):
+    # system_settings pins have historically been written as strings ("26")
+    return int(value) if isinstance(value, str) and value.isdigit() else value
+
+
+# Check a parsed config.json; returns a list of problems, empty when the config is usable
+def validate_configuration(raw):
+    errors = []
+    if not isinstance(raw, dict):
+        return ["top level is not an object"]
+    for key in ('system_settings', 'NVRs', 'ipcctv', 'detectors', 'time_threshold', 'rules', 'LED_Pattern'):
+        if key not in raw:
+            errors.append(f"missing section '{key}'")
+    if errors:
+        return errors
+
+    for key in ('arm_disarm_pin', 'countdown_duration', 'relay_output_pin', 'reset_button_pin'):
+        if not _is_int(_as_pin(raw['system_settings'].get(key))):
+            errors.append(f"system_settings.{key} is missing or not a number")
+    fusion_window = raw['system_settings'].get('fusion_window', FUSION_WINDOW)
+    if not isinstance(fusion_window, (int, float)) or isinstance(fusion_window, bool) or fusion_window < 0:
+        errors.append(f"invalid system_settings.fusion_window {fusion_window!r}")
+
+    pins = {}
+    for section in ('ipcctv', 'detectors'):
+        for device_id, device_info in raw[section].items():
+            pin = device_info.get('pin')
+            if pin is None and section == 'ipcctv':
+                pass  # Motion comes from the camera's eventManager stream (SensePro_Streams)
+            elif not _is_int(pin):
+                errors.append(f"{section} '{device_id}' has invalid pin {pin!r}")
+            elif pin in pins:
+                errors.append(f"{section} '{device_id}' reuses pin {pin} of {pins[pin]}")
+            else:
+                pins[pin] = device_id
+            if section == 'ipcctv' and not device_info.get('ip'):
+                errors.append(f"camera '{device_id}' has no ip")
+    for camera_id, camera_info in raw['ipcctv'].items():
+        nvr_id = camera_info.get('nvr')
+        if nvr_id is not None and nvr_id not in raw['NVRs']:
+            errors.append(f"camera '{camera_id}' references unknown NVR '{nvr_id}'")
+        elif nvr_id is not None and camera_info.get('pin') is not None:
+            errors.append(f"camera '{camera_id}' has both a pin and an NVR event stream")
+        channel = camera_info.get('channel')
+        if channel is not None and (not _is_int(channel) or channel < 0):
+            errors.append(f"camera '{camera_id}' has invalid channel {channel!r}")
+        if not _valid_verify(camera_info.get('verify', True)):
+            errors.append(f"camera '{camera_id}' has invalid verify {camera_info['verify']!r}")
+    for detector_id, detector_info in raw['detectors'].items():
+        for camera_name in detector_info.get('associated_cameras', []):
+            if camera_name not in raw['ipcctv']:
+                errors.append(f"detector '{detector_id}' references unknown camera '{camera_name}'")
+
+    threshold = raw['time_threshold']
+    if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or threshold <= 0:
+        errors.append(f"invalid time_threshold {threshold!r}")
+
+    for index, rule in enumerate(raw['rules']):
+        if not isinstance(rule, dict):
+            errors.append(f"rule #{index} is not an object: {rule!r}")
+            continue
+        name = rule.get('name', f'#{index}')
+        if rule.get('type') not in RULE_TYPES:
+            errors.append(f"rule '{name}' has unsupported type {rule.get('type')!r}")
+        for camera_name in rule.get('ipcctvs', []):
+            if camera_name not in raw['ipcctv']:
+                errors.append(f"rule '{name}' references unknown camera '{camera_name}'")
+        for detector in rule.get('detectors', []):
+            if str(detector) not in raw['detectors']:
+                errors.append(f"rule '{name}' references unknown detector {detector}")
+
+    for nvr_id, nvr_info in raw['NVRs'].items():
+        for key in ('ip', 'protocol', 'arm', 'disarm'):
+            if key not in nvr_info:
+                errors.append(f"NVR '{nvr_id}' is missing '{key}'")
+        for mode in ('arm', 'disarm'):
+            if mode in nvr_info and not {'input', 'relay'} <= set(nvr_info[mode]):
+                errors.append(f"NVR '{nvr_id}' {mode} needs 'input' and 'relay'")
+        if not _valid_verify(nvr_info.get('verify', True)):
+            errors.append(f"NVR '{nvr_id}' has invalid verify {nvr_info['verify']!r}")
+
+    for action, pattern in raw['LED_Pattern'].items():
+        if 'ip' not in pattern:
+            errors.append(f"LED pattern '{action}' has no ip")
+        if not _valid_verify(pattern.get('verify', True)):
+            errors.append(f"LED pattern '{action}' has invalid verify {pattern['verify']!r}")
+    return errors
+
+
+def _nvr_alarm_state(protocol, ip, mode_info):
+    url = f"{protocol}://{ip}/cgi-bin/configManager.cgi?action=setConfig&{mode_info['input']}={mode_info['relay']}"
+    return NvrAlarmState(mode_info['input'], mode_info['relay'], url)
+
+
+def _camera_alarm_url(protocol, ip, sensor_state, relay_channel=0):
+    return f"{protocol}://{ip}/cgi-bin/configManager.cgi?action=setConfig&Alarm[{relay_channel}].SensorType={sensor_state}"
+
+
+# Validate and compile a raw config.json dict; raises ConfigError listing every problem
+def compile_configuration(raw, user, password):
+    errors = validate_configuration(raw)
+    if errors:
+        raise ConfigError(errors)
+
+    settings_raw = raw['system_settings']
+    settings = SystemSettings(
+        arm_disarm_pin=_as_pin(settings_raw['arm_disarm_pin']),
+        countdown_duration=int(settings_raw['countdown_duration']),
+        relay_output_pin=_as_pin(settings_raw['relay_output_pin']),
+        reset_button_pin=_as_pin(settings_raw['reset_button_pin']),
+        fusion_window=float(settings_raw.get('fusion_window', FUSION_WINDOW)),
+    )
+
+    nvrs = tuple(
+        NVR(
+            id=nvr_id,
+            ip=nvr_info['ip'],
+            protocol=nvr_info.get('protocol', 'http'),
+            arm=_nvr_alarm_state(nvr_info.get('protocol', 'http'), nvr_info['ip'], nvr_info['arm']),
+            disarm=_nvr_alarm_state(nvr_info.get('protocol', 'http'), nvr_info['ip'], nvr_info['disarm']),
+            verify=nvr_info.get('verify', True),
+            auth=_digest_auth(user, password),
+        )
+        for nvr_id, nvr_info in raw['NVRs'].items()
+    )
+
+    cameras = []
+    for slot, (camera_id, camera_info) in enumerate(raw['ipcctv'].items()):
+        protocol = camera_info.get('protocol', 'http')
+        cameras.append(Camera(
+            id=camera_id,
+            slot=slot,
+            key=camera_key(camera_id),
+            name=camera_info.get('name', camera_id),
+            ip=camera_info['ip'],
+            protocol=protocol,
+            pin=camera_info.get('pin'),
+            nvr=camera_info.get('nvr'),
+            channel=camera_info.get('channel'),
+            alarm_on_url=_camera_alarm_url(protocol, camera_info['ip'], "NO"),
+            alarm_off_url=_camera_alarm_url(protocol, camera_info['ip'], "NC"),
+            verify=camera_info.get('verify', True),
+            auth=_digest_auth(user, password),
+        ))
+    camera_slots = {camera.id: camera.slot for camera in cameras}
+
+    detectors = []
+    for offset, (detector_id, detector_info) in enumerate(raw['detectors'].items()):
+        detectors.append(Detector(
+            id=str(detector_id),
+            slot=len(cameras) + offset,
+            key=detector_key(detector_id),
+            name=detector_info.get('name', str(detector_id)),
+            pin=detector_info['pin'],
+            associated_cameras=tuple(camera_slots[name] for name in detector_info.get('associated_cameras', [])),
+        ))
+    detector_slots = {detector.id: detector.slot for detector in detectors}
+
+    rules = tuple(
+        Rule(
+            name=rule.get('name', f'Rule {index + 1}'),
+            type=rule['type'],
+            cameras=tuple(camera_slots[name] for name in rule.get('ipcctvs', [])),
+            detectors=tuple(detector_slots[str(detector)] for detector in rule.get('detectors', [])),
+            relay_duration=rule.get('relay_duration'),
+        )
+        for index, rule in enumerate(raw['rules'])
+    )
+    for rule in rules:
+        if rule.type == 'any' and not (rule.cameras and rule.detectors):
+            logging.warning(f"Rule {rule.name} is 'any', which needs a camera and a detector, but lists "
+                            f"{'no cameras' if not rule.cameras else 'no detectors'}; it can never confirm. "
+                            f"Use 'one' for any single listed device.")
+
+    led_patterns = {
+        action: LedPattern(
+            action=action,
+            ip=pattern['ip'],
+            protocol=pattern.get('protocol', 'http'),
+            url=f"{pattern.get('protocol', 'http')}://{pattern['ip']}/{action}",
+            verify=pattern.get('verify', True),
+            auth=_basic_auth(LED_USER, LED_PASSWORD),
+        )
+        for action, pattern in raw['LED_Pattern'].items()
+    }
+
+    return _assemble(settings, float(raw['time_threshold']) * 60, nvrs, tuple(cameras), tuple(detectors), rules, led_patterns)
+
+
+# Build the Config and its lookup indexes from compiled parts
+def _assemble(settings, time_threshold, nvrs, cameras, detectors, rules, led_patterns):
+    return Config(
+        settings=settings,
+        time_threshold=time_threshold,
+        nvrs=nvrs,
+        cameras=cameras,
+        detectors=detectors,
+        devices=cameras + detectors,
+        rules=rules,
+        led_patterns=MappingProxyType(dict(led_patterns)),
+        cameras_by_id=MappingProxyType({camera.id: camera for camera in cameras}),
+        detectors_by_id=MappingProxyType({detector.id: detector for detector in detectors}),
+    )
+
+
+def _model_fingerprint():
+    # Any change to the dataclass fields invalidates existing snapshots without a version bump
+    classes = (SystemSettings, NvrAlarmState, NVR, Camera, Detector, Rule, LedPattern, Config)
+    return repr([(cls.__name__, [field.name for field in fields(cls)]) for cls in classes]).encode()
+
+
+def snapshot_key(source):
+    digest = hashlib.sha256()
+    for part in (str(SNAPSHOT_VERSION).encode(), _model_fingerprint(), source):
+        digest.update(hashlib.sha256(part).digest())
+    return digest.digest()
+
+
+def _values(item):
+    return tuple(getattr(item, field.name) for field in fields(item) if field.name != 'auth')
+
+
+def _snapshot_payload(config):
+    return (
+        _values(config.settings),
+        config.time_threshold,
+        [(nvr.id, nvr.ip, nvr.protocol, _values(nvr.arm), _values(nvr.disarm), nvr.verify) for nvr in config.nvrs],
+        [_values(camera) for camera in config.cameras],
+        [_values(detector) for detector in config.detectors],
+        [_values(rule) for rule in config.rules],
+        [_values(pattern) for pattern in config.led_patterns.values()],
+    )
+
+
+def _from_snapshot_payload(payload, user, password):
+    settings, time_threshold, nvrs, cameras, detectors, rules, led_patterns = payload
+    led_auth = _basic_auth(LED_USER, LED_PASSWORD)
+    return _assemble(
+        SystemSettings(*settings),
+        time_threshold,
+        tuple(NVR(nvr_id, ip, protocol, NvrAlarmState(*arm), NvrAlarmState(*disarm), verify, _digest_auth(user, password))
+              for nvr_id, ip, protocol, arm, disarm, verify in nvrs),
+        tuple(Camera(*values, auth=_digest_auth(user, password)) for values in cameras),
+        tuple(Detector(*values) for values in detectors),
+        tuple(Rule(*values) for values in rules),
+        {values[0]: LedPattern(*values, auth=led_auth) for values in led_patterns},
+    )
+
+
+def _read_snapshot(snapshot_path, key, user, password):
+    try:
+        with open(snapshot_path, 'rb') as snapshot_file:
+            data = snapshot_file.read()
+    except OSError:
+        return None
+    header_size = len(SNAPSHOT_MAGIC) + len(key)
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC or data[len(SNAPSHOT_MAGIC):header_size] != key:
+        return None
+    try:
+        return _from_snapshot_payload(marshal.loads(data[header_size:]), user, password)
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable config snapshot {snapshot_path}: {e}")
+        return None
+
+
+def _write_snapshot(snapshot_path, key, config):
+    temporary_path = f'{snapshot_path}.tmp'
+    try:
+        with open(temporary_path, 'wb') as snapshot_file:
+            snapshot_file.write(SNAPSHOT_MAGIC + key + marshal.dumps(_snapshot_payload(config)))
+        os.replace(temporary_path, snapshot_path)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not write config snapshot {snapshot_path}: {e}")
+
+
+# Load config.json through its snapshot, compiling and re-snapshotting only when the file changed.
+# Raises OSError, ValueError or ConfigError.
+def load_configuration(path, user, password, use_snapshot=True):
+    with open(path, 'rb') as config_file:
+        source = config_file.read()
+
+    snapshot_path = path + SNAPSHOT_SUFFIX
+    key = snapshot_key(source)
+    if use_snapshot:
+        config = _read_snapshot(snapshot_path, key, user, password)
+        if config is not None:
+            return config
+
+    config = compile_configuration(json.loads(source), user, password)
+    if use_snapshot:
+        _write_snapshot(snapshot_path, key, config)
+    return config
+
+
+# Write a raw config (already compiled to config) to path atomically, with a matching snapshot
+def save_configuration(path, raw, config):
+    source = json.dumps(raw, indent=2).encode()
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'wb') as config_file:
+        config_file.write(source)
+    _write_snapshot(path + SNAPSHOT_SUFFIX, snapshot_key(source), config)
+    os.replace(temporary_path, path)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# SensePro_Engine.py - Runtime state and rule evaluation over a compiled SensePro_Config.Config.
+#
+# Evaluation has no side effects: it reports which rule fired and which devices it fired on,
+# and the caller (SensePro.py) sends the alarms, drives the relay and LEDs, and clears the
+# detectors.
+
+
+class RuntimeState:
+    __slots__ = ('last_triggered',)
+
+    def __init__(self, config):
+        self.last_triggered = [None] * config.slot_count  # Epoch seconds by slot, None when idle
+
+    # Trigger times of devices that exist in both configs, for a reload
+    def carry_over(self, old_config, new_config):
+        state = RuntimeState(new_config)
+        old_slots = {device.key: device.slot for device in old_config.devices}
+        for device in new_config.devices:
+            old_slot = old_slots.get(device.key)
+            if old_slot is not None:
+                state.last_triggered[device.slot] = self.last_triggered[old_slot]
+        return state
+
+
+class Intrusion:
+    __slots__ = ('rule', 'cameras', 'detectors')
+
+    def __init__(self, rule, cameras, detectors):
+        self.rule = rule
+        self.cameras = cameras  # Triggered camera slots of the rule
+        self.detectors = detectors  # Triggered detector slots of the rule
+
+
+# First rule, in configured order, confirmed by the devices triggered within the time threshold
+def find_confirmed_intrusion(config, last_triggered, now):
+    oldest = now - config.time_threshold
+    recent = [ts is not None and ts >= oldest for ts in last_triggered]
+
+    for rule in config.rules:
+        cameras = [slot for slot in rule.cameras if recent[slot]]
+        detectors = [slot for slot in rule.detectors if recent[slot]]
+
+        if rule.type == "any":
+            if cameras and detectors:
+                return Intrusion(rule, cameras, detectors)
+        elif rule.type == "all":
+            if len(cameras) == len(rule.cameras) and len(detectors) == len(rule.detectors):
+                return Intrusion(rule, cameras, detectors)
+        elif rule.type == "one":
+            if cameras or detectors:
+                return Intrusion(rule, cameras, detectors)
+        elif rule.type == "majority":
+            if 2 * (len(cameras) + len(detectors)) > len(rule.cameras) + len(rule.detectors):
+                return Intrusion(rule, cameras, detectors)
+        elif rule.type == "sequence":
+            # Every device, in the listed order: the cameras, then the detectors
+            if len(cameras) == len(rule.cameras) and len(detectors) == len(rule.detectors):
+                times = [last_triggered[slot] for slot in rule.cameras + rule.detectors]
+                if all(earlier <= later for earlier, later in zip(times, times[1:])):
+                    return Intrusion(rule, cameras, detectors)
+    return None
+
+
+# Clear the detectors of an intrusion: they are consumed by it; cameras stay in their window
+def consume_detectors(state, intrusion):
+    for slot in intrusion.detectors:
+        state.last_triggered[slot] = None
+
+
+# Cameras to alarm for an intrusion: the triggered cameras, then each triggered detector's associated cameras
+def cameras_to_alarm(config, intrusion):
+    slots = list(intrusion.cameras)
+    for detector_slot in intrusion.detectors:
+        slots.extend(config.devices[detector_slot].associated_cameras)
+    return [config.devices[slot] for slot in slots]
+
+
+# Outputs of an intrusion in the order they are driven: ('camera', camera) for each camera to
+# alarm, ('relay', seconds) when the rule drives the relay, then ('led', 'intrusion')
+def intrusion_outputs(config, intrusion):
+    outputs = [('camera', camera) for camera in cameras_to_alarm(config, intrusion)]
+    if intrusion.rule.relay_duration is not None:
+        outputs.append(('relay', intrusion.rule.relay_duration))
+    outputs.append(('led', 'intrusion'))
+    return outputs
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+# SensePro_Harness.py - End-to-end latency harness: the real SensePro.py against mock hardware.
+#
+# SensePro.py runs in this process, unmodified, from a scratch directory holding a generated
+# config.json and SensePro_env.env. Its GPIO goes to gpiozero's MockFactory, so edges are
+# injected by driving mock pins, and every camera, NVR and the LED device is a local mock
+# Dahua HTTP server answering configManager.cgi and the LED actions. Each server can be given
+# a response latency, digest or basic auth, a failure rate (HTTP 500) or a hang. Nothing
+# leaves 127.0.0.1 and no hardware is needed.
+#
+# It measures:
+#   arm / disarm    arm switch edge to the last NVR having acknowledged its new alarm state
+#   edge to alarm   the detector press completing a rule to the camera's alarm request
+#   head of line    the same arm with the first NVR slow (or hung): how long the second NVR
+#                   waits behind it
+#
+#   python3 SensePro_Harness.py
+#   python3 SensePro_Harness.py --rounds 50 --slow-nvr-latency 8 --camera-failure-rate 0.1
+#   python3 SensePro_Harness.py --hang-nvr
+#
+# Soak mode drives hours of SensePro_Traffic traffic (noise, rule bursts, a flapping input)
+# through the mock pins at an accelerated pace, with an arm, disarm and reset cycle every
+# half hour of traffic, and samples RSS, threads, open file descriptors, log handlers, the
+# tracemalloc total, the engine queue and the output lanes with work. After a warm-up, a metric whose last third of samples sits above its
+# first third by more than its allowance is reported as growing, with the tracemalloc lines
+# that grew most, and the run fails.
+#
+#   python3 SensePro_Harness.py --soak 24 --speed 120
+import os
+import sys
+import json
+import time
+import base64
+import random
+import shutil
+import _thread
+import argparse
+import tempfile
+import threading
+import runpy
+import logging
+import statistics
+import tracemalloc
+import http.server
+import gpiozero
+from gpiozero.pins.mock import MockFactory
+import SensePro_Config
+import SensePro_Streams
+import SensePro_Traffic
+
+USER = 'harness'
+PASSWORD = 'harness'
+REALM = 'Login to harness'
+ARM_PIN = 27
+CAMERA_PINS = (5, 6)
+DETECTOR_PINS = (13, 19)
+READY_TIMEOUT = 30
+WAIT_TIMEOUT = 60
+WARM_UP = 0.2  # Share of the soak samples left out of the growth check
+# Growth allowed from the first to the last third of a soak: (share of the first, at least)
+GROWTH_ALLOWANCES = {'rss_kb': (0.10, 4096), 'traced_kb': (0.10, 1024), 'threads': (0.0, 3), 'fds': (0.0, 3), 'log_handlers': (0.0, 0),
+                     'queued_events': (0.0, 100), 'busy_output_lanes': (0.0, 4)}
+
+
+class MockDahua:
+    # latency: seconds before answering; failure_rate: share of requests answered 500;
+    # hang: accept requests and never answer; auth: 'digest', 'basic' or None
+    def __init__(self, name, latency=0.0, failure_rate=0.0, hang=False, auth='digest', user=USER, password=PASSWORD, seed=1):
+        self.name = name
+        self.user = user
+        self.password = password
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.hang = hang
+        self.auth = auth
+        self.random = random.Random(seed)
+        self.requests = []  # (arrival, answered, path, status), monotonic seconds
+        self.condition = threading.Condition()
+        self.nonce = os.urandom(8).hex()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.address = f'127.0.0.1:{self.port}'
+
+    def _authorized(self, handler):
+        header = handler.headers.get('Authorization', '')
+        if self.auth is None:
+            return True
+        if self.auth == 'basic':
+            return header == 'Basic ' + base64.b64encode(f'{self.user}:{self.password}'.encode()).decode()
+        if not header.lower().startswith('digest '):
+            return False
+        try:
+            fields = SensePro_Streams.parse_challenge(header)
+            challenge = {'realm': REALM, 'nonce': self.nonce, 'qop': fields.get('qop', ''), 'algorithm': fields.get('algorithm', 'MD5')}
+            expected = SensePro_Streams.parse_challenge(SensePro_Streams.digest_authorization(
+                self.user, self.password, handler.command, fields['uri'], challenge, int(fields.get('nc', '0'), 16), fields.get('cnonce')))
+        except (SensePro_Streams.StreamError, KeyError, ValueError):
+            return False
+        return fields.get('nonce') == self.nonce and fields.get('response') == expected['response']
+
+    def _handler(self):
+        mock = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                arrival = time.monotonic()
+                if not mock._authorized(self):
+                    self.send_response(401)
+                    if mock.auth == 'basic':
+                        self.send_header('WWW-Authenticate', f'Basic realm="{REALM}"')
+                    else:
+                        self.send_header('WWW-Authenticate', f'Digest realm="{REALM}", qop="auth", nonce="{mock.nonce}", opaque="0"')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if mock.hang:
+                    mock._record(arrival, None, self.path, None)
+                    time.sleep(24 * 3600)
+                    return
+                if mock.latency:
+                    time.sleep(mock.latency)
+                status = 500 if mock.random.random() < mock.failure_rate else 200
+                body = b'OK\r\n' if status == 200 else b'Error\r\n'
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                mock._record(arrival, time.monotonic(), self.path, status)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _record(self, arrival, answered, path, status):
+        with self.condition:
+            self.requests.append((arrival, answered, path, status))
+            self.condition.notify_all()
+
+    # Forget the requests so far, so a soak does not count its own log as growth
+    def clear(self):
+        with self.condition:
+            self.requests.clear()
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name=f'harness-{self.name}', daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    # The first request after index whose path contains text, once answered (or arrived, when
+    # answered is False); None after timeout
+    def wait_for(self, text, index=0, answered=True, timeout=WAIT_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                for request in self.requests[index:]:
+                    if text in request[2] and (request[3] == 200 or not answered):
+                        return request
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+
+# config.json for two cameras, two detectors, one 'any' rule over them and two NVRs
+def harness_site(cameras, nvrs, led, countdown):
+    return {
+        'system_settings': {'arm_disarm_pin': ARM_PIN, 'countdown_duration': countdown, 'relay_output_pin': 26, 'reset_button_pin': 25},
+        'NVRs': {nvr.name: {'ip': nvr.address, 'protocol': 'http',
+                            'arm': {'input': 'Alarm[0].SensorType', 'relay': 'NO'},
+                            'disarm': {'input': 'Alarm[0].SensorType', 'relay': 'NC'}} for nvr in nvrs},
+        'ipcctv': {f'Camera {number + 1}': {'protocol': 'http', 'ip': cameras.address, 'pin': pin, 'name': f'Camera {number + 1}'}
+                   for number, pin in enumerate(CAMERA_PINS)},
+        'detectors': {str(number + 1): {'pin': pin, 'name': f'Detector {number + 1}', 'associated_cameras': []}
+                      for number, pin in enumerate(DETECTOR_PINS)},
+        'time_threshold': 1,
+        'rules': [{'name': 'Harness', 'type': 'any', 'ipcctvs': ['Camera 1', 'Camera 2'], 'detectors': ['1', '2']}],
+        'LED_Pattern': {action: {'ip': led.address, 'protocol': 'http'} for action in ('armed', 'arming', 'disarm', 'intrusion', 'idle')},
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else None
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+# Process resources now; Linux /proc, as on the controllers
+def resource_sample():
+    with open('/proc/self/statm', 'r') as statm:
+        rss_pages = int(statm.read().split()[1])
+    return {
+        'rss_kb': rss_pages * os.sysconf('SC_PAGE_SIZE') // 1024,
+        'traced_kb': tracemalloc.get_traced_memory()[0] // 1024,
+        'threads': threading.active_count(),
+        'fds': len(os.listdir('/proc/self/fd')),
+        'log_handlers': len(logging.getLogger().handlers),
+    }
+
+
+# Metrics of samples that grew by more than their allowance: {metric: (first, last)}
+def growing_metrics(samples):
+    checked = samples[int(len(samples) * WARM_UP):]
+    third = len(checked) // 3
+    if third < 2:
+        return {}
+    growing = {}
+    for metric, (share, minimum) in GROWTH_ALLOWANCES.items():
+        first = statistics.median(sample[metric] for sample in checked[:third])
+        last = statistics.median(sample[metric] for sample in checked[-third:])
+        if last - first > max(first * share, minimum):
+            growing[metric] = (first, last)
+    return growing
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.cameras = MockDahua('cameras', args.camera_latency, args.camera_failure_rate)
+        self.nvrs = [MockDahua('NVR A', args.nvr_latency), MockDahua('NVR B', args.nvr_latency)]
+        self.led = MockDahua('LED', auth='basic', user=SensePro_Config.LED_USER, password=SensePro_Config.LED_PASSWORD)
+        self.results = {}
+        self.runtime = None
+
+    def _pin(self, number):
+        return gpiozero.Device.pin_factory.pin(number)
+
+    # Arm (press) or disarm (release) with the switch; seconds until each NVR acknowledged, or None
+    def _switch(self, arm):
+        relay = 'NO' if arm else 'NC'
+        marks = [len(nvr.requests) for nvr in self.nvrs]
+        started = time.monotonic()
+        # Mock pins call back in the thread that drives them; the arm switch callbacks run the
+        # countdown and the NVR requests, so they get a thread of their own as on a Pi
+        pin = self._pin(ARM_PIN)
+        threading.Thread(target=pin.drive_low if arm else pin.drive_high, daemon=True).start()
+        timeout = self.args.countdown + WAIT_TIMEOUT
+        done = []
+        for nvr, mark in zip(self.nvrs, marks):
+            request = nvr.wait_for(f'SensorType={relay}', mark, timeout=max(timeout - (time.monotonic() - started), 0))
+            done.append(None if request is None else request[1] - started)
+        return done
+
+    def _alarm_round(self):
+        camera_mark = len(self.cameras.requests)
+        camera, detector = self._pin(CAMERA_PINS[0]), self._pin(DETECTOR_PINS[0])
+        camera.drive_low()
+        camera.drive_high()
+        started = time.monotonic()
+        detector.drive_low()
+        detector.drive_high()
+        request = self.cameras.wait_for('SensorType=NO', camera_mark, answered=False, timeout=10)
+        # The camera's output lane coalesces alarms while its pulse runs; let it finish
+        self.cameras.wait_for('SensorType=NC', camera_mark, timeout=10)
+        return None if request is None else request[0] - started
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            runtime = sys.modules['__main__'].__dict__
+            if 'run_remote_command' in runtime and self.led.wait_for('/idle', timeout=0.1, answered=False):
+                self.runtime = runtime
+                return True
+        return False
+
+    def scenario(self):
+        try:
+            if not self._wait_ready():
+                self.results['error'] = "SensePro.py did not start"
+                return
+            arm = self._switch(True)
+            self.results['arm_ms'] = [_ms(seconds) for seconds in arm]
+            latencies = []
+            for _ in range(self.args.rounds):
+                latency = self._alarm_round()
+                if latency is not None:
+                    latencies.append(latency)
+                time.sleep(self.args.interval)
+            self.results['alarms'] = f"{len(latencies)}/{self.args.rounds}"
+            self.results['edge_to_alarm_ms'] = {name: _ms(percentile(latencies, fraction))
+                                                for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))}
+            self.results['disarm_ms'] = [_ms(seconds) for seconds in self._switch(False)]
+
+            # Head of line: the first NVR answers slowly, or not at all
+            slow = self.nvrs[0]
+            if self.args.hang_nvr:
+                slow.hang = True
+            else:
+                slow.latency = self.args.slow_nvr_latency
+            blocked = self._switch(True)
+            self.results['slow_nvr'] = 'hung' if self.args.hang_nvr else f'{self.args.slow_nvr_latency:g}s'
+            self.results['head_of_line_arm_ms'] = [_ms(seconds) for seconds in blocked]
+            if arm[1] is not None and blocked[1] is not None:
+                self.results['second_nvr_blocked_ms'] = _ms(blocked[1] - arm[1])
+        except Exception as e:
+            self.results['error'] = repr(e)
+        finally:
+            _thread.interrupt_main()
+
+    def run(self):
+        for server in [self.cameras, self.led] + self.nvrs:
+            server.start()
+        workdir = tempfile.mkdtemp(prefix='sensepro-harness-')
+        script_dir = os.path.dirname(os.path.realpath(__file__))
+        shutil.copy(os.path.join(script_dir, 'SensePro.py'), workdir)
+        with open(os.path.join(workdir, 'config.json'), 'w') as config_file:
+            json.dump(harness_site(self.cameras, self.nvrs, self.led, self.args.countdown), config_file, indent=2)
+        with open(os.path.join(workdir, 'SensePro_env.env'), 'w') as env_file:
+            env_file.write(f'NVR_USERNAME={USER}\nNVR_PASSWORD={PASSWORD}\n')
+
+        gpiozero.Device.pin_factory = MockFactory()
+        threading.Thread(target=self.scenario, name='harness-scenario', daemon=True).start()
+        sys.argv = [os.path.join(workdir, 'SensePro.py')]
+        try:
+            runpy.run_path(sys.argv[0], run_name='__main__')
+        except (SystemExit, KeyboardInterrupt):
+            pass
+        if self.args.keep:
+            self.results['workdir'] = workdir
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return self.results
+
+
+class Soak(Harness):
+    def _drive(self, pins, key, edge):
+        pin = pins.get(key)
+        if pin is not None:
+            if edge == 'press':
+                pin.drive_low()
+            else:
+                pin.drive_high()
+
+    # Resources now, after dropping what the mocks keep for the latency measurements
+    def _sample(self, pins, ts):
+        for server in [self.cameras, self.led] + self.nvrs:
+            server.clear()
+        for pin in pins.values():
+            pin.clear_states()
+        sample = resource_sample()
+        sample['queued_events'] = self.runtime['engine_queue'].queue.qsize()
+        sample['busy_output_lanes'] = self.runtime['output_lanes'].busy()
+        sample['traffic_hours'] = round(ts / 3600, 2)
+        return sample
+
+    # Disarm, reset and arm again, as a site does every day
+    def _cycle(self):
+        self._switch(False)
+        self.runtime['run_remote_command']('reset')
+        self._switch(True)
+
+    def scenario(self):
+        try:
+            if not self._wait_ready():
+                self.results['error'] = "SensePro.py did not start"
+                return
+            config = self.runtime['CONFIG']
+            generator = SensePro_Traffic.TrafficGenerator(config, self.args.soak * 3600, self.args.seed)
+            generator.noise(self.args.noise)
+            generator.bursts(self.args.bursts, 20)
+            generator.flapping(self.args.flapping, 10, 4)
+            edges = generator.sorted_edges()
+            pins = {device.key: self._pin(device.pin) for device in config.devices if device.pin is not None}
+
+            tracemalloc.start()
+            first_snapshot = None
+            samples = []
+            self._switch(True)
+            started = time.monotonic()
+            next_sample = started
+            next_cycle = self.args.cycle
+            for ts, key, edge in edges:
+                while True:
+                    now = time.monotonic()
+                    if now >= next_sample:
+                        samples.append(self._sample(pins, ts))
+                        next_sample += self.args.sample_interval
+                    delay = ts / self.args.speed - (now - started)
+                    if delay <= 0:
+                        break
+                    time.sleep(min(delay, max(next_sample - now, 0)))
+                if first_snapshot is None and ts >= self.args.soak * 3600 * WARM_UP:
+                    first_snapshot = tracemalloc.take_snapshot()
+                if ts >= next_cycle:
+                    self._cycle()
+                    next_cycle += self.args.cycle
+                self._drive(pins, key, edge)
+            samples.append(self._sample(pins, edges[-1][0] if edges else 0.0))
+
+            growing = growing_metrics(samples)
+            self.results['edges'] = len(edges)
+            self.results['real_seconds'] = round(time.monotonic() - started, 1)
+            self.results['samples'] = len(samples)
+            self.results['coalesced_outputs'] = self.runtime['output_lanes'].coalesced
+            self.results['first'] = samples[0]
+            self.results['last'] = samples[-1]
+            if len(samples) < 6 / (1 - WARM_UP):
+                self.results['error'] = f"only {len(samples)} samples; soak longer or sample more often"
+            if growing:
+                self.results['growing'] = {metric: f"{first:g} -> {last:g}" for metric, (first, last) in growing.items()}
+                if first_snapshot is not None:
+                    top = tracemalloc.take_snapshot().compare_to(first_snapshot, 'lineno')[:10]
+                    self.results['tracemalloc_growth'] = [str(stat) for stat in top]
+            tracemalloc.stop()
+        except Exception as e:
+            self.results['error'] = repr(e)
+        finally:
+            _thread.interrupt_main()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure SensePro end to end against mock GPIO and mock Dahua devices.")
+    parser.add_argument("--rounds", type=int, default=20, help="Intrusions to measure edge to alarm latency over")
+    parser.add_argument("--interval", type=float, default=0.2, help="Seconds between intrusions, after the previous alarm pulse ended")
+    parser.add_argument("--countdown", type=int, default=0, help="Arming countdown in seconds")
+    parser.add_argument("--camera-latency", type=float, default=0.0)
+    parser.add_argument("--camera-failure-rate", type=float, default=0.0)
+    parser.add_argument("--nvr-latency", type=float, default=0.0)
+    parser.add_argument("--slow-nvr-latency", type=float, default=3.0, help="Latency of the first NVR in the head of line test")
+    parser.add_argument("--hang-nvr", action="store_true", help="Make the first NVR hang instead of answering slowly")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory with the SensePro logs")
+    parser.add_argument("--soak", type=float, metavar="HOURS", help="Soak for this many hours of traffic instead of measuring latency")
+    parser.add_argument("--speed", type=float, default=60, help="Soak traffic hours per real hour")
+    parser.add_argument("--sample-interval", type=float, default=5, help="Real seconds between soak resource samples")
+    parser.add_argument("--cycle", type=float, default=1800, help="Traffic seconds between disarm/reset/arm cycles")
+    parser.add_argument("--noise", type=float, default=60, help="Soak background presses per device per hour")
+    parser.add_argument("--bursts", type=float, default=30, help="Soak rule bursts per hour")
+    parser.add_argument("--flapping", type=int, default=1, help="Soak flapping inputs")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    results = (Soak(args) if args.soak else Harness(args)).run()
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if 'error' in results or 'growing' in results else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# SensePro_History.py - Persistent trigger and intrusion history in a local SQLite database.
+#
+# The running engine queues events with record_trigger(), record_intrusion() and
+# record_system_event(); a background thread writes them in batched transactions so the
+# SD card sees a handful of writes per flush interval instead of one per edge.
+#
+# Query from the command line, for example:
+#   python3 SensePro_History.py triggers --device "IPC 5 - CCTV" --since "18/10/2026 18:00" --until "19/10/2026 07:00"
+#   python3 SensePro_History.py intrusions --rule "Rule 3" --since "18/10/2026"
+import os
+import sys
+import time
+import json
+import queue
+import atexit
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+BATCH_SIZE = 256  # Flush as soon as this many events are queued
+FLUSH_INTERVAL = 5.0  # Otherwise flush at least this often (seconds)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS triggers (
+    ts REAL NOT NULL,
+    device TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    edge INTEGER NOT NULL DEFAULT 1,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS triggers_device_ts ON triggers (device, ts);
+CREATE INDEX IF NOT EXISTS triggers_ts ON triggers (ts);
+
+CREATE TABLE IF NOT EXISTS intrusions (
+    ts REAL NOT NULL,
+    rule TEXT NOT NULL,
+    cameras TEXT NOT NULL,
+    detectors TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS intrusions_rule_ts ON intrusions (rule, ts);
+CREATE INDEX IF NOT EXISTS intrusions_ts ON intrusions (ts);
+
+CREATE TABLE IF NOT EXISTS system_events (
+    ts REAL NOT NULL,
+    event TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS system_events_ts ON system_events (ts);
+"""
+
+INSERT_SQL = {
+    'triggers': "INSERT INTO triggers (ts, device, kind, edge, source) VALUES (?, ?, ?, ?, ?)",
+    'intrusions': "INSERT INTO intrusions (ts, rule, cameras, detectors) VALUES (?, ?, ?, ?)",
+    'system_events': "INSERT INTO system_events (ts, event) VALUES (?, ?)",
+}
+
+DATE_FORMATS = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y')
+
+_queue = None
+_writer = None
+
+
+def connect(db_path):
+    connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")  # fsync on checkpoint only, safe with WAL
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _write_batch(connection, batch):
+    rows = {}
+    for table, row in batch:
+        rows.setdefault(table, []).append(row)
+    with connection:
+        for table, table_rows in rows.items():
+            connection.executemany(INSERT_SQL[table], table_rows)
+
+
+# Background writer: groups queued events into one transaction per flush
+def _writer_loop(db_path, events):
+    connection = connect(db_path)
+    batch = []
+    deadline = time.monotonic() + FLUSH_INTERVAL
+    running = True
+    while running:
+        try:
+            item = events.get(timeout=max(0.0, deadline - time.monotonic()))
+            if item is None:
+                running = False
+            else:
+                batch.append(item)
+        except queue.Empty:
+            pass
+
+        if batch and (not running or len(batch) >= BATCH_SIZE or time.monotonic() >= deadline):
+            try:
+                _write_batch(connection, batch)
+            except sqlite3.Error as e:
+                logging.error(f"Failed to write {len(batch)} history events: {e}")
+            batch = []
+        if time.monotonic() >= deadline:
+            deadline = time.monotonic() + FLUSH_INTERVAL
+    connection.close()
+
+
+# Start the background writer for the given database file
+def start(db_path):
+    global _queue, _writer
+    if _writer is not None:
+        return
+    _queue = queue.SimpleQueue()
+    _writer = threading.Thread(target=_writer_loop, args=(db_path, _queue), name='SensePro-history', daemon=True)
+    _writer.start()
+    atexit.register(stop)
+    logging.info(f"Recording trigger history to {db_path}")
+
+
+# Flush everything queued so far and stop the writer
+def stop():
+    global _queue, _writer
+    if _writer is None:
+        return
+    _queue.put(None)
+    _writer.join(timeout=10)
+    _queue = None
+    _writer = None
+
+
+def _record(table, row):
+    if _queue is not None:
+        _queue.put((table, row))
+
+
+def record_trigger(device, kind, edge=1, source='gpio', ts=None):
+    _record('triggers', (time.time() if ts is None else ts, device, kind, edge, source))
+
+
+def record_intrusion(rule, cameras, detectors, ts=None):
+    _record('intrusions', (time.time() if ts is None else ts, rule,
+                           json.dumps(list(cameras)), json.dumps([str(d) for d in detectors])))
+
+
+def record_system_event(event, ts=None):
+    _record('system_events', (time.time() if ts is None else ts, event))
+
+
+def _range_clause(column, since, until):
+    clauses, params = [], []
+    if since is not None:
+        clauses.append(f"{column} >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append(f"{column} < ?")
+        params.append(until)
+    return clauses, params
+
+
+# Triggers for one device (or all devices) in [since, until), oldest first
+def query_triggers(connection, device=None, since=None, until=None):
+    clauses, params = _range_clause('ts', since, until)
+    if device is not None:
+        clauses.insert(0, "device = ?")
+        params.insert(0, device)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return connection.execute(f"SELECT ts, device, kind, edge, source FROM triggers{where} ORDER BY ts", params).fetchall()
+
+
+# Intrusions for one rule (or all rules) in [since, until), oldest first
+def query_intrusions(connection, rule=None, since=None, until=None):
+    clauses, params = _range_clause('ts', since, until)
+    if rule is not None:
+        clauses.insert(0, "rule = ?")
+        params.insert(0, rule)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = connection.execute(f"SELECT ts, rule, cameras, detectors FROM intrusions{where} ORDER BY ts", params).fetchall()
+    return [(ts, rule_name, json.loads(cameras), json.loads(detectors)) for ts, rule_name, cameras, detectors in rows]
+
+
+def query_system_events(connection, since=None, until=None):
+    clauses, params = _range_clause('ts', since, until)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return connection.execute(f"SELECT ts, event FROM system_events{where} ORDER BY ts", params).fetchall()
+
+
+def parse_time(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).timestamp()
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"Invalid time '{value}', expected DD/MM/YYYY [HH:MM[:SS]]")
+
+
+def format_time(ts):
+    return datetime.fromtimestamp(ts).strftime('%d/%m/%Y %H:%M:%S.%f')[:-3]
+
+
+def main():
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="Query the SensePro trigger and intrusion history.")
+    parser.add_argument("table", choices=["triggers", "intrusions", "system"])
+    parser.add_argument("--db", default=os.path.join(script_dir, 'logs', 'SensePro_history.db'))
+    parser.add_argument("--device", help="Camera or detector id, e.g. 'IPC 5 - CCTV' or '3'")
+    parser.add_argument("--rule", help="Rule name")
+    parser.add_argument("--since", type=parse_time)
+    parser.add_argument("--until", type=parse_time)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"History database {args.db} not found.")
+        sys.exit(1)
+
+    connection = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    started = time.perf_counter()
+    if args.table == "triggers":
+        rows = query_triggers(connection, args.device, args.since, args.until)
+        lines = [f"{format_time(ts)}  {kind:8s} {device} (edge {edge}, {source})" for ts, device, kind, edge, source in rows]
+    elif args.table == "intrusions":
+        rows = query_intrusions(connection, args.rule, args.since, args.until)
+        lines = [f"{format_time(ts)}  {rule}: cameras {cameras}, detectors {detectors}" for ts, rule, cameras, detectors in rows]
+    else:
+        rows = query_system_events(connection, args.since, args.until)
+        lines = [f"{format_time(ts)}  {event}" for ts, event in rows]
+    elapsed = (time.perf_counter() - started) * 1000
+
+    for line in lines:
+        print(line)
+    print(f"{len(lines)} rows in {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
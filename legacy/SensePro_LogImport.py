@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# SensePro_LogImport.py - Import SensePro text logs into a compact columnar archive.
+#
+# Log files are streamed line by line in binary mode, so memory use does not depend on
+# file size. Each recognised line becomes one row in three column files:
+#
+#   ts.i8       int64   seconds since the epoch (local time of the Pi)
+#   kind.u1     uint8   event kind, see KINDS
+#   subject.i4  int32   index into strings.json (camera id, detector name, rule name or NVR ip)
+#
+# meta.json records the dtypes, byte order and row count, so the columns can be read back
+# with load_archive() or numpy.fromfile(path, dtype).
+#
+# Usage: python3 SensePro_LogImport.py logs/ --output logs/archive
+import os
+import re
+import sys
+import json
+import glob
+import time
+import argparse
+from array import array
+from datetime import datetime
+
+CAMERA_TRIGGER = 1
+DETECTOR_TRIGGER = 2
+ARM = 3
+DISARM = 4
+INTRUSION = 5
+NVR_ERROR = 6
+
+KINDS = {
+    CAMERA_TRIGGER: 'camera_trigger',
+    DETECTOR_TRIGGER: 'detector_trigger',
+    ARM: 'arm',
+    DISARM: 'disarm',
+    INTRUSION: 'intrusion',
+    NVR_ERROR: 'nvr_error',
+}
+
+COLUMNS = (
+    ('ts', 'q', '<i8'),
+    ('kind', 'B', '|u1'),
+    ('subject', 'i', '<i4'),
+)
+
+CHUNK_ROWS = 1 << 18  # Rows buffered per column before appending to disk
+
+# '%d/%m/%Y %H:%M:%S - LEVEL - message', as written by SensePro.py
+ANSI_RE = re.compile(rb'\x1b\[[0-9;]*m')
+CAMERA_RE = re.compile(rb'(.+) - [0-9.:]+ triggered')
+DETECTOR_RE = re.compile(rb'Detector (.+) triggered')
+INTRUSION_RE = re.compile(rb'Confirmed intrusion detected by rule: (.+)')
+NVR_IP_RE = re.compile(rb'NVR at (\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?)')
+ARM_MESSAGES = (b'System armed.', b'System armed immediately at startup.')
+DISARM_MESSAGES = (b'System disarmed.',)
+
+LOG_NAME_RE = re.compile(r'SensePro_(\d\d)-(\d\d)-(\d{4})_(\d\d)-(\d\d)-(\d\d)\.log$')
+
+
+# Classify one ANSI-free message; returns (kind, subject) or None
+def classify(level, message):
+    if message.endswith(b' triggered'):
+        match = DETECTOR_RE.fullmatch(message)
+        if match:
+            return DETECTOR_TRIGGER, match.group(1)
+        match = CAMERA_RE.fullmatch(message)
+        if match:
+            return CAMERA_TRIGGER, match.group(1)
+    elif message.startswith(b'Confirmed intrusion'):
+        match = INTRUSION_RE.fullmatch(message)
+        if match:
+            return INTRUSION, match.group(1)
+    elif message in ARM_MESSAGES:
+        return ARM, None
+    elif message in DISARM_MESSAGES:
+        return DISARM, None
+    elif level == b'ERROR':
+        match = NVR_IP_RE.search(message)
+        if match:
+            return NVR_ERROR, match.group(1)
+    return None
+
+
+class ArchiveWriter:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.files = {name: open(os.path.join(output_dir, f'{name}.{dtype[1:]}'), 'wb')
+                      for name, _, dtype in COLUMNS}
+        self.buffers = {name: array(typecode) for name, typecode, _ in COLUMNS}
+        self.strings = {}
+        self.rows = 0
+
+    def subject_index(self, subject):
+        if subject is None:
+            return -1
+        index = self.strings.get(subject)
+        if index is None:
+            index = self.strings[subject] = len(self.strings)
+        return index
+
+    def append(self, ts, kind, subject):
+        self.buffers['ts'].append(ts)
+        self.buffers['kind'].append(kind)
+        self.buffers['subject'].append(self.subject_index(subject))
+        self.rows += 1
+        if len(self.buffers['ts']) >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        for name, buffer in self.buffers.items():
+            if sys.byteorder != 'little' and buffer.itemsize > 1:
+                buffer.byteswap()
+            buffer.tofile(self.files[name])
+            del buffer[:]
+
+    def close(self, sources):
+        self.flush()
+        for file in self.files.values():
+            file.close()
+        with open(os.path.join(self.output_dir, 'strings.json'), 'w') as strings_file:
+            json.dump([s.decode('utf-8', 'replace') for s in self.strings], strings_file)
+        meta = {
+            'rows': self.rows,
+            'columns': {name: dtype for name, _, dtype in COLUMNS},
+            'kinds': KINDS,
+            'sources': sources,
+        }
+        with open(os.path.join(self.output_dir, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file, indent=2)
+
+
+# Stream one log file into the writer; returns the number of bytes read
+def import_file(path, writer):
+    ansi_sub = ANSI_RE.sub
+    append = writer.append
+    hour_starts = {}  # 'dd/mm/yyyy hh' -> epoch; DST changes happen on hour boundaries
+    size = 0
+
+    with open(path, 'rb', buffering=1 << 20) as log_file:
+        for line in log_file:
+            size += len(line)
+            # DEBUG lines (rule dumps) make up most of the file and are never events
+            if line.startswith(b'DEBUG', 22):
+                continue
+            # Fixed-width 'dd/mm/yyyy hh:mm:ss - ' prefix; anything else is a continuation line
+            if line[2:3] != b'/' or line[19:22] != b' - ':
+                continue
+            level_end = line.find(b' - ', 22)
+            if level_end < 0:
+                continue
+            event = classify(line[22:level_end], ansi_sub(b'', line[level_end + 3:]).rstrip())
+            if event is None:
+                continue
+
+            hour_key = line[:13]
+            hour_start = hour_starts.get(hour_key)
+            if hour_start is None:
+                hour_start = hour_starts[hour_key] = int(datetime.strptime(hour_key.decode(), '%d/%m/%Y %H').timestamp())
+            append(hour_start + int(line[14:16]) * 60 + int(line[17:19]), event[0], event[1])
+    return size
+
+
+def _log_sort_key(path):
+    match = LOG_NAME_RE.search(path)
+    if not match:
+        return (1, path)
+    day, month, year, hour, minute, second = match.groups()
+    return (0, year, month, day, hour, minute, second)
+
+
+def find_log_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, 'SensePro_*.log')))
+        else:
+            files.append(path)
+    return sorted(files, key=_log_sort_key)
+
+
+# Read an archive back as {'ts': array, 'kind': array, 'subject': array, 'strings': [...], 'meta': {...}}
+def load_archive(archive_dir):
+    with open(os.path.join(archive_dir, 'meta.json')) as meta_file:
+        meta = json.load(meta_file)
+    columns = {}
+    for name, typecode, dtype in COLUMNS:
+        column = array(typecode)
+        with open(os.path.join(archive_dir, f'{name}.{dtype[1:]}'), 'rb') as column_file:
+            column.frombytes(column_file.read())
+        if sys.byteorder != 'little' and column.itemsize > 1:
+            column.byteswap()
+        columns[name] = column
+    with open(os.path.join(archive_dir, 'strings.json')) as strings_file:
+        columns['strings'] = json.load(strings_file)
+    columns['meta'] = meta
+    return columns
+
+
+def main():
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="Import SensePro logs into a columnar archive.")
+    parser.add_argument("paths", nargs='*', default=[os.path.join(script_dir, 'logs')],
+                        help="Log files or directories containing SensePro_*.log (default: logs/)")
+    parser.add_argument("--output", default=os.path.join(script_dir, 'logs', 'archive'))
+    args = parser.parse_args()
+
+    files = find_log_files(args.paths)
+    if not files:
+        print("No SensePro log files found.")
+        sys.exit(1)
+
+    writer = ArchiveWriter(args.output)
+    started = time.perf_counter()
+    total_bytes = 0
+    for path in files:
+        total_bytes += import_file(path, writer)
+    writer.close([os.path.basename(path) for path in files])
+    elapsed = time.perf_counter() - started
+
+    print(f"Imported {writer.rows} events from {len(files)} files ({total_bytes / 1e6:.1f} MB) "
+          f"in {elapsed:.2f}s, {total_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# SensePro_Multipart.py - Incremental parser for Dahua eventManager multipart event streams.
+#
+# An attach stream is a multipart/x-mixed-replace body:
+#
+#   --myboundary\r\n
+#   Content-Type: text/plain\r\n
+#   Content-Length: 37\r\n
+#   \r\n
+#   Code=VideoMotion;action=Start;index=0\r\n
+#
+# with "Heartbeat" parts in between, and on newer firmware a ";data={...}" JSON tail that can
+# span several lines. The parser is fed socket reads as they arrive and works in place on
+# them: delimiters are located with bytes.find from a resume offset, so a part split across
+# reads is never scanned twice, and headers and records are matched with compiled patterns at
+# their offsets, so no line or part objects are built. Only the short field values are sliced
+# out, to look up interned code and action names. The bytes of a part that is still incomplete
+# at the end of a read are kept in the carry buffer for the next one.
+#
+# Benchmark: python3 SensePro_Multipart.py --events 200000 --read-size 1460
+import re
+import time
+import random
+import argparse
+
+DEFAULT_BOUNDARY = b'myboundary'
+HEADER_END = b'\r\n\r\n'
+CONTENT_LENGTH = re.compile(rb'content-length:[ \t]*(\d+)', re.IGNORECASE)
+# Code=VideoMotion;action=Start;index=0, optionally followed by ;data=
+RECORD = re.compile(rb'Code=([^;\r\n]*)(?:;action=([^;\r\n]*))?(?:;index=(\d+))?(;data=)?')
+# A whole part holding one plain record or a heartbeat, after the delimiter; it must be followed by
+# the next delimiter, so a body with more records (or not complete yet) takes the general path
+SIMPLE_PART = re.compile(rb'\r\n(?:[^\r\n]+\r\n)*\r\n(?:Code=([^;\r\n]*);action=([^;\r\n]*);index=(\d+)|(Heartbeat))\r\n(?=--)')
+MAX_PART_BYTES = 1 << 16
+MAX_NAMES = 256
+
+# Parser states
+BOUNDARY = 0
+HEADERS = 1
+BODY = 2
+
+_DIGIT_0 = ord('0')
+_names = {}  # Interned code/action names
+
+
+class StreamFormatError(ValueError):
+    pass
+
+
+class MotionEvent:
+    __slots__ = ('code', 'action', 'index', 'data')
+
+    def __init__(self, code, action, index, data):
+        self.code = code  # e.g. 'VideoMotion'
+        self.action = action  # 'Start', 'Stop' or 'Pulse'
+        self.index = index  # Channel index, 0 based; -1 when the record has none
+        self.data = data  # Raw bytes of the data= field, or None
+
+    def __repr__(self):
+        return f"MotionEvent({self.code!r}, {self.action!r}, {self.index}, {self.data!r})"
+
+
+def _name(value):
+    name = _names.get(value)
+    if name is None:
+        name = str(value, 'utf-8', 'replace')
+        if len(_names) < MAX_NAMES:
+            _names[bytes(value)] = name
+    return name
+
+
+def _integer(view):
+    value = 0
+    for byte in view:
+        digit = byte - _DIGIT_0
+        if not 0 <= digit <= 9:
+            return -1
+        value = value * 10 + digit
+    return value if len(view) else -1
+
+
+# Boundary parameter of a multipart Content-Type header, as bytes
+def boundary_from_content_type(content_type):
+    for parameter in content_type.split(';')[1:]:
+        name, _, value = parameter.strip().partition('=')
+        if name.lower() == 'boundary' and value:
+            return value.strip('"').encode('latin-1')
+    return DEFAULT_BOUNDARY
+
+
+class MultipartParser:
+    def __init__(self, boundary=DEFAULT_BOUNDARY):
+        self.delimiter = b'--' + boundary
+        self.carry = bytearray()
+        self.state = BOUNDARY
+        self.resume = 0  # Offset in carry where the pending search continues
+        self.body_length = -1
+        self.parts = 0
+        self.heartbeats = 0
+
+    # Events in a body: Code=...;action=...;index=...[;data=...] records, one per line
+    def _body_events(self, data, view, start, end, events):
+        while start < end:
+            line_end = data.find(b'\n', start, end)
+            if line_end < 0:
+                line_end = end
+            if data.startswith(b'Code=', start, line_end):
+                match = RECORD.match(data, start, line_end)
+                value_end = match.end()
+                if match.group(4) is None and (value_end == line_end or (value_end == line_end - 1 and data[value_end] == 13)):
+                    code, action, index = match.group(1, 2, 3)
+                    events.append(MotionEvent(_name(code), action and _name(action), int(index) if index else -1, None))
+                else:
+                    line_end = self._record(data, view, start, line_end, end, events)
+            elif data.startswith(b'Heartbeat', start, line_end):
+                self.heartbeats += 1
+            start = line_end + 1
+
+    # Parse one record field by field (a data= tail, or fields in another order); returns the offset where it ends
+    def _record(self, data, view, start, line_end, body_end, events):
+        code = action = None
+        index, payload = -1, None
+        position = start
+        while position < line_end:
+            field_end = data.find(b';', position, line_end)
+            if field_end < 0:
+                field_end = line_end
+            equals = data.find(b'=', position, field_end)
+            if equals > 0:
+                key = view[position:equals]
+                if key == b'data':
+                    # data= is JSON and may run over several lines, up to the end of the body
+                    value_end = body_end
+                    while value_end > equals + 1 and view[value_end - 1] in b'\r\n':
+                        value_end -= 1
+                    payload = bytes(view[equals + 1:value_end])
+                    line_end = body_end
+                    break
+                value_end = field_end
+                if value_end > equals + 1 and view[value_end - 1] == 13:  # Trailing \r
+                    value_end -= 1
+                value = view[equals + 1:value_end]
+                if key == b'Code':
+                    code = _name(value.tobytes())
+                elif key == b'action':
+                    action = _name(value.tobytes())
+                elif key == b'index':
+                    index = _integer(value)
+            position = field_end + 1
+        if code is not None:
+            events.append(MotionEvent(code, action, index, payload))
+        return line_end
+
+    # Parse a read from the stream; returns the complete events in it
+    def feed(self, chunk):
+        if self.carry:
+            self.carry += chunk
+            data = self.carry
+        elif isinstance(chunk, (bytes, bytearray)):
+            data = chunk
+        else:
+            data = bytes(chunk)
+        events = []
+        position = 0
+        length = len(data)
+        delimiter, find, simple_part = self.delimiter, data.find, SIMPLE_PART.match
+        with memoryview(data) as view:
+            while True:
+                if self.state == BOUNDARY:
+                    found = find(delimiter, max(position, self.resume))
+                    if found < 0:
+                        # Keep only what could be the start of a split delimiter
+                        position = max(position, length - len(delimiter) + 1)
+                        self.resume = position
+                        break
+                    position = found + len(delimiter)
+                    match = simple_part(data, position)
+                    if match is not None:
+                        # The common case, one pattern match per part
+                        code, action, index, heartbeat = match.groups()
+                        if heartbeat is None:
+                            events.append(MotionEvent(_name(code), _name(action), int(index), None))
+                        else:
+                            self.heartbeats += 1
+                        self.parts += 1
+                        position = self.resume = match.end()
+                        continue
+                    self.state = HEADERS
+                elif self.state == HEADERS:
+                    found = data.find(HEADER_END, max(position, self.resume))
+                    if found < 0:
+                        self.resume = max(position, length - len(HEADER_END) + 1)
+                        break
+                    match = CONTENT_LENGTH.search(data, position, found)
+                    self.body_length = int(match.group(1)) if match else -1
+                    if self.body_length > MAX_PART_BYTES:
+                        raise StreamFormatError(f"multipart part of {self.body_length} bytes")
+                    position = found + len(HEADER_END)
+                    self.resume = position
+                    self.state = BODY
+                else:
+                    if self.body_length >= 0:
+                        body_end = position + self.body_length
+                        if body_end > length:
+                            self.resume = position
+                            break
+                    else:
+                        body_end = data.find(b'\r\n' + self.delimiter, max(position, self.resume))
+                        if body_end < 0:
+                            self.resume = max(position, length - len(self.delimiter) - 1)
+                            break
+                    self.parts += 1
+                    self._body_events(data, view, position, body_end, events)
+                    position = self.resume = body_end
+                    self.state = BOUNDARY
+
+        # Keep the incomplete tail; offsets are now relative to it
+        if position >= length:
+            self.carry = bytearray()
+        elif data is self.carry:
+            del self.carry[:position]
+        else:
+            self.carry = bytearray(data[position:])
+        self.resume = max(self.resume - position, 0)
+        if len(self.carry) > MAX_PART_BYTES:
+            raise StreamFormatError(f"multipart part larger than {MAX_PART_BYTES} bytes")
+        return events
+
+
+# A synthetic attach stream: events records with a heartbeat part every heartbeat_every records
+def synthetic_stream(events, channels=1, heartbeat_every=5, data_every=0, boundary=DEFAULT_BOUNDARY):
+    parts = []
+
+    def part(body):
+        parts.append(b'--%s\r\nContent-Type: text/plain\r\nContent-Length: %d\r\n\r\n%s\r\n' % (boundary, len(body), body))
+
+    for number in range(events):
+        action = b'Start' if number % 2 == 0 else b'Stop'
+        record = b'Code=VideoMotion;action=%s;index=%d' % (action, number % channels)
+        if data_every and number % data_every == 0:
+            record += b';data={\n   "RegionName" : [ "Region1" ]\n}'
+        part(record)
+        if heartbeat_every and number % heartbeat_every == 0:
+            part(b'Heartbeat')
+    return b''.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the eventManager multipart parser.")
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--channels", type=int, default=32)
+    parser.add_argument("--read-size", type=int, default=1460, help="Bytes per simulated socket read (0: random 1..4096)")
+    parser.add_argument("--data-every", type=int, default=0, help="Add a data={...} JSON tail to every Nth record")
+    parser.add_argument("--streams", type=int, default=300, help="Streams to extrapolate the CPU use for")
+    parser.add_argument("--rate", type=float, default=1.0, help="Events per second per stream for the extrapolation")
+    args = parser.parse_args()
+
+    stream = synthetic_stream(args.events, args.channels, data_every=args.data_every)
+    randomizer = random.Random(1)
+    reads, offset = [], 0
+    while offset < len(stream):
+        size = args.read_size or randomizer.randint(1, 4096)
+        reads.append(stream[offset:offset + size])
+        offset += size
+
+    multipart = MultipartParser()
+    parsed = 0
+    started = time.perf_counter()
+    for data in reads:
+        parsed += len(multipart.feed(data))
+    elapsed = time.perf_counter() - started
+    if parsed != args.events:
+        raise SystemExit(f"Parsed {parsed} events, expected {args.events}")
+
+    per_event = elapsed / parsed
+    heartbeat_parts = multipart.parts - parsed
+    cpu = args.streams * (args.rate + 1 / 5) * per_event * 100
+    print(f"{parsed} events + {heartbeat_parts} heartbeats, {len(stream) / 1e6:.1f} MB in {len(reads)} reads: "
+          f"{elapsed:.3f}s, {len(stream) / 1e6 / elapsed:.1f} MB/s, {per_event * 1e6:.2f} us/event")
+    print(f"{args.streams} streams at {args.rate:g} events/s each + heartbeats: ~{cpu:.2f}% of one core")
+
+
+if __name__ == "__main__":
+    main()
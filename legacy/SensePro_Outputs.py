@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# SensePro_Outputs.py - Serialised, coalescing output lanes for intrusion outputs.
+#
+# Every output target (a camera, the relay, the LED device) has one lane. A lane runs its
+# actions one at a time, in the order they were queued, on a worker thread that exists only
+# while the lane has work, so a camera's NO/NC alarm pulse can never interleave with another
+# pulse to the same camera, and the engine thread never waits on an output.
+#
+# An action queued for a target that already has the same action pending or running is
+# coalesced into it: a camera that is still being alarmed is not alarmed again. Each lane
+# therefore holds at most one pending action of each kind, and the threads, queued work and
+# connections are bounded by the number of configured targets however fast intrusions come.
+#
+# The relay is a single pulse whose end is pushed back by every intrusion (RelayPulse), so an
+# overlapping intrusion extends the pulse instead of switching the relay off in the middle
+# of it.
+import time
+import logging
+import threading
+from collections import deque
+
+
+class OutputLanes:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}  # Target -> deque of (action, function, args) still to run
+        self.active = {}  # Target -> actions pending or running there
+        self.coalesced = 0  # Actions dropped because the same action was already pending or running
+
+    # Queue function(*args) on target's lane as action; returns False when it was coalesced
+    def submit(self, target, action, function, *args):
+        with self.lock:
+            actions = self.active.setdefault(target, set())
+            if action in actions:
+                self.coalesced += 1
+                return False
+            actions.add(action)
+            lane = self.pending.get(target)
+            start = lane is None
+            if start:
+                lane = self.pending[target] = deque()
+            lane.append((action, function, args))
+        if start:
+            threading.Thread(target=self._run, args=(target,), name=f'SensePro-output-{target}', daemon=True).start()
+        return True
+
+    def _run(self, target):
+        while True:
+            with self.lock:
+                lane = self.pending[target]
+                if not lane:
+                    del self.pending[target]
+                    del self.active[target]
+                    return
+                action, function, args = lane.popleft()
+            try:
+                function(*args)
+            except Exception as e:
+                logging.error(f"Output {action} to {target} failed: {e}")
+            with self.lock:
+                self.active[target].discard(action)
+
+    # Targets with work pending or running
+    def busy(self):
+        with self.lock:
+            return len(self.pending)
+
+
+class RelayPulse:
+    # on() and off() drive the relay; a pulse runs on lanes under the 'relay' target
+    def __init__(self, lanes, on, off):
+        self.lanes = lanes
+        self.on = on
+        self.off = off
+        self.lock = threading.Lock()
+        self.until = None  # Monotonic end of the running pulse, None while off
+
+    # Keep the relay on for at least duration seconds from now
+    def trigger(self, duration):
+        with self.lock:
+            running = self.until is not None
+            self.until = max(self.until or 0.0, time.monotonic() + duration)
+        if not running:
+            self.lanes.submit('relay', 'pulse', self._pulse)
+
+    def _pulse(self):
+        try:
+            self.on()
+        except Exception:
+            with self.lock:
+                self.until = None  # The next intrusion tries again
+            raise
+        while True:
+            with self.lock:
+                remaining = self.until - time.monotonic()
+                if remaining <= 0:
+                    self.off()
+                    self.until = None
+                    return
+            time.sleep(remaining)
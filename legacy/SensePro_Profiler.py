@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# SensePro_Profiler.py - Signal-triggered diagnostics for the running SensePro process.
+#
+#   kill -USR1 <pid>   start (or stop early) a sampling profile of all threads for
+#                      SENSEPRO_PROFILE_SECONDS and dump every thread's stack
+#   kill -USR2 <pid>   write a tracemalloc top-N diff against the previous snapshot
+#                      (the first USR2 starts tracemalloc and takes the baseline)
+#
+# All output is written as text files to the logs directory.
+import os
+import sys
+import signal
+import logging
+import threading
+import traceback
+import tracemalloc
+import collections
+import time
+from datetime import datetime
+
+# Defaults, overridable from SensePro_env.env when the handlers are installed
+PROFILE_SECONDS = 30.0
+PROFILE_INTERVAL = 0.005
+PROFILE_TOP = 25
+TRACEMALLOC_TOP = 25
+TRACEMALLOC_FRAMES = 10
+
+_logs_dir = None
+_lock = threading.Lock()
+_profile_stop = None  # threading.Event of the running profile, None when idle
+_last_snapshot = None
+
+
+def _output_path(kind, extension='txt'):
+    current_time = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
+    return os.path.join(_logs_dir, f'SensePro_{kind}_{current_time}.{extension}')
+
+
+def _thread_names():
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+
+# Write the current stack of every thread in the process
+def dump_thread_stacks():
+    path = _output_path('threads')
+    names = _thread_names()
+    with open(path, 'w') as output:
+        for ident, frame in sys._current_frames().items():
+            output.write(f"Thread {names.get(ident, '?')} ({ident}):\n")
+            output.write(''.join(traceback.format_stack(frame)))
+            output.write('\n')
+    logging.info(f"Thread stacks written to {path}")
+    return path
+
+
+# Wall-clock sampling profiler covering every thread, including gpiozero callback threads
+def _run_profile(duration, interval, stop_event):
+    global _profile_stop
+    own_ident = threading.get_ident()
+    stacks = collections.Counter()
+    leaves = collections.Counter()
+    samples = 0
+    started = time.monotonic()
+    deadline = started + duration
+
+    while time.monotonic() < deadline and not stop_event.is_set():
+        names = _thread_names()
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if not stack:
+                continue
+            leaves[stack[0]] += 1
+            stack.append(names.get(ident, str(ident)))
+            stacks[';'.join(reversed(stack))] += 1
+        samples += 1
+        stop_event.wait(interval)
+
+    elapsed = time.monotonic() - started
+    path = _output_path('profile')
+    with open(path, 'w') as output:
+        output.write(f"# SensePro sampling profile: {samples} samples over {elapsed:.1f}s (interval {interval}s)\n")
+        output.write("# Top frames by samples:\n")
+        for leaf, count in leaves.most_common(PROFILE_TOP):
+            output.write(f"#   {count:8d}  {leaf}\n")
+        output.write("# Collapsed stacks (flamegraph.pl / speedscope format):\n")
+        for stack, count in stacks.most_common():
+            output.write(f"{stack} {count}\n")
+    logging.info(f"Profile of {samples} samples written to {path}")
+
+    with _lock:
+        if _profile_stop is stop_event:
+            _profile_stop = None
+
+
+# Start a profile, or stop the running one early
+def toggle_profile(duration=None, interval=None):
+    global _profile_stop
+    with _lock:
+        if _profile_stop is not None:
+            logging.info("Stopping running profile early.")
+            _profile_stop.set()
+            return None
+        _profile_stop = threading.Event()
+        stop_event = _profile_stop
+
+    duration = PROFILE_SECONDS if duration is None else duration
+    interval = PROFILE_INTERVAL if interval is None else interval
+    logging.info(f"Starting {duration:g}s sampling profile.")
+    thread = threading.Thread(target=_run_profile, args=(duration, interval, stop_event),
+                              name='SensePro-profiler', daemon=True)
+    thread.start()
+    return thread
+
+
+# A snapshot without tracemalloc's own and the import machinery's allocations; the baseline and
+# every later snapshot are taken this way, so those never show up in a diff
+def _take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+
+
+# Write the top allocation growth since the previous snapshot
+def write_tracemalloc_diff(top=None):
+    global _last_snapshot
+    top = TRACEMALLOC_TOP if top is None else top
+    with _lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _last_snapshot = _take_snapshot()
+            logging.info("tracemalloc started, baseline snapshot taken. Send SIGUSR2 again for a diff.")
+            return None
+
+        snapshot = _take_snapshot()
+        previous, _last_snapshot = _last_snapshot, snapshot
+
+    current, peak = tracemalloc.get_traced_memory()
+    stats = snapshot.compare_to(previous, 'traceback')
+    path = _output_path('tracemalloc')
+    with open(path, 'w') as output:
+        output.write(f"# tracemalloc diff: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n")
+        for index, stat in enumerate(stats[:top], 1):
+            output.write(f"#{index}: {stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} blocks), "
+                         f"{stat.size / 1024:.1f} KiB total\n")
+            for line in stat.traceback.format():
+                output.write(f"    {line}\n")
+    logging.info(f"tracemalloc diff written to {path}")
+    return path
+
+
+def _run_in_background(target):
+    # Signal handlers run on the main thread; never block it with file I/O
+    threading.Thread(target=target, name='SensePro-diagnostics', daemon=True).start()
+
+
+def _on_sigusr1(signum, frame):
+    _run_in_background(dump_thread_stacks)
+    toggle_profile()
+
+
+def _on_sigusr2(signum, frame):
+    _run_in_background(write_tracemalloc_diff)
+
+
+# Install the SIGUSR1/SIGUSR2 handlers. Must be called from the main thread.
+def install_signal_handlers(logs_dir):
+    global _logs_dir, PROFILE_SECONDS, PROFILE_INTERVAL, TRACEMALLOC_TOP, TRACEMALLOC_FRAMES
+    _logs_dir = logs_dir
+    PROFILE_SECONDS = float(os.getenv('SENSEPRO_PROFILE_SECONDS', PROFILE_SECONDS))
+    PROFILE_INTERVAL = float(os.getenv('SENSEPRO_PROFILE_INTERVAL', PROFILE_INTERVAL))
+    TRACEMALLOC_TOP = int(os.getenv('SENSEPRO_TRACEMALLOC_TOP', TRACEMALLOC_TOP))
+    TRACEMALLOC_FRAMES = int(os.getenv('SENSEPRO_TRACEMALLOC_FRAMES', TRACEMALLOC_FRAMES))
+    os.makedirs(logs_dir, exist_ok=True)
+    signal.signal(signal.SIGUSR1, _on_sigusr1)
+    signal.signal(signal.SIGUSR2, _on_sigusr2)
+    logging.info(f"Diagnostics enabled: kill -USR1 {os.getpid()} to profile, kill -USR2 {os.getpid()} for memory snapshots.")
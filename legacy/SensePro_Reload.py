@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# SensePro_Reload.py - Watch config.json and work out what changed between two compiled configs.
+#
+# The watcher uses inotify on the config directory (through libc, no extra packages), so both
+# in-place saves (IN_CLOSE_WRITE) and editor/installer renames (IN_MOVED_TO) are seen. Where
+# inotify is not available it falls back to polling the file's modification time.
+import os
+import time
+import ctypes
+import ctypes.util
+import struct
+import logging
+import threading
+from dataclasses import fields
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')
+
+DEBOUNCE_SECONDS = 0.5  # Editors often write a file several times in a row
+POLL_SECONDS = 1.0
+
+
+def _inotify_fd(directory):
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    fd = libc.inotify_init1(IN_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        errno = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(errno, f"inotify_add_watch failed for {directory}")
+    return fd
+
+
+def _wait_inotify(fd, file_name):
+    while True:
+        data = os.read(fd, 4096)
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if name == file_name:
+                return
+
+
+def _watch_loop(path, on_change):
+    directory, file_name = os.path.split(os.path.abspath(path))
+    try:
+        fd = _inotify_fd(directory)
+    except (OSError, AttributeError) as e:
+        logging.warning(f"inotify unavailable ({e}); polling {path} every {POLL_SECONDS}s instead.")
+        fd = None
+
+    last_mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    while True:
+        if fd is not None:
+            _wait_inotify(fd, os.fsencode(file_name))
+        else:
+            time.sleep(POLL_SECONDS)
+            mtime = os.path.getmtime(path) if os.path.exists(path) else None
+            if mtime == last_mtime:
+                continue
+            last_mtime = mtime
+
+        time.sleep(DEBOUNCE_SECONDS)
+        try:
+            on_change(path)
+        except Exception as e:
+            logging.error(f"Error applying configuration change from {path}: {e}")
+
+
+# Call on_change(path) from a background thread whenever the file is rewritten
+def watch(path, on_change):
+    thread = threading.Thread(target=_watch_loop, args=(path, on_change), name='SensePro-config-watch', daemon=True)
+    thread.start()
+    return thread
+
+
+# Field values that define a device, NVR or LED pattern, without its slot and auth object
+def _identity(item):
+    return tuple(getattr(item, field.name) for field in fields(item) if field.name not in ('slot', 'auth'))
+
+
+def _rule_identity(config, rule):
+    return (rule.name, rule.type, tuple(config.devices[slot].key for slot in rule.cameras),
+            tuple(config.devices[slot].key for slot in rule.detectors), rule.relay_duration)
+
+
+# Compare the running compiled config with a new one; devices are identified by key
+def diff_configurations(old, new):
+    old_devices = {device.key: device for device in old.devices}
+    new_devices = {device.key: device for device in new.devices}
+    rebind, updated = [], []
+    for key, device in new_devices.items():
+        old_device = old_devices.get(key)
+        if old_device is None:
+            continue
+        if old_device.pin != device.pin:
+            rebind.append(key)
+        elif _identity(old_device) != _identity(device):
+            updated.append(key)
+
+    old_nvrs = {nvr.id: _identity(nvr) for nvr in old.nvrs}
+    return {
+        'added': [key for key in new_devices if key not in old_devices],
+        'removed': [key for key in old_devices if key not in new_devices],
+        'rebind': rebind,
+        'updated': updated,
+        'rules': [_rule_identity(old, rule) for rule in old.rules] != [_rule_identity(new, rule) for rule in new.rules],
+        'time_threshold': old.time_threshold != new.time_threshold,
+        'nvrs_changed': [nvr.id for nvr in new.nvrs if old_nvrs.get(nvr.id) != _identity(nvr)],
+        'nvrs_removed': [nvr_id for nvr_id in old_nvrs if nvr_id not in {nvr.id for nvr in new.nvrs}],
+        'led_pattern': {action: _identity(pattern) for action, pattern in old.led_patterns.items()} !=
+                       {action: _identity(pattern) for action, pattern in new.led_patterns.items()},
+        'system_settings': [field.name for field in fields(new.settings)
+                            if getattr(old.settings, field.name) != getattr(new.settings, field.name)],
+    }
+
+
+def has_changes(diff):
+    return any(diff.values())
+
+
+# One-line summary of a diff for the log
+def describe_changes(diff):
+    parts = []
+    for kind in ('added', 'removed', 'rebind', 'updated'):
+        if diff[kind]:
+            parts.append(f"{kind}: {', '.join(diff[kind])}")
+    for key, label in (('rules', 'rules'), ('time_threshold', 'time threshold'), ('led_pattern', 'LED pattern')):
+        if diff[key]:
+            parts.append(f"{label} changed")
+    if diff['nvrs_changed'] or diff['nvrs_removed']:
+        parts.append(f"NVRs changed: {', '.join(diff['nvrs_changed'] + diff['nvrs_removed'])}")
+    if diff['system_settings']:
+        parts.append(f"system settings changed: {', '.join(diff['system_settings'])}")
+    return '; '.join(parts)
@@ -0,0 +1,647 @@
+#!/usr/bin/env python3
+# SensePro_Remote.py - Receive configuration pushes from the SensePro server over RabbitMQ.
+#
+# The server publishes the full controller document (send_config.json: controller, devices,
+# rules with AND/OR groups, devicesAllowedInRules) to the durable queue controller-<serial>-config,
+# declared with x-max-length 1 so only the newest push waits while the controller is offline.
+# controller-<serial> keeps carrying the plain document for the Java controller
+# (ControllerMessageListener), which cannot read the envelopes below; this runtime does not
+# consume it, so the two never take each other's messages.
+# With a prefetch of 1 and an ack only after the config has been applied, a push that arrives
+# while another is being applied stays in the queue and replaces any older one there.
+#
+# The server owns the devices and rules; system settings, NVRs, LED patterns and the time
+# threshold are site settings and are kept from the local config.json. Every applied document
+# is identified by a content hash, so a redelivered or re-sent push with the same content is
+# acknowledged without being translated or applied again.
+#
+# Pushes are either a full document or a delta against the last applied one:
+#
+#   {"type": "full", "version": <hash>, "compact": {...}}  (or "config": the plain document)
+#   {"type": "delta", "base": <hash>, "version": <hash>, "patch": [JSON patch operations]}
+#
+# (a bare document, as sent by older publishers, is treated as full). "compact" is the
+# normalised form built by send_message.encode_compact: each distinct device object once,
+# referenced by index from the device lists and rules. Messages are JSON, or msgpack when
+# the content type says so and msgpack is installed.
+#
+# After every push the controller reports {"controller", "status", "version"} on the
+# controller-status queue, where status is applied, unchanged, mismatch or rejected; on
+# mismatch the publisher sends a full document next.
+#
+# Device triggers from elsewhere (another controller's uplink, a server-side integration)
+# arrive on controller-<serial>-inputs as {"device", "kind", "edge"} objects, one per message or
+# newline delimited, and are fed to the same input queue as the local GPIO and stream inputs.
+#
+# Remote arm, disarm, reset and status commands arrive as {"id", "command"} on the durable
+# controller-<serial>-commands queue (stale commands expire in the broker after a minute).
+# They are pushed to the controller, not polled; each is applied once per id and acked after
+# it has been applied, with the result sent to reply_to when the sender asked for one.
+#
+# Upstream, triggers, arm/disarm/reset and intrusions are appended to a local spool
+# (SensePro_Spool) and published from it in batches to the durable controller-events queue,
+# one newline-delimited JSON message per batch, confirmed by the broker before the spool
+# cursor moves on.
+import os
+import copy
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import SensePro_Spool
+
+try:
+    import pika
+except ImportError:  # The runtime keeps working from config.json without RabbitMQ
+    pika = None
+
+try:
+    import msgpack
+except ImportError:  # Publishers fall back to JSON
+    msgpack = None
+
+PREFETCH_COUNT = 1
+QUEUE_ARGUMENTS = {'x-max-length': 1}  # Must match the server's declaration of the queue
+STATUS_QUEUE = 'controller-status'
+EVENTS_QUEUE = 'controller-events'
+EVENT_BATCH = 500  # Events per upstream message
+COMMANDS = ('arm', 'disarm', 'reset', 'status')
+COMMAND_QUEUE_ARGUMENTS = {'x-message-ttl': 60000}  # A command that waited a minute is stale
+COMMAND_MEMORY = 256  # Command ids remembered for de-duplication
+INPUT_QUEUE_ARGUMENTS = {'x-message-ttl': 10000}  # A trigger that waited ten seconds is stale
+INPUT_PREFETCH_COUNT = 100
+RECONNECT_SECONDS = 5
+HEARTBEAT_SECONDS = 30
+
+CAMERA_DEVICE_TYPE = 'cctv'
+RULE_TYPE_MAP = {'AND': 'all', 'OR': 'one'}  # OR: any single device of the group
+
+COMPACT_FORMAT = 1
+MSGPACK_TYPE = 'application/msgpack'
+
+
+def queue_name(serial):
+    return f'controller-{serial}-config'
+
+
+# The controller serial comes from the env file, falling back to the Raspberry Pi's CPU serial
+def controller_serial():
+    serial = os.getenv('RASPBERRY_PI_SERIAL')
+    if serial:
+        return serial
+    try:
+        with open('/proc/cpuinfo', 'r') as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith('Serial'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return None
+
+
+def connection_parameters():
+    credentials = pika.PlainCredentials(os.getenv('RABBITMQ_USER', 'guest'), os.getenv('RABBITMQ_PASSWORD', 'guest'))
+    return pika.ConnectionParameters(
+        host=os.getenv('RABBITMQ_HOST', 'sensepro-server-dev'),
+        port=int(os.getenv('RABBITMQ_PORT', '5672')),
+        credentials=credentials,
+        heartbeat=HEARTBEAT_SECONDS,
+        blocked_connection_timeout=RECONNECT_SECONDS * 6,
+    )
+
+
+def declare_controller_queue(channel, name):
+    channel.queue_declare(queue=name, durable=True, arguments=QUEUE_ARGUMENTS)
+
+
+def command_queue_name(serial):
+    return f'controller-{serial}-commands'
+
+
+def declare_command_queue(channel, name):
+    channel.queue_declare(queue=name, durable=True, arguments=COMMAND_QUEUE_ARGUMENTS)
+
+
+def input_queue_name(serial):
+    return f'controller-{serial}-inputs'
+
+
+def declare_input_queue(channel, name):
+    channel.queue_declare(queue=name, durable=True, arguments=INPUT_QUEUE_ARGUMENTS)
+
+
+def declare_status_queue(channel):
+    channel.queue_declare(queue=STATUS_QUEUE, durable=True)
+
+
+# Version of a server document: sha256 of its canonical JSON form, independent of key order and whitespace
+def content_hash(document):
+    canonical = json.dumps(document, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def decode_body(body, content_type=None):
+    if content_type == MSGPACK_TYPE:
+        if msgpack is None:
+            raise ValueError("msgpack message received but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
+
+
+# Expand a compact document back into the server's document; every reference gets its own dict
+def decode_compact(compact):
+    if compact.get('format') != COMPACT_FORMAT:
+        raise ValueError(f"unsupported compact format {compact.get('format')!r}")
+    shapes = compact['shapes']
+    rows = compact['devices']
+
+    def device(index):
+        row = rows[index]
+        return dict(zip(shapes[row[0]], row[1:]))
+
+    def devices(indexes):
+        return [device(index) for index in indexes]
+
+    parts = dict(compact.get('other', {}))
+    for key, indexes in compact.get('lists', {}).items():
+        parts[key] = devices(indexes)
+    if 'rules' in compact:
+        parts['rules'] = []
+        for entry in compact['rules']:
+            entry = dict(entry)
+            if isinstance(entry.get('rule'), dict) and 'devices' in entry['rule']:
+                entry['rule'] = dict(entry['rule'], devices=devices(entry['rule']['devices']))
+            if 'devices' in entry:
+                entry['devices'] = devices(entry['devices'])
+            if 'selectedDevices' in entry:
+                entry['selectedDevices'] = [rows[ref][shapes[rows[ref][0]].index('id') + 1] if isinstance(ref, int) else ref
+                                            for ref in entry['selectedDevices']]
+            parts['rules'].append(entry)
+    return {key: parts[key] for key in compact.get('order', parts) if key in parts}
+
+
+def _pointer_tokens(pointer):
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise ValueError(f"invalid JSON pointer {pointer!r}")
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _container(document, tokens):
+    target = document
+    for token in tokens:
+        target = target[int(token)] if isinstance(target, list) else target[token]
+    return target
+
+
+# Apply JSON patch operations (add, remove, replace) to a copy of document
+def apply_patch(document, patch):
+    document = copy.deepcopy(document)
+    for operation in patch:
+        tokens = _pointer_tokens(operation['path'])
+        if not tokens:
+            if operation['op'] not in ('add', 'replace'):
+                raise ValueError(f"cannot {operation['op']} the whole document")
+            document = copy.deepcopy(operation['value'])
+            continue
+        parent, token = _container(document, tokens[:-1]), tokens[-1]
+        op = operation['op']
+        if isinstance(parent, list):
+            index = len(parent) if token == '-' else int(token)
+            if op == 'add':
+                parent.insert(index, copy.deepcopy(operation['value']))
+            elif op == 'remove':
+                del parent[index]
+            elif op == 'replace':
+                parent[index] = copy.deepcopy(operation['value'])
+            else:
+                raise ValueError(f"unsupported patch operation {op!r}")
+        else:
+            if op in ('add', 'replace'):
+                if op == 'replace' and token not in parent:
+                    raise KeyError(operation['path'])
+                parent[token] = copy.deepcopy(operation['value'])
+            elif op == 'remove':
+                del parent[token]
+            else:
+                raise ValueError(f"unsupported patch operation {op!r}")
+    return document
+
+
+# Translate a server document into the config.json schema, keeping the site settings of base
+def translate_server_config(document, base):
+    cameras, detectors = {}, {}
+    for device in document.get('devices') or []:
+        if device.get('deviceTypeId') == CAMERA_DEVICE_TYPE and device.get('ip'):
+            # A camera without a pin is watched over its eventManager stream (SensePro_Streams)
+            cameras[device['id']] = {
+                'protocol': 'http',
+                'ip': device['ip'],
+                'pin': device.get('pin'),
+                'name': device.get('name') or device['id'],
+            }
+        elif device.get('pin') is None:
+            logging.warning(f"Server device {device.get('name')} ({device.get('id')}) has no pin; not bound.")
+        elif device.get('deviceTypeId') == CAMERA_DEVICE_TYPE:
+            logging.warning(f"Server camera {device.get('name')} ({device.get('id')}) has no ip; not bound.")
+        else:
+            detectors[device['id']] = {
+                'pin': device['pin'],
+                'name': device.get('name') or device['id'],
+                'associated_cameras': [],
+            }
+
+    # Detector-camera associations are not part of the server model yet; keep the local ones
+    for detector_id, detector_info in detectors.items():
+        local = base.get('detectors', {}).get(detector_id, {})
+        detector_info['associated_cameras'] = [name for name in local.get('associated_cameras', []) if name in cameras]
+
+    rules = []
+    for entry in document.get('rules') or []:
+        rule = entry.get('rule') or {}
+        name = rule.get('name') or rule.get('id')
+        selected = entry.get('selectedDevices') or [device['id'] for device in entry.get('devices') or []]
+        unbound = [device_id for device_id in selected if device_id not in cameras and device_id not in detectors]
+        if unbound:
+            logging.warning(f"Rule {name} selects devices that are not bound: {', '.join(unbound)}")
+        rules.append({
+            'name': name,
+            'type': RULE_TYPE_MAP.get(rule.get('type'), str(rule.get('type')).lower()),
+            'ipcctvs': [device_id for device_id in selected if device_id in cameras],
+            'detectors': [device_id for device_id in selected if device_id in detectors],
+        })
+
+    raw = {key: value for key, value in base.items() if key not in ('ipcctv', 'detectors', 'rules')}
+    raw['ipcctv'] = cameras
+    raw['detectors'] = detectors
+    raw['rules'] = rules
+    return raw
+
+
+class ConfigConsumer:
+    # on_config(document, version) applies a server document; it returns normally once the
+    # configuration is live and raises (ConfigError, ValueError, ...) if it was rejected.
+    # The last applied document is kept in document_path as the base for deltas.
+    def __init__(self, serial, on_config, document_path):
+        self.serial = serial
+        self.queue = queue_name(serial)
+        self.on_config = on_config
+        self.document_path = document_path
+        self.document = self._read_document()
+        self.version = content_hash(self.document) if self.document is not None else None
+        self.thread = None
+
+    def _read_document(self):
+        try:
+            with open(self.document_path, 'r') as document_file:
+                return json.load(document_file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_document(self, document, version):
+        temporary_path = f'{self.document_path}.tmp'
+        with open(temporary_path, 'w') as document_file:
+            json.dump(document, document_file)
+        os.replace(temporary_path, self.document_path)
+        self.document, self.version = document, version
+
+    def _status(self, status, **details):
+        return dict(controller=self.serial, status=status, version=self.version, **details)
+
+    # Work out the document a push describes; returns (document, version) or a status for the publisher
+    def _resolve(self, message):
+        if message.get('type') == 'delta':
+            if message.get('base') != self.version or self.document is None:
+                logging.warning(f"Configuration delta from {self.queue} is against {str(message.get('base'))[:12]}, "
+                                f"not the applied {str(self.version)[:12]}; requesting a full configuration.")
+                return self._status('mismatch')
+            if message['version'] == self.version:
+                return self._status('unchanged')
+            try:
+                document = apply_patch(self.document, message['patch'])
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                logging.warning(f"Configuration delta from {self.queue} does not apply ({e!r}); requesting a full configuration.")
+                return self._status('mismatch')
+        elif message.get('type') == 'full':
+            document = decode_compact(message['compact']) if 'compact' in message else message['config']
+        else:
+            document = message  # Bare document from an older publisher
+
+        version = content_hash(document)
+        if message.get('version', version) != version:
+            logging.warning(f"Configuration from {self.queue} does not match its version "
+                            f"{str(message.get('version'))[:12]}; requesting a full configuration.")
+            return self._status('mismatch')
+        return document, version
+
+    # Apply one push; returns the status to report
+    def handle(self, body, content_type=None):
+        try:
+            resolved = self._resolve(decode_body(body, content_type))
+            if isinstance(resolved, dict):
+                return resolved
+            document, version = resolved
+            if version == self.version:
+                logging.info(f"Configuration {version[:12]} from {self.queue} is already applied; skipped.")
+                return self._status('unchanged')
+            self.on_config(document, version)
+        except Exception as e:
+            # A rejected document is dropped; requeueing it would only fail again
+            logging.error(f"Configuration from {self.queue} rejected: {e}")
+            return self._status('rejected', error=str(e))
+        self._write_document(document, version)
+        return self._status('applied')
+
+    def _on_message(self, channel, method, properties, body):
+        status = self.handle(body, properties.content_type)
+        channel.basic_publish(exchange='', routing_key=STATUS_QUEUE, body=json.dumps(status),
+                              properties=pika.BasicProperties(content_type='application/json', delivery_mode=2))
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+    def _consume(self):
+        connection = pika.BlockingConnection(connection_parameters())
+        try:
+            channel = connection.channel()
+            declare_controller_queue(channel, self.queue)
+            declare_status_queue(channel)
+            channel.basic_qos(prefetch_count=PREFETCH_COUNT)
+            channel.basic_consume(queue=self.queue, on_message_callback=self._on_message)
+            logging.info(f"Waiting for configuration on {self.queue}.")
+            channel.start_consuming()
+        finally:
+            if connection.is_open:
+                connection.close()
+
+    def _run(self):
+        while True:
+            try:
+                self._consume()
+            except Exception as e:
+                logging.warning(f"RabbitMQ connection for {self.queue} lost ({e}); retrying in {RECONNECT_SECONDS}s.")
+            time.sleep(RECONNECT_SECONDS)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='SensePro-config-consumer', daemon=True)
+        self.thread.start()
+        return self.thread
+
+
+# Start consuming configuration pushes in a background thread; returns None when not configured
+def start(on_config, document_path):
+    if pika is None:
+        logging.warning("pika is not installed; configuration pushes from the server are disabled.")
+        return None
+    serial = controller_serial()
+    if not serial:
+        logging.warning("No controller serial (RASPBERRY_PI_SERIAL); configuration pushes from the server are disabled.")
+        return None
+    consumer = ConfigConsumer(serial, on_config, document_path)
+    consumer.start()
+    return consumer
+
+
+class CommandConsumer:
+    # on_command(command) applies arm, disarm, reset or status and returns the resulting
+    # system state; results of recent command ids are kept in memory_path, so a command that
+    # is redelivered (for example after a crash before its ack) is answered but not re-applied
+    def __init__(self, serial, on_command, memory_path):
+        self.serial = serial
+        self.queue = command_queue_name(serial)
+        self.on_command = on_command
+        self.memory_path = memory_path
+        self.results = OrderedDict(self._read_memory())
+        self.thread = None
+
+    def _read_memory(self):
+        try:
+            with open(self.memory_path, 'r') as memory_file:
+                return json.load(memory_file)
+        except (OSError, ValueError):
+            return []
+
+    def _write_memory(self):
+        temporary_path = f'{self.memory_path}.tmp'
+        with open(temporary_path, 'w') as memory_file:
+            json.dump(list(self.results.items()), memory_file)
+        os.replace(temporary_path, self.memory_path)
+
+    # Apply one command message; returns the reply
+    def handle(self, body):
+        try:
+            message = json.loads(body)
+            command_id, command = str(message['id']), message['command']
+        except (ValueError, KeyError, TypeError) as e:
+            logging.error(f"Malformed command on {self.queue}: {e}")
+            return {'result': 'rejected', 'error': f"malformed command: {e}"}
+
+        if command_id in self.results:
+            logging.info(f"Command {command_id} ({command}) already applied; not repeated.")
+            return dict(self.results[command_id], result='duplicate')
+        if command not in COMMANDS:
+            return {'id': command_id, 'command': command, 'result': 'rejected', 'error': 'unknown command'}
+
+        logging.info(f"Remote command {command_id}: {command}")
+        try:
+            state = self.on_command(command)
+        except Exception as e:
+            logging.error(f"Remote command {command_id} ({command}) failed: {e}")
+            return {'id': command_id, 'command': command, 'result': 'failed', 'error': str(e)}
+        reply = {'id': command_id, 'command': command, 'result': 'applied', 'state': state}
+        if command != 'status':
+            self.results[command_id] = reply
+            while len(self.results) > COMMAND_MEMORY:
+                self.results.popitem(last=False)
+            self._write_memory()
+        return reply
+
+    def _on_message(self, channel, method, properties, body):
+        reply = self.handle(body)
+        if properties.reply_to:
+            channel.basic_publish(exchange='', routing_key=properties.reply_to, body=json.dumps(reply),
+                                  properties=pika.BasicProperties(content_type='application/json',
+                                                                  correlation_id=properties.correlation_id))
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+    def _consume(self):
+        connection = pika.BlockingConnection(connection_parameters())
+        try:
+            channel = connection.channel()
+            declare_command_queue(channel, self.queue)
+            channel.basic_qos(prefetch_count=PREFETCH_COUNT)
+            channel.basic_consume(queue=self.queue, on_message_callback=self._on_message)
+            logging.info(f"Waiting for commands on {self.queue}.")
+            channel.start_consuming()
+        finally:
+            if connection.is_open:
+                connection.close()
+
+    def _run(self):
+        while True:
+            try:
+                self._consume()
+            except Exception as e:
+                logging.warning(f"RabbitMQ connection for {self.queue} lost ({e}); retrying in {RECONNECT_SECONDS}s.")
+            time.sleep(RECONNECT_SECONDS)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='SensePro-command-consumer', daemon=True)
+        self.thread.start()
+        return self.thread
+
+
+# Start consuming remote commands in a background thread; returns None when not configured
+def start_commands(on_command, memory_path):
+    if pika is None:
+        logging.warning("pika is not installed; remote commands are disabled.")
+        return None
+    serial = controller_serial()
+    if not serial:
+        logging.warning("No controller serial (RASPBERRY_PI_SERIAL); remote commands are disabled.")
+        return None
+    consumer = CommandConsumer(serial, on_command, memory_path)
+    consumer.start()
+    return consumer
+
+
+class InputConsumer:
+    # on_input(kind, device_id, edge) queues one device edge; kind is camera or detector
+    def __init__(self, serial, on_input):
+        self.serial = serial
+        self.queue = input_queue_name(serial)
+        self.on_input = on_input
+        self.thread = None
+
+    def handle(self, body):
+        count = 0
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+                kind, device_id = message['kind'], str(message['device'])
+            except (ValueError, KeyError, TypeError) as e:
+                logging.error(f"Malformed input on {self.queue}: {e}")
+                continue
+            if kind not in ('camera', 'detector'):
+                logging.error(f"Input on {self.queue} for unknown device kind {kind!r}")
+                continue
+            self.on_input(kind, device_id, message.get('edge', 'press'))
+            count += 1
+        return count
+
+    def _on_message(self, channel, method, properties, body):
+        self.handle(body)
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+    def _consume(self):
+        connection = pika.BlockingConnection(connection_parameters())
+        try:
+            channel = connection.channel()
+            declare_input_queue(channel, self.queue)
+            channel.basic_qos(prefetch_count=INPUT_PREFETCH_COUNT)
+            channel.basic_consume(queue=self.queue, on_message_callback=self._on_message)
+            logging.info(f"Waiting for device inputs on {self.queue}.")
+            channel.start_consuming()
+        finally:
+            if connection.is_open:
+                connection.close()
+
+    def _run(self):
+        while True:
+            try:
+                self._consume()
+            except Exception as e:
+                logging.warning(f"RabbitMQ connection for {self.queue} lost ({e}); retrying in {RECONNECT_SECONDS}s.")
+            time.sleep(RECONNECT_SECONDS)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='SensePro-input-consumer', daemon=True)
+        self.thread.start()
+        return self.thread
+
+
+# Start consuming remote device inputs in a background thread; returns None when not configured
+def start_inputs(on_input):
+    if pika is None:
+        logging.warning("pika is not installed; remote device inputs are disabled.")
+        return None
+    serial = controller_serial()
+    if not serial:
+        logging.warning("No controller serial (RASPBERRY_PI_SERIAL); remote device inputs are disabled.")
+        return None
+    consumer = InputConsumer(serial, on_input)
+    consumer.start()
+    return consumer
+
+
+class EventUplink:
+    def __init__(self, serial, spool, batch_size=EVENT_BATCH):
+        self.serial = serial
+        self.spool = spool
+        self.batch_size = batch_size
+        self.thread = None
+
+    # Queue an event for upstream; never blocks on the network
+    def publish(self, event_type, **fields):
+        event = {'ts': fields.pop('ts', None) or time.time(), 'type': event_type, **fields}
+        self.spool.append(json.dumps(event, separators=(',', ':')).encode())
+
+    def _drain(self, connection, channel):
+        properties = pika.BasicProperties(content_type='application/x-ndjson', delivery_mode=2,
+                                          headers={'controller': self.serial})
+        while True:
+            payloads, position = self.spool.read_batch(self.batch_size)
+            if not payloads:
+                self.spool.sync()
+                connection.process_data_events(time_limit=0)  # Heartbeats while idle
+                self.spool.wait(1.0)
+                continue
+            # Raises (and the batch is sent again after reconnecting) unless the broker confirms it
+            channel.basic_publish(exchange='', routing_key=EVENTS_QUEUE, body=b'\n'.join(payloads),
+                                  properties=properties, mandatory=True)
+            self.spool.commit(position)
+
+    def _run(self):
+        outage_logged = False
+        while True:
+            try:
+                connection = pika.BlockingConnection(connection_parameters())
+                try:
+                    channel = connection.channel()
+                    channel.queue_declare(queue=EVENTS_QUEUE, durable=True)
+                    channel.confirm_delivery()
+                    backlog = self.spool.backlog_bytes()
+                    if backlog:
+                        logging.info(f"Sending {backlog / 1e3:.1f} kB of spooled events to {EVENTS_QUEUE}.")
+                    outage_logged = False
+                    self._drain(connection, channel)
+                finally:
+                    if connection.is_open:
+                        connection.close()
+            except Exception as e:
+                if not outage_logged:
+                    logging.warning(f"Event uplink unavailable ({e}); events are spooled until it is back.")
+                    outage_logged = True
+            time.sleep(RECONNECT_SECONDS)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='SensePro-event-uplink', daemon=True)
+        self.thread.start()
+        return self.thread
+
+
+# Spool events in spool_dir and send them upstream in the background. Events are always spooled;
+# without pika or a controller serial they wait there, and are sent once both are available
+def start_event_uplink(spool_dir):
+    serial = controller_serial()
+    uplink = EventUplink(serial, SensePro_Spool.Spool(spool_dir))
+    if pika is None:
+        logging.warning(f"pika is not installed; events are queued in {spool_dir} and not sent upstream until it is.")
+    elif not serial:
+        logging.warning(f"No controller serial (RASPBERRY_PI_SERIAL); events are queued in {spool_dir} and not sent upstream until it is set.")
+    else:
+        uplink.start()
+    return uplink
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# SensePro_Sources.py - Pluggable input sources feeding one engine queue.
+#
+# Every input, whatever it comes from, becomes an InputEvent(key, edge, source, ts): the
+# device key (camera:<id> or detector:<id>), press or release, the name of the source and the
+# epoch time it was seen. Sources only put events on the EventQueue; one engine thread takes
+# them off in order and evaluates the rules, so ingestion never waits on rule evaluation or
+# its outputs, and either side can be measured on its own.
+#
+# Sources:
+#   gpio    a gpiozero input per configured pin
+#   stream  Dahua eventManager attach streams for pinless cameras (SensePro_Streams)
+#   amqp    device inputs delivered over RabbitMQ (SensePro_Remote.InputConsumer)
+#   replay  a recorded event file or edge trace (SensePro_Trace) played back at 1x, Nx or full speed
+#
+# A source implements start(emit), update(config) for configuration changes and stop().
+#
+# A camera can report the same motion twice, through its wired alarm output (gpio) and its
+# event stream. Fusion sits between the queue and the rules: a press of a device from another
+# source than the press it last let through, within the fusion window, is the same motion and
+# is dropped. The earlier of the two timestamps is kept, and the skew between the sources
+# is recorded per source pair.
+import json
+import time
+import queue
+import logging
+import threading
+import SensePro_Config
+import SensePro_Remote
+import SensePro_Streams
+
+PRESS = 'press'
+RELEASE = 'release'
+
+
+class InputEvent:
+    __slots__ = ('key', 'edge', 'source', 'ts')
+
+    def __init__(self, key, edge, source, ts):
+        self.key = key  # Device key, see SensePro_Config.camera_key / detector_key
+        self.edge = edge  # PRESS or RELEASE
+        self.source = source  # Name of the source it came from
+        self.ts = ts  # Epoch seconds
+
+    def __repr__(self):
+        return f"InputEvent({self.key!r}, {self.edge!r}, {self.source!r}, {self.ts})"
+
+
+class EventQueue:
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.counts = {}  # Source name -> events received
+        self.thread = None
+
+    # Queue one edge; safe from any thread and never blocks
+    def emit(self, key, edge, source, ts=None):
+        self.counts[source] = self.counts.get(source, 0) + 1
+        self.queue.put(InputEvent(key, edge, source, ts or time.time()))
+
+    def _run(self, handler):
+        while True:
+            event = self.queue.get()
+            try:
+                handler(event)
+            except Exception as e:
+                logging.error(f"Error handling {event}: {e}")
+
+    # Hand every queued event to handler(event) on one engine thread
+    def start(self, handler):
+        self.thread = threading.Thread(target=self._run, args=(handler,), name='SensePro-engine', daemon=True)
+        self.thread.start()
+        return self.thread
+
+
+class Fusion:
+    # on_earlier(key, ts) is called when a dropped duplicate was seen earlier than the press let through
+    def __init__(self, window, on_earlier=None):
+        self.window = window
+        self.on_earlier = on_earlier
+        self.last = {}  # Device key -> (ts, source) of the last press let through
+        self.skew = {}  # (first source, second source) -> [count, total seconds, max seconds]
+        self.duplicates = 0
+
+    # True when event should reach the rules
+    def accept(self, event):
+        if event.edge != PRESS:
+            return True
+        last = self.last.get(event.key)
+        if last is not None and last[1] != event.source and abs(event.ts - last[0]) <= self.window:
+            self.duplicates += 1
+            skew = event.ts - last[0]
+            stats = self.skew.setdefault((last[1], event.source), [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += skew
+            stats[2] = max(stats[2], abs(skew))
+            logging.debug(f"{event.key} from {event.source} fused with {last[1]} ({skew * 1000:+.0f} ms)")
+            if event.ts < last[0]:
+                self.last[event.key] = (event.ts, last[1])
+                if self.on_earlier is not None:
+                    self.on_earlier(event.key, event.ts)
+            return False
+        self.last[event.key] = (event.ts, event.source)
+        return True
+
+    # {"gpio>stream": {"count", "mean_ms", "max_ms"}}: how much later the second source reports
+    def skew_report(self):
+        return {f'{first}>{second}': {'count': count, 'mean_ms': round(total / count * 1000, 1), 'max_ms': round(largest * 1000, 1)}
+                for (first, second), (count, total, largest) in self.skew.items()}
+
+
+class EventSource:
+    name = None
+
+    def start(self, emit):
+        self.emit = emit
+
+    def update(self, config):
+        pass
+
+    def stop(self):
+        pass
+
+
+class GpioSource(EventSource):
+    name = 'gpio'
+
+    # button_factory(pin) returns a gpiozero-style input with when_pressed/when_released and close()
+    def __init__(self, button_factory):
+        self.button_factory = button_factory
+        self.inputs = {}  # Device key -> (pin, input)
+        self.enabled = True
+
+    def _bind(self, key, button):
+        if self.enabled:
+            button.when_pressed = lambda: self.emit(key, PRESS, self.name)
+            button.when_released = lambda: self.emit(key, RELEASE, self.name)
+        else:
+            button.when_pressed = button.when_released = None
+
+    # Bind inputs for the devices with a pin; unchanged pins keep their input
+    def update(self, config):
+        wanted = {device.key: device.pin for device in config.devices if device.pin is not None}
+        for key, (pin, button) in list(self.inputs.items()):
+            if wanted.get(key) != pin:
+                button.close()  # Closed before binding, so two devices can swap pins
+                del self.inputs[key]
+        for key, pin in wanted.items():
+            if key not in self.inputs:
+                button = self.button_factory(pin)
+                self._bind(key, button)
+                self.inputs[key] = (pin, button)
+
+    # Remove or restore the callbacks (removed during the arming countdown)
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        for key, (_, button) in self.inputs.items():
+            self._bind(key, button)
+
+    def stop(self):
+        for _, button in self.inputs.values():
+            button.close()
+        self.inputs.clear()
+
+
+class StreamSource(EventSource):
+    name = 'stream'
+
+    def __init__(self, user, password):
+        self.user = user
+        self.password = password
+        self.streams = None
+
+    def _on_motion(self, camera_id, edge):
+        self.emit(SensePro_Config.camera_key(camera_id), edge, self.name)
+
+    def update(self, config):
+        if self.streams is None:
+            self.streams = SensePro_Streams.start(config, self.user, self.password, self._on_motion)
+        else:
+            self.streams.update(config)
+
+
+class AmqpSource(EventSource):
+    name = 'amqp'
+
+    def start(self, emit):
+        super().start(emit)
+        self.consumer = SensePro_Remote.start_inputs(self._on_input)
+
+    def _on_input(self, kind, device_id, edge):
+        key = SensePro_Config.camera_key(device_id) if kind == 'camera' else SensePro_Config.detector_key(device_id)
+        self.emit(key, edge, self.name)
+
+
+# Recorded events, one JSON object per line: {"ts", "device", "kind"[, "edge"]}, as the event
+# uplink sends triggers upstream; lines of other event types are skipped
+def read_event_file(path):
+    events = []
+    with open(path, 'r') as event_file:
+        for line in event_file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('type', 'trigger') != 'trigger' or record.get('kind') not in ('camera', 'detector'):
+                continue
+            key = (SensePro_Config.camera_key if record['kind'] == 'camera' else SensePro_Config.detector_key)(str(record['device']))
+            events.append((float(record['ts']), key, record.get('edge', PRESS)))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+class ReplaySource(EventSource):
+    name = 'replay'
+
+    # speed 1 plays the recording in real time, N plays it N times faster, 0 as fast as possible;
+    # events are stamped with the time they are replayed
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = speed
+        self.thread = None
+
+    # [(epoch seconds, key, edge)] in time order
+    def read_events(self):
+        return read_event_file(self.path)
+
+    def _run(self):
+        events = self.read_events()
+        logging.info(f"Replaying {len(events)} events from {self.path} at {f'{self.speed:g}x' if self.speed else 'full'} speed.")
+        started = time.monotonic()
+        first_ts = events[0][0] if events else 0
+        for ts, key, edge in events:
+            if self.speed:
+                delay = (ts - first_ts) / self.speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            self.emit(key, edge, self.name)
+        logging.info(f"Replay of {self.path} finished in {time.monotonic() - started:.1f}s.")
+
+    def start(self, emit):
+        super().start(emit)
+        self.thread = threading.Thread(target=self._run, name='SensePro-replay', daemon=True)
+        self.thread.start()
+
+
+# Start sources feeding event_queue and bind them to config
+def start_sources(sources, event_queue, config):
+    for source in sources:
+        source.start(event_queue.emit)
+        source.update(config)
+    return sources
+
+
+# Pass a configuration change on to every source
+def update_sources(sources, config):
+    for source in sources:
+        source.update(config)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# SensePro_Spool.py - Append-only, segment-based spool for events waiting to go upstream.
+#
+# Events are appended to numbered segment files (0000000000000001.seg, ...) as
+# length + CRC framed records and handed to the OS straight away, so the engine never waits
+# on the network and a crash or broker outage loses nothing. A reader drains records in
+# batches from a persisted cursor; once a batch has been confirmed upstream the cursor moves
+# past it and fully drained segments are deleted. A torn record at the end of the last
+# segment (power cut mid-write) is cut off when the spool is reopened.
+#
+# The spool holds at most max_bytes (SPOOL_MAX_BYTES by default). An outage long enough to
+# fill it drops the oldest segments, sent or not, with a warning, so the newest events are
+# kept and the storage never fills up.
+#
+# Layout (little endian):
+#   record: payload length u32, crc32 u32, payload
+#   cursor: segment number u64, offset u64 of the first record not yet confirmed
+import os
+import zlib
+import struct
+import logging
+import threading
+
+RECORD_HEADER = struct.Struct('<II')
+CURSOR = struct.Struct('<QQ')
+SEGMENT_BYTES = 1 << 20
+SPOOL_MAX_BYTES = 64 << 20  # Many days of events from a busy site
+READ_BYTES = 1 << 16
+SEGMENT_SUFFIX = '.seg'
+CURSOR_NAME = 'cursor'
+
+
+def _segment_name(number):
+    return f'{number:016d}{SEGMENT_SUFFIX}'
+
+
+# Valid records in data from offset, at most limit; returns ([(payload, end offset)], end of the last one)
+def _scan(data, offset=0, limit=None):
+    records = []
+    while limit is None or len(records) < limit:
+        if offset + RECORD_HEADER.size > len(data):
+            break
+        length, crc = RECORD_HEADER.unpack_from(data, offset)
+        end = offset + RECORD_HEADER.size + length
+        payload = data[offset + RECORD_HEADER.size:end]
+        if end > len(data) or zlib.crc32(payload) != crc:
+            break
+        records.append((payload, end))
+        offset = end
+    return records, offset
+
+
+class Spool:
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, max_bytes=SPOOL_MAX_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                               if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+        self.cursor = self._read_cursor()
+        if not self.segments:
+            self.segments = [max(self.cursor[0], 1)]
+        if self.cursor[0] < self.segments[0]:
+            self.cursor = (self.segments[0], 0)
+        self._open_tail()
+        self.total_bytes = sum(os.path.getsize(self._path(number)) for number in self.segments[:-1]) + self.write_offset
+        self._enforce_limit()
+
+    def _path(self, number):
+        return os.path.join(self.directory, _segment_name(number))
+
+    def _read_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_NAME), 'rb') as cursor_file:
+                return CURSOR.unpack(cursor_file.read(CURSOR.size))
+        except (OSError, struct.error):
+            return (0, 0)
+
+    # Open the last segment for appending, cutting off a torn record at its end
+    def _open_tail(self):
+        path = self._path(self.segments[-1])
+        self.file = open(path, 'ab')
+        with open(path, 'rb') as segment_file:
+            data = segment_file.read()
+        _, valid_end = _scan(data)
+        if valid_end != len(data):
+            logging.warning(f"Spool segment {path} has a torn record; {len(data) - valid_end} bytes dropped.")
+            self.file.truncate(valid_end)
+        self.write_offset = valid_end
+
+    def _write_cursor(self, position):
+        temporary_path = os.path.join(self.directory, CURSOR_NAME + '.tmp')
+        with open(temporary_path, 'wb') as cursor_file:
+            cursor_file.write(CURSOR.pack(*position))
+        os.replace(temporary_path, os.path.join(self.directory, CURSOR_NAME))
+
+    # Drop the oldest segments while the spool is over max_bytes; the segment being written stays
+    def _enforce_limit(self):
+        while self.total_bytes > self.max_bytes and len(self.segments) > 1:
+            number = self.segments.pop(0)
+            path = self._path(number)
+            size = os.path.getsize(path)
+            unsent = size - (self.cursor[1] if self.cursor[0] == number else 0)
+            os.remove(path)
+            self.total_bytes -= size
+            if self.cursor[0] <= number:
+                self.cursor = (self.segments[0], 0)
+                self._write_cursor(self.cursor)
+            logging.warning(f"Spool {self.directory} is over {self.max_bytes / 1e6:.0f} MB; dropped its oldest segment "
+                            f"{_segment_name(number)} with {unsent / 1e3:.1f} kB of events not yet sent.")
+
+    def _rotate(self):
+        self.file.close()
+        self.segments.append(self.segments[-1] + 1)
+        self.file = open(self._path(self.segments[-1]), 'ab')
+        self.write_offset = 0
+
+    def append(self, payload):
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self.lock:
+            if self.write_offset and self.write_offset + len(record) > self.segment_bytes:
+                self._rotate()
+            self.file.write(record)
+            self.file.flush()  # In the page cache now; survives a crash of this process
+            self.write_offset += len(record)
+            self.total_bytes += len(record)
+            self._enforce_limit()
+            self.available.notify_all()
+
+    # Push appended records to the storage device
+    def sync(self):
+        with self.lock:
+            os.fsync(self.file.fileno())
+
+    # Up to max_records records after the cursor; returns (payloads, position to commit once they are sent)
+    def read_batch(self, max_records, read_bytes=READ_BYTES):
+        with self.lock:
+            segments = list(self.segments)
+            tail_end = self.write_offset
+            segment, offset = self.cursor
+        payloads = []
+        while len(payloads) < max_records:
+            try:
+                segment_end = tail_end if segment == segments[-1] else os.path.getsize(self._path(segment))
+                if offset >= segment_end:
+                    if segment == segments[-1]:
+                        break
+                    segment, offset = segments[segments.index(segment) + 1], 0
+                    continue
+                size = min(read_bytes, segment_end - offset)
+                with open(self._path(segment), 'rb') as segment_file:
+                    segment_file.seek(offset)
+                    data = segment_file.read(size)
+            except FileNotFoundError:  # Dropped by the size limit meanwhile; go on from the oldest left
+                with self.lock:
+                    segments = list(self.segments)
+                    tail_end = self.write_offset
+                if segment >= segments[0]:
+                    raise
+                segment, offset = segments[0], 0
+                continue
+            records, end = _scan(data, 0, max_records - len(payloads))
+            if not records:
+                if size < segment_end - offset:
+                    read_bytes *= 2  # A record larger than the read size
+                    continue
+                logging.error(f"Spool segment {_segment_name(segment)} is corrupt after offset {offset}; skipping the rest.")
+                offset = segment_end
+                continue
+            payloads.extend(payload for payload, _ in records)
+            offset += end
+        return payloads, (segment, offset)
+
+    # Everything before position has been delivered
+    def commit(self, position):
+        with self.lock:
+            if position[0] < self.segments[0]:
+                position = (self.segments[0], 0)  # Its segment was dropped by the size limit
+            self._write_cursor(position)
+            self.cursor = position
+            while self.segments[0] < position[0]:
+                path = self._path(self.segments.pop(0))
+                self.total_bytes -= os.path.getsize(path)
+                os.remove(path)
+
+    # Bytes appended but not yet confirmed upstream
+    def backlog_bytes(self):
+        with self.lock:
+            segments, tail_end, cursor_offset = list(self.segments), self.write_offset, self.cursor[1]
+        total = tail_end
+        for number in segments[:-1]:
+            total += os.path.getsize(self._path(number))
+        return total - cursor_offset  # The cursor is always in the first remaining segment
+
+    # Wait until records may be available or timeout expires
+    def wait(self, timeout):
+        with self.lock:
+            self.available.wait(timeout)
+
+    def close(self):
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# SensePro_State.py - Warm-restart state: armed flag and last trigger times, memory-mapped.
+#
+# The file holds a small header and two banks. Every update writes the complete state into
+# the bank that is not current, with a higher sequence number and a CRC, so a crash or power
+# cut in the middle of a write leaves the other bank intact. Updates are plain memory writes
+# into a shared mapping; the kernel writes them back, and a process crash loses nothing.
+#
+# The header describes the layout of the banks (slot count and device fingerprint), so it never
+# changes in place: a new layout (first run, changed device list) is written as a complete new
+# file, header and a committed bank, and renamed over the old one. A crash leaves either the old
+# file, whose banks still match its header, or the new one.
+#
+# Layout (little endian):
+#   header: magic 'SPST', version u16, slot count u16, device fingerprint 8 bytes
+#   bank:   sequence u64, armed u8, 7 bytes padding, slot count x f64 epoch seconds (0 = none), crc32 u32
+import os
+import mmap
+import zlib
+import struct
+import hashlib
+import logging
+import threading
+
+MAGIC = b'SPST'
+VERSION = 1
+HEADER = struct.Struct('<4sHH8s')
+BANK_HEAD = struct.Struct('<QB7x')
+CRC = struct.Struct('<I')
+
+
+def _fingerprint(slot_keys):
+    return hashlib.sha1('\0'.join(slot_keys).encode()).digest()[:8]
+
+
+class StateFile:
+    def __init__(self, path, slot_keys):
+        self.path = path
+        self._set_layout(slot_keys)
+        self.times = [0.0] * len(self.slot_keys)
+        self.armed = False
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+        # State as found on disk, for the caller to decide what to resume
+        self.restored_armed = False
+        self.restored_times = {}
+
+        self._open()
+
+    def _set_layout(self, slot_keys):
+        self.slot_keys = list(slot_keys)
+        self.slots = {key: index for index, key in enumerate(self.slot_keys)}
+        self.bank_struct = struct.Struct(f'<{len(self.slot_keys)}d')
+        self.bank_size = BANK_HEAD.size + self.bank_struct.size + CRC.size
+        self.size = HEADER.size + 2 * self.bank_size
+
+    def _header(self):
+        return HEADER.pack(MAGIC, VERSION, len(self.slot_keys), _fingerprint(self.slot_keys))
+
+    def _read_file(self):
+        try:
+            with open(self.path, 'rb') as state_file:
+                return state_file.read()
+        except FileNotFoundError:
+            return b''
+
+    # Map the file, which has the current layout
+    def _map_file(self):
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            self.map = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+
+    # Replace the file with one of the current layout holding the current state, and map it
+    def _rewrite(self):
+        self.sequence += 1
+        content = bytearray(self.size)  # The other bank is zeros, which never pass the CRC
+        content[:HEADER.size] = self._header()
+        offset = HEADER.size + (self.sequence % 2) * self.bank_size
+        content[offset:offset + self.bank_size] = self._bank()
+        temporary_path = self.path + '.tmp'
+        fd = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, content)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(temporary_path, self.path)
+        self._map_file()
+
+    def _open(self):
+        fingerprint = _fingerprint(self.slot_keys)
+        existing = self._read_file()
+
+        restored = self._read_existing(existing, fingerprint)
+        if restored is not None:
+            self.sequence, self.restored_armed, self.restored_times = restored
+            # Keep the file describing the previous run until the caller changes something
+            self.armed = self.restored_armed
+            for key, ts in self.restored_times.items():
+                self.times[self.slots[key]] = ts
+        if len(existing) == self.size and existing[:HEADER.size] == self._header():
+            self._map_file()
+            self._commit()
+        else:
+            self._rewrite()  # A new file, or the layout changed
+
+    # Parse a previous state file; the armed flag survives device changes, trigger times do not
+    def _read_existing(self, data, fingerprint):
+        if len(data) < HEADER.size:
+            return None
+        magic, version, count, old_fingerprint = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            return None
+
+        times_struct = struct.Struct(f'<{count}d')
+        bank_size = BANK_HEAD.size + times_struct.size + CRC.size
+        best = None
+        for bank in range(2):
+            offset = HEADER.size + bank * bank_size
+            if offset + bank_size > len(data):
+                break
+            body = data[offset:offset + bank_size - CRC.size]
+            (crc,) = CRC.unpack_from(data, offset + bank_size - CRC.size)
+            if zlib.crc32(body) != crc:
+                continue
+            sequence, armed = BANK_HEAD.unpack_from(body)
+            if best is None or sequence > best[0]:
+                best = (sequence, bool(armed), times_struct.unpack_from(body, BANK_HEAD.size))
+        if best is None:
+            return None
+
+        sequence, armed, times = best
+        if old_fingerprint != fingerprint or count != len(self.slot_keys):
+            logging.info("Device configuration changed since the last run; trigger windows not restored.")
+            return sequence, armed, {}
+        return sequence, armed, {key: ts for key, ts in zip(self.slot_keys, times) if ts}
+
+    # The current state as a bank, sequence number and CRC included
+    def _bank(self):
+        body = BANK_HEAD.pack(self.sequence, self.armed) + self.bank_struct.pack(*self.times)
+        return body + CRC.pack(zlib.crc32(body))
+
+    def _commit(self):
+        self.sequence += 1
+        offset = HEADER.size + (self.sequence % 2) * self.bank_size
+        self.map[offset:offset + self.bank_size] = self._bank()
+
+    def set_armed(self, armed):
+        with self.lock:
+            self.armed = bool(armed)
+            self._commit()
+            self.map.flush()  # Rare and important; make it durable across power loss
+
+    def set_triggered(self, key, ts):
+        slot = self.slots.get(key)
+        if slot is None:
+            return
+        with self.lock:
+            self.times[slot] = ts or 0.0
+            self._commit()
+
+    def clear_triggers(self):
+        with self.lock:
+            self.times = [0.0] * len(self.slot_keys)
+            self._commit()
+
+    # Switch to a new device list (config reload), keeping times of devices present in both
+    def rekey(self, slot_keys):
+        with self.lock:
+            times = {key: self.times[index] for key, index in self.slots.items()}
+            self.map.close()
+            self._set_layout(slot_keys)
+            self.times = [times.get(key, 0.0) for key in self.slot_keys]
+            self._rewrite()
+
+    def close(self):
+        with self.lock:
+            self.map.flush()
+            self.map.close()
+
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# SensePro_Streams.py - Camera motion from Dahua eventManager attach streams instead of GPIO pins.
+#
+# A camera configured without a pin is watched over
+# /cgi-bin/eventManager.cgi?action=attach&codes=[VideoMotion]&heartbeat=5, the stream the Java
+# MotionDetectionListener uses. All streams run as tasks on one asyncio event loop in one thread,
+# so a camera costs a socket rather than a thread or a header pin. The camera writes a heartbeat
+# every HEARTBEAT_SECONDS; a stream that stays silent for HEARTBEAT_TIMEOUT is treated as dead
+# and reconnected after a jittered exponential backoff, so cameras dropped together (switch or
+# NVR reboot) do not all reconnect in the same instant.
+#
+# Digest authentication (RFC 7616, MD5 and SHA-256, qop=auth) is done here on plain asyncio
+# streams; no HTTP client package is involved. VideoMotion Start (and Pulse) is reported to
+# on_motion as a press and Stop as a release, on the loop thread, so on_motion must only queue
+# the edge (SensePro_Sources.EventQueue) and never block.
+#
+# A camera with "nvr" set is watched through its NVR instead: one attach stream per NVR carries
+# the events of all its channels, tagged by index, and the channels are matched to cameras by
+# the NVR's ChannelTitle names (or an explicit "channel"), so a 32 channel NVR costs one
+# connection and one digest handshake instead of 32.
+#
+# An https camera or NVR is checked as its "verify" setting says (SensePro_Config), the same
+# setting the runtime passes to requests for that device; "verify": false accepts the
+# self-signed certificate Dahua devices ship with.
+import re
+import ssl
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import secrets
+import threading
+import SensePro_Multipart
+
+HEARTBEAT_SECONDS = 5
+HEARTBEAT_TIMEOUT = 3 * HEARTBEAT_SECONDS
+CONNECT_TIMEOUT = 10
+RECONNECT_MIN_SECONDS = 1
+RECONNECT_MAX_SECONDS = 60
+ATTACH_PATH = f'/cgi-bin/eventManager.cgi?action=attach&codes=[VideoMotion]&heartbeat={HEARTBEAT_SECONDS}'
+CHANNEL_TITLE_PATH = '/cgi-bin/configManager.cgi?action=getConfig&name=ChannelTitle'
+CHANNEL_TITLE = re.compile(r'ChannelTitle\[(\d+)\]\.Name=([^\r\n]*)')
+READ_BYTES = 4096
+
+MOTION_EDGES = {'Start': 'press', 'Pulse': 'press', 'Stop': 'release'}
+DIGEST_HASHES = {'MD5': hashlib.md5, 'SHA-256': hashlib.sha256}
+
+
+class StreamError(Exception):
+    pass
+
+
+# Fields of a WWW-Authenticate: Digest challenge
+def parse_challenge(header):
+    scheme, _, rest = header.strip().partition(' ')
+    if scheme.lower() != 'digest':
+        raise StreamError(f"unsupported authentication scheme {scheme!r}")
+    fields, position = {}, 0
+    while position < len(rest):
+        name_end = rest.find('=', position)
+        if name_end < 0:
+            break
+        name = rest[position:name_end].strip(' ,').lower()
+        position = name_end + 1
+        if rest[position:position + 1] == '"':
+            value_end = rest.find('"', position + 1)
+            if value_end < 0:
+                value_end = len(rest)
+            value = rest[position + 1:value_end]
+            position = value_end + 1
+        else:
+            value_end = rest.find(',', position)
+            if value_end < 0:
+                value_end = len(rest)
+            value = rest[position:value_end].strip()
+            position = value_end
+        fields[name] = value
+        position = rest.find(',', position) + 1 or len(rest)
+    if 'nonce' not in fields:
+        raise StreamError("digest challenge without a nonce")
+    return fields
+
+
+# Authorization header answering challenge for one request; nc counts uses of the nonce
+def digest_authorization(user, password, method, uri, challenge, nc, cnonce=None):
+    algorithm = challenge.get('algorithm', 'MD5')
+    hash_function = DIGEST_HASHES.get(algorithm.upper().replace('-SESS', ''))
+    if hash_function is None:
+        raise StreamError(f"unsupported digest algorithm {algorithm!r}")
+
+    def digest(text):
+        return hash_function(text.encode()).hexdigest()
+
+    realm, nonce = challenge.get('realm', ''), challenge['nonce']
+    cnonce = cnonce or secrets.token_hex(8)
+    ha1 = digest(f'{user}:{realm}:{password}')
+    if algorithm.upper().endswith('-SESS'):
+        ha1 = digest(f'{ha1}:{nonce}:{cnonce}')
+    ha2 = digest(f'{method}:{uri}')
+    qops = [qop.strip() for qop in challenge.get('qop', '').split(',') if qop.strip()]
+    parts = [f'username="{user}"', f'realm="{realm}"', f'nonce="{nonce}"', f'uri="{uri}"', f'algorithm={algorithm}']
+    if 'auth' in qops:
+        response = digest(f'{ha1}:{nonce}:{nc:08x}:{cnonce}:auth:{ha2}')
+        parts += ['qop=auth', f'nc={nc:08x}', f'cnonce="{cnonce}"']
+    elif not qops:
+        response = digest(f'{ha1}:{nonce}:{ha2}')
+    else:
+        raise StreamError(f"unsupported digest qop {challenge['qop']!r}")
+    parts.append(f'response="{response}"')
+    if 'opaque' in challenge:
+        parts.append(f'opaque="{challenge["opaque"]}"')
+    return 'Digest ' + ', '.join(parts)
+
+
+# Backoff before reconnect attempt number attempt (0 based): full jitter over an exponential cap
+def reconnect_delay(attempt):
+    return random.uniform(RECONNECT_MIN_SECONDS, min(RECONNECT_MAX_SECONDS, RECONNECT_MIN_SECONDS * 2 ** attempt))
+
+
+# SSL context for a camera or NVR: None for http, else checked as its verify setting says (see
+# SensePro_Config: True, False or a CA bundle path), as requests does for the runtime's calls
+def ssl_context(source):
+    if source.protocol != 'https':
+        return None
+    if source.verify is False:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+    return ssl.create_default_context(cafile=source.verify if isinstance(source.verify, str) else None)
+
+
+def _host_port(source):
+    host, _, port = source.ip.partition(':')
+    return host, int(port) if port else (443 if source.protocol == 'https' else 80)
+
+
+# {channel index: title} from a configManager getConfig&name=ChannelTitle response
+def parse_channel_titles(text):
+    return {int(index): title.strip() for index, title in CHANNEL_TITLE.findall(text)}
+
+
+# {channel index: camera id} for the cameras on an NVR: an explicit channel, else the channel whose
+# ChannelTitle is the camera's name or id (the wizard names cameras "<ChannelTitle> - IPC")
+def match_channels(titles, cameras):
+    by_title = {}
+    for index, title in sorted(titles.items()):
+        by_title.setdefault(title, index)
+    channels = {camera.channel: camera.id for camera in cameras if camera.channel is not None}
+    for camera in cameras:
+        if camera.channel is not None:
+            continue
+        names = (camera.name, camera.id, camera.name.removesuffix(' - IPC'), camera.id.removesuffix(' - CCTV'))
+        index = next((by_title[name] for name in names if name in by_title), None)
+        if index is None:
+            logging.warning(f"Camera {camera.id} is not a ChannelTitle on NVR {camera.nvr}; its motion is not watched.")
+        elif index in channels:
+            logging.warning(f"Camera {camera.id} matches channel {index} of NVR {camera.nvr}, "
+                            f"which is already camera {channels[index]}; its motion is not watched.")
+        else:
+            channels[index] = camera.id
+    return channels
+
+
+class MotionStream:
+    def __init__(self, source, label, cameras, user, password, on_event, multiplexed=False):
+        self.source = source  # The camera or NVR the stream is opened on
+        self.label = label
+        self.cameras = cameras
+        self.user = user
+        self.password = password
+        self.on_event = on_event
+        self.multiplexed = multiplexed  # One NVR stream for several cameras, told apart by channel index
+        self.host, self.port = _host_port(source)
+        self.challenge = None
+        self.nc = 0
+        self.titles = None
+        self.channels = {}
+        self.connected = False
+
+    def set_cameras(self, cameras):
+        self.cameras = cameras
+        if self.multiplexed and self.titles is not None:
+            self.channels = match_channels(self.titles, cameras)
+
+    async def _request(self, path):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=ssl_context(self.source)), CONNECT_TIMEOUT)
+        lines = [f'GET {path} HTTP/1.1', f'Host: {self.source.ip}', 'Connection: keep-alive']
+        if self.challenge is not None:
+            self.nc += 1
+            lines.append('Authorization: ' + digest_authorization(
+                self.user, self.password, 'GET', path, self.challenge, self.nc))
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+        try:
+            status_line = await asyncio.wait_for(reader.readline(), CONNECT_TIMEOUT)
+            parts = status_line.split(None, 2)
+            if len(parts) < 2 or not parts[1].isdigit():
+                raise StreamError(f"bad status line {status_line[:80]!r}")
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), CONNECT_TIMEOUT)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer, int(parts[1]), headers
+
+    # Connect and authenticate; returns the reader, writer and headers of a 200 response
+    async def _open(self, path):
+        for _ in range(2):  # A missing or stale nonce costs one 401 round trip
+            reader, writer, status, headers = await self._request(path)
+            if status == 200:
+                return reader, writer, headers
+            writer.close()
+            if status != 401 or 'www-authenticate' not in headers:
+                raise StreamError(f"HTTP {status}")
+            stale = self.challenge is not None and 'stale=true' in headers['www-authenticate'].lower()
+            if self.challenge is not None and not stale:
+                raise StreamError("authentication rejected")
+            self.challenge, self.nc = parse_challenge(headers['www-authenticate']), 0
+        raise StreamError("authentication rejected")
+
+    # Body bytes as they arrive, undoing chunked transfer encoding; each read must come within timeout
+    async def _body(self, reader, headers, timeout):
+        async def read(coroutine):
+            return await asyncio.wait_for(coroutine, timeout)
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                line = await read(reader.readline())
+                size = int(line.split(b';')[0], 16) if line.strip() else 0
+                if size == 0:
+                    return
+                data = await read(reader.readexactly(size))
+                await read(reader.readexactly(2))  # CRLF after the chunk
+                yield data
+        elif 'content-length' in headers:
+            yield await read(reader.readexactly(int(headers['content-length'])))
+        else:
+            while True:
+                data = await read(reader.read(READ_BYTES))
+                if not data:
+                    return
+                yield data
+
+    async def _fetch_titles(self):
+        reader, writer, headers = await self._open(CHANNEL_TITLE_PATH)
+        try:
+            body = b''.join([data async for data in self._body(reader, headers, CONNECT_TIMEOUT)])
+        finally:
+            writer.close()
+        return parse_channel_titles(body.decode('utf-8', 'replace'))
+
+    async def _listen(self):
+        if self.multiplexed:
+            # Titles are read on every connect, so renamed or moved channels are picked up
+            self.titles = await self._fetch_titles()
+            self.channels = match_channels(self.titles, self.cameras)
+        reader, writer, headers = await self._open(ATTACH_PATH)
+        self.connected = True
+        logging.info(f"Motion stream for {self.label} ({self.source.ip}) attached.")
+        try:
+            parser = SensePro_Multipart.MultipartParser(
+                SensePro_Multipart.boundary_from_content_type(headers.get('content-type', '')))
+            async for data in self._body(reader, headers, HEARTBEAT_TIMEOUT):
+                for event in parser.feed(data):
+                    edge = MOTION_EDGES.get(event.action) if event.code == 'VideoMotion' else None
+                    if edge is not None:
+                        camera_id = self.channels.get(event.index) if self.multiplexed else self.cameras[0].id
+                        if camera_id is not None:
+                            self.on_event(camera_id, edge)
+            raise StreamError("stream closed by the device")
+        finally:
+            self.connected = False
+            writer.close()
+
+    async def run(self):
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                error = f"no heartbeat for {HEARTBEAT_TIMEOUT}s"
+            except (OSError, EOFError, ValueError, StreamError) as e:  # StreamFormatError is a ValueError
+                error = str(e) or type(e).__name__
+            if time.monotonic() - started > RECONNECT_MAX_SECONDS:
+                attempt = 0  # The stream was up for a while; start the backoff again
+            delay = reconnect_delay(attempt)
+            attempt += 1
+            logging.warning(f"Motion stream for {self.label} ({self.source.ip}) lost ({error}); "
+                            f"reconnecting in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+
+# Streams to hold for a config: {key: (source, label, cameras, multiplexed)}
+def _wanted_streams(config):
+    wanted = {}
+    nvrs = {nvr.id: nvr for nvr in config.nvrs}
+    for camera in config.cameras:
+        if camera.pin is not None:
+            continue
+        if camera.nvr is None:
+            wanted[f'camera:{camera.id}'] = (camera, f'camera {camera.id}', (camera,), False)
+        else:
+            nvr = nvrs[camera.nvr]
+            _, _, cameras, _ = wanted.setdefault(f'nvr:{nvr.id}', (nvr, f'NVR {nvr.id}', [], True))
+            cameras.append(camera)
+    return {key: (source, label, tuple(cameras), multiplexed) for key, (source, label, cameras, multiplexed) in wanted.items()}
+
+
+class MotionStreams:
+    def __init__(self, user, password, on_motion):
+        self.user = user
+        self.password = password
+        self.on_motion = on_motion
+        self.streams = {}  # 'camera:<id>' or 'nvr:<id>' -> (MotionStream, task)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='SensePro-motion-streams', daemon=True)
+        self.thread.start()
+
+    def _on_event(self, camera_id, edge):
+        try:
+            self.on_motion(camera_id, edge)
+        except Exception as e:
+            logging.error(f"Error handling motion from camera {camera_id}: {e}")
+
+    def _update(self, config):
+        wanted = _wanted_streams(config)
+        for key, (stream, task) in list(self.streams.items()):
+            entry = wanted.get(key)
+            if entry is None or (entry[0].ip, entry[0].protocol) != (stream.source.ip, stream.source.protocol):
+                task.cancel()
+                del self.streams[key]
+                logging.info(f"Motion stream for {stream.label} ({stream.source.ip}) stopped.")
+            else:
+                stream.source = entry[0]
+                stream.set_cameras(entry[2])
+        for key, (source, label, cameras, multiplexed) in wanted.items():
+            if key not in self.streams:
+                stream = MotionStream(source, label, cameras, self.user, self.password, self._on_event, multiplexed)
+                self.streams[key] = (stream, self.loop.create_task(stream.run()))
+
+    # Hold the streams the pinless cameras of config need, stopping those no longer needed; thread safe
+    def update(self, config):
+        self.loop.call_soon_threadsafe(self._update, config)
+
+    def connected_count(self):
+        return sum(stream.connected for stream, _ in list(self.streams.values()))
+
+
+# Start watching the pinless cameras of config; on_motion(camera_id, edge) is called for each motion start and stop
+def start(config, user, password, on_motion):
+    streams = MotionStreams(user, password, on_motion)
+    streams.update(config)
+    wanted = _wanted_streams(config)
+    if wanted:
+        count = sum(len(cameras) for _, _, cameras, _ in wanted.values())
+        logging.info(f"Watching {count} camera(s) over {len(wanted)} eventManager motion stream(s).")
+    return streams
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# SensePro_Trace.py - Binary edge trace of every input, and offline replay through the engine.
+#
+# SensePro.py --trace PATH appends every input edge the engine sees to a trace: the device slot,
+# press or release, and the monotonic time in nanoseconds. Edges are recorded after fusion, so
+# a trace holds what the rules were given. The arm switch, the reset button and remote
+# arm/disarm/reset commands are recorded too, under the system keys, so a replay goes through
+# the same armed/disarmed states as the site did.
+#
+# Slots are only meaningful with the device list they were numbered by, so a slot table (the
+# device keys by slot, with the epoch and monotonic time it was written at) is written when a
+# run starts and again whenever a configuration reload renumbers the devices.
+#
+# Layout (little endian):
+#   header:     magic 'SPTR', version u16, 2 bytes padding
+#   edge:       monotonic ns i64, slot u16, edge u8 (0 release, 1 press)
+#   slot table: monotonic ns i64, key count u16, edge u8 = 2, then JSON length u32 and
+#               {"keys": [...], "epoch": seconds} as UTF-8
+#
+# Replay feeds a trace through SensePro_Engine with the runtime's arming, intrusion and disarm
+# behaviour, at 1x, Nx or full speed. Trigger windows use the recorded times whatever the
+# speed, so every speed gives the same intrusions. Outputs (camera alarms, NVR arm/disarm,
+# relay, LED device) go to a recording sink instead of the network and GPIO.
+#
+#   python3 SensePro_Trace.py info logs/incident.trace
+#   python3 SensePro_Trace.py replay logs/incident.trace --config config.json --outputs outputs.ndjson
+#   python3 SensePro_Trace.py replay logs/incident.trace --speed 0 --repeat 100
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import threading
+import SensePro_Config
+import SensePro_Engine
+import SensePro_Sources
+
+MAGIC = b'SPTR'
+VERSION = 1
+HEADER = struct.Struct('<4sHxx')
+RECORD = struct.Struct('<qHB')
+TABLE_LENGTH = struct.Struct('<I')
+
+EDGE_RELEASE = 0
+EDGE_PRESS = 1
+EDGE_SLOT_TABLE = 2
+
+# System inputs, numbered after the devices
+ARMED_KEY = 'system:armed'  # Armed at startup, without countdown
+RESUMED_KEY = 'system:resumed'  # Armed state of the previous run resumed at startup, windows kept
+ARM_KEY = 'system:arm'  # Arm switch or remote command: press arms, release disarms
+RESET_KEY = 'system:reset'  # Reset button held, or remote reset
+SYSTEM_KEYS = (ARMED_KEY, RESUMED_KEY, ARM_KEY, RESET_KEY)
+
+
+class TraceFormatError(ValueError):
+    pass
+
+
+class TraceWriter:
+    def __init__(self, path, slot_keys):
+        self.path = path
+        self.lock = threading.Lock()
+        self.records = 0
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.rekey(slot_keys)
+
+    # Start numbering by a new device list (a configuration reload)
+    def rekey(self, slot_keys):
+        keys = list(slot_keys) + list(SYSTEM_KEYS)
+        table = json.dumps({'keys': keys, 'epoch': time.time()}).encode()
+        with self.lock:
+            self.slots = {key: slot for slot, key in enumerate(keys)}
+            self.file.write(RECORD.pack(time.monotonic_ns(), len(keys), EDGE_SLOT_TABLE) + TABLE_LENGTH.pack(len(table)) + table)
+            self.file.flush()
+
+    # Record one edge; ts is the epoch time it was seen, or now
+    def record(self, key, edge, ts=None):
+        ns = time.monotonic_ns()
+        if ts is not None:
+            ns -= int((time.time() - ts) * 1e9)
+        with self.lock:
+            slot = self.slots.get(key)
+            if slot is None:
+                return
+            self.file.write(RECORD.pack(ns, slot, EDGE_PRESS if edge == SensePro_Sources.PRESS else EDGE_RELEASE))
+            self.file.flush()  # A trace is wanted most after a crash
+            self.records += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+# Write edges [(seconds, key, edge)] recorded elsewhere (a generator, another format) as a trace
+def write_trace(path, slot_keys, edges, epoch=None):
+    keys = list(slot_keys) + list(SYSTEM_KEYS)
+    slots = {key: slot for slot, key in enumerate(keys)}
+    table = json.dumps({'keys': keys, 'epoch': time.time() if epoch is None else epoch}).encode()
+    first = int(edges[0][0] * 1e9) if edges else 0
+    with open(path, 'wb') as trace_file:
+        trace_file.write(HEADER.pack(MAGIC, VERSION))
+        trace_file.write(RECORD.pack(first, len(keys), EDGE_SLOT_TABLE) + TABLE_LENGTH.pack(len(table)) + table)
+        trace_file.write(b''.join(RECORD.pack(int(ts * 1e9), slots[key], EDGE_PRESS if edge == SensePro_Sources.PRESS else EDGE_RELEASE)
+                                  for ts, key, edge in edges))
+
+
+def is_trace(path):
+    with open(path, 'rb') as trace_file:
+        return trace_file.read(len(MAGIC)) == MAGIC
+
+
+# Edges of a trace as [(ns, key, edge)] in recorded order, and its slot tables as [{"keys", "epoch", "ns"}].
+# The monotonic clock restarts with the machine; a run that starts earlier than the previous one
+# ended is moved to follow straight on from it.
+def read_trace(path):
+    with open(path, 'rb') as trace_file:
+        data = trace_file.read()
+    if len(data) < HEADER.size:
+        raise TraceFormatError(f"{path} is not an edge trace")
+    magic, version = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise TraceFormatError(f"{path} is not a version {VERSION} edge trace")
+
+    edges, tables = [], []
+    keys = ()
+    edge_names = (SensePro_Sources.RELEASE, SensePro_Sources.PRESS)
+    shift = last = 0
+    position = HEADER.size
+    end = len(data) - RECORD.size
+    while position <= end:
+        ns, slot, edge = RECORD.unpack_from(data, position)
+        position += RECORD.size
+        if edge == EDGE_SLOT_TABLE:
+            if position + TABLE_LENGTH.size > len(data):
+                break
+            length, = TABLE_LENGTH.unpack_from(data, position)
+            position += TABLE_LENGTH.size
+            if position + length > len(data):
+                break  # Cut short by a crash
+            table = json.loads(data[position:position + length])
+            position += length
+            if len(table['keys']) != slot:
+                raise TraceFormatError(f"slot table at byte {position - length} lists {len(table['keys'])} keys, expected {slot}")
+            if ns + shift < last:
+                shift = last - ns
+            keys = table['keys']
+            tables.append({'keys': keys, 'epoch': table['epoch'], 'ns': ns + shift})
+        elif edge <= EDGE_PRESS and slot < len(keys):
+            last = ns + shift
+            edges.append((last, keys[slot], edge_names[edge]))
+        else:
+            raise TraceFormatError(f"bad record at byte {position - RECORD.size}")
+    return edges, tables
+
+
+class TraceSource(SensePro_Sources.ReplaySource):
+    # Device edges only; the system inputs of the trace are not replayed into a running system
+    def read_events(self):
+        edges, _ = read_trace(self.path)
+        return [(ns / 1e9, key, edge) for ns, key, edge in edges if key not in SYSTEM_KEYS]
+
+
+class RecordingSink:
+    def __init__(self):
+        self.outputs = []  # (ts, output, target, action)
+        self.counts = {}
+
+    def output(self, ts, output, target, action):
+        self.outputs.append((ts, output, target, action))
+        self.counts[output] = self.counts.get(output, 0) + 1
+
+    # One JSON object per output, ts in seconds from start
+    def write(self, path, start=0.0):
+        with open(path, 'w') as outputs_file:
+            for ts, output, target, action in self.outputs:
+                outputs_file.write(json.dumps({'ts': round(ts - start, 6), 'output': output, 'target': target, 'action': action}) + '\n')
+
+
+class Replay:
+    # The runtime's input handling over one configuration: triggers are dropped during the
+    # arming countdown, an intrusion consumes its detectors, and arming, disarming and reset
+    # clear the trigger windows. Outputs are recorded on sink with the time they were due.
+    def __init__(self, config, sink):
+        self.config = config
+        self.sink = sink
+        self.state = SensePro_Engine.RuntimeState(config)
+        self.slots = {device.key: device.slot for device in config.devices}
+        self.armed = False
+        self.arming_until = None  # End of the arming countdown, while one runs
+        self.edges = 0
+        self.intrusions = 0
+        self.unknown = {}  # Keys not in the configuration -> edges skipped
+
+    # Continue on a reloaded configuration, keeping the trigger times of devices in both
+    def reconfigure(self, config):
+        self.state = self.state.carry_over(self.config, config)
+        self.config = config
+        self.slots = {device.key: device.slot for device in config.devices}
+
+    def feed(self, key, edge, ts):
+        self.edges += 1
+        if self.arming_until is not None and ts >= self.arming_until:
+            self._complete_arming()
+        slot = self.slots.get(key)
+        if slot is not None:
+            if edge == SensePro_Sources.PRESS and self.arming_until is None:
+                self._press(slot, ts)
+        elif key == ARM_KEY:
+            if edge == SensePro_Sources.PRESS:
+                self._arm(ts)
+            else:
+                self._disarm(ts)
+        elif key == RESET_KEY:
+            if edge == SensePro_Sources.PRESS:
+                self._reset(ts)
+        elif key == ARMED_KEY:
+            self._arm_immediately(ts)
+        elif key == RESUMED_KEY:
+            self.armed = True
+            self._led(ts, 'armed')
+        else:
+            self.unknown[key] = self.unknown.get(key, 0) + 1
+
+    def _press(self, slot, ts):
+        config = self.config
+        self.state.last_triggered[slot] = ts
+        intrusion = SensePro_Engine.find_confirmed_intrusion(config, self.state.last_triggered, ts)
+        if intrusion is None:
+            return
+        self.intrusions += 1
+        SensePro_Engine.consume_detectors(self.state, intrusion)
+        devices = [config.devices[slot].id for slot in intrusion.cameras + intrusion.detectors]
+        self.sink.output(ts, 'intrusion', intrusion.rule.name, devices)
+        for output, target in SensePro_Engine.intrusion_outputs(config, intrusion):
+            if output == 'camera':
+                self.sink.output(ts, 'camera', target.id, 'alarm')
+            elif output == 'relay':
+                self.sink.output(ts, 'relay', config.settings.relay_output_pin, target)
+            else:
+                self._led(ts, target)
+
+    def _led(self, ts, action):
+        pattern = self.config.led_patterns.get(action)
+        if pattern is not None:
+            self.sink.output(ts, 'led', pattern.ip, action)
+
+    def _nvrs(self, ts, mode):
+        for nvr in self.config.nvrs:
+            self.sink.output(ts, 'nvr', nvr.id, mode)
+
+    def _clear(self):
+        self.state.last_triggered[:] = [None] * self.config.slot_count
+
+    def _arm(self, ts):
+        if self.armed or self.arming_until is not None:
+            return
+        self.arming_until = ts + self.config.settings.countdown_duration
+        self._clear()
+        self._led(ts, 'arming')
+
+    def _arm_immediately(self, ts):
+        if self.armed:
+            return
+        self.armed = True
+        self.arming_until = None
+        self._clear()
+        self._nvrs(ts, 'arm')
+        self._led(ts, 'armed')
+
+    def _complete_arming(self):
+        ts, self.arming_until = self.arming_until, None
+        self.armed = True
+        self._nvrs(ts, 'arm')
+
+    # As begin_disarming: a disarm while already disarmed changes nothing, windows included
+    def _disarm(self, ts):
+        if not (self.armed or self.arming_until is not None):
+            return
+        self.armed = False
+        self.arming_until = None
+        self._clear()
+        self._nvrs(ts, 'disarm')
+        self._led(ts, 'disarm')
+
+    # As begin_reset: disarm if needed, and clear the windows either way
+    def _reset(self, ts):
+        self._disarm(ts)
+        self._clear()
+
+
+# Feed edges [(ns, key, edge)] into replay; speed 1 is real time, N is N times faster, 0 is as fast
+# as possible. Returns the seconds it took.
+def run_replay(replay, edges, speed=0.0):
+    started = time.perf_counter()
+    first = edges[0][0] if edges else 0
+    feed = replay.feed
+    for ns, key, edge in edges:
+        if speed:
+            delay = (ns - first) / 1e9 / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        feed(key, edge, ns / 1e9)
+    return time.perf_counter() - started
+
+
+def main():
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="Inspect a SensePro edge trace, or replay it through the engine.")
+    parser.add_argument("command", choices=["info", "replay"])
+    parser.add_argument("trace")
+    parser.add_argument("--config", default=os.path.join(script_dir, 'config.json'))
+    parser.add_argument("--speed", type=float, default=0.0, help="1 for real time, N for N times faster, 0 (default) for as fast as possible")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the trace this many times back to back")
+    parser.add_argument("--outputs", help="Write the recorded outputs to this JSON lines file")
+    args = parser.parse_args()
+
+    try:
+        edges, tables = read_trace(args.trace)
+    except (OSError, TraceFormatError) as e:
+        print(f"Cannot read trace: {e}")
+        sys.exit(1)
+
+    if args.command == "info":
+        counts = {}
+        for _, key, edge in edges:
+            counts.setdefault(key, [0, 0])[edge == SensePro_Sources.PRESS] += 1
+        duration = (edges[-1][0] - edges[0][0]) / 1e9 if edges else 0.0
+        print(f"{len(edges)} edges over {duration:.3f}s, {len(tables)} slot tables")
+        for table in tables:
+            print(f"  slot table of {len(table['keys'])} keys at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(table['epoch']))}")
+        for key, (releases, presses) in sorted(counts.items()):
+            print(f"  {key}: {presses} presses, {releases} releases")
+        return
+
+    try:
+        config = SensePro_Config.load_configuration(args.config, None, None, use_snapshot=False)
+    except (OSError, ValueError) as e:
+        print(f"Cannot load {args.config}: {e}")
+        sys.exit(1)
+
+    # Later passes start after every window and countdown of the one before has closed
+    if edges and args.repeat > 1:
+        gap = int((config.time_threshold + config.settings.countdown_duration + 1) * 1e9)
+        period = edges[-1][0] - edges[0][0] + gap
+        edges = [(ns + period * number, key, edge) for number in range(args.repeat) for ns, key, edge in edges]
+
+    sink = RecordingSink()
+    replay = Replay(config, sink)
+    elapsed = run_replay(replay, edges, args.speed)
+    if args.outputs:
+        sink.write(args.outputs, edges[0][0] / 1e9 if edges else 0.0)
+
+    outputs = ', '.join(f"{count} {output}" for output, count in sorted(sink.counts.items())) or "no outputs"
+    print(f"{replay.edges} edges, {replay.intrusions} intrusions: {outputs}")
+    for key, count in sorted(replay.unknown.items()):
+        print(f"  {count} edges of {key} skipped, not in {args.config}")
+    rate = replay.edges / elapsed if elapsed > 0 else 0.0
+    print(f"{elapsed:.3f}s at {f'{args.speed:g}x' if args.speed else 'full'} speed: {rate:,.0f} edges/s, {elapsed / max(replay.edges, 1) * 1e6:.2f} us/edge")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# SensePro_Traffic.py - Synthetic site traffic for load and scale testing of the rule engine.
+#
+# Reads a site from config.json, or from a server document (send_config.json) translated onto
+# the local config.json as the runtime does, optionally copies it N times over, and generates
+# input edges for it:
+#
+#   noise     Poisson background presses per device, each released after a short hold
+#   bursts    correlated presses of one rule's cameras and detectors within its time window:
+#             a camera and a detector for 'any', one device for 'one', every device for 'all',
+#             more than half for 'majority'
+#   walks     paths through 'sequence' rules, device after device in rule order; a share of
+#             them out of order, which must not confirm
+#   flapping  devices that toggle press/release many times a second for a while, as a failing
+#             contact or a camera stuck in motion does
+#
+# The edges are written as an edge trace (SensePro_Trace) or as JSON lines for --replay, or fed
+# straight into the engine through SensePro_Trace.Replay with outputs to a recording sink.
+#
+#   python3 SensePro_Traffic.py --scale 100 --duration 3600 --output site100.trace --write-config site100.json
+#   python3 SensePro_Traffic.py --site ../send_config.json --scale 10 --flapping 5
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import SensePro_Config
+import SensePro_Remote
+import SensePro_Sources
+import SensePro_Trace
+
+HOLD_SECONDS = (0.5, 3.0)  # Press to release of a single trigger
+FLAP_EPISODE_SECONDS = (2.0, 20.0)
+
+
+# Raw config.json dict of a site; a server document is translated onto base_path's site settings
+def load_site(path, base_path):
+    with open(path, 'r') as site_file:
+        raw = json.load(site_file)
+    if 'devices' in raw and 'system_settings' not in raw:
+        with open(base_path, 'r') as base_file:
+            raw = SensePro_Remote.translate_server_config(raw, json.load(base_file))
+    return raw
+
+
+# The site copied factor times: copy n has ' #n' appended to its device and rule names. Copied
+# cameras are watched over their streams and copied detectors get unused pin numbers, so the
+# result is only for the engine, not for a controller.
+def scale_site(raw, factor):
+    if factor <= 1:
+        return raw
+    pins = [info.get('pin') for section in ('ipcctv', 'detectors') for info in raw[section].values()]
+    next_pin = max([pin for pin in pins if isinstance(pin, int)], default=0) + 1
+    cameras, detectors, rules = {}, {}, []
+    for copy in range(factor):
+        suffix = f' #{copy + 1}' if copy else ''
+        for camera_id, camera_info in raw['ipcctv'].items():
+            camera = dict(camera_info)
+            if copy:
+                camera['pin'] = None
+                camera.pop('nvr', None)
+                camera.pop('channel', None)
+            cameras[camera_id + suffix] = camera
+        for detector_id, detector_info in raw['detectors'].items():
+            detector = dict(detector_info)
+            detector['associated_cameras'] = [name + suffix for name in detector_info.get('associated_cameras', [])]
+            if copy:
+                detector['pin'] = next_pin
+                next_pin += 1
+            detectors[str(detector_id) + suffix] = detector
+        for index, rule in enumerate(raw['rules']):
+            rule = dict(rule)
+            rule['name'] = rule.get('name', f'Rule {index + 1}') + suffix
+            rule['ipcctvs'] = [name + suffix for name in rule.get('ipcctvs', [])]
+            rule['detectors'] = [str(detector) + suffix for detector in rule.get('detectors', [])]
+            rules.append(rule)
+    scaled = dict(raw)
+    scaled['ipcctv'] = cameras
+    scaled['detectors'] = detectors
+    scaled['rules'] = rules
+    return scaled
+
+
+class TrafficGenerator:
+    def __init__(self, config, duration, seed=1):
+        self.config = config
+        self.duration = duration  # Seconds
+        self.random = random.Random(seed)
+        self.edges = []  # (seconds, key, edge)
+        self.counts = {}  # Kind of traffic -> presses generated
+
+    def _pulse(self, kind, key, ts, hold=None):
+        if hold is None:
+            hold = self.random.uniform(*HOLD_SECONDS)
+        self.edges.append((ts, key, SensePro_Sources.PRESS))
+        self.edges.append((ts + hold, key, SensePro_Sources.RELEASE))
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    # Start times of a Poisson process of rate events per hour over the duration
+    def _arrivals(self, rate):
+        times = []
+        if rate <= 0:
+            return times
+        ts = self.random.expovariate(rate / 3600)
+        while ts < self.duration:
+            times.append(ts)
+            ts += self.random.expovariate(rate / 3600)
+        return times
+
+    # rate presses per device per hour, devices picked uniformly
+    def noise(self, rate):
+        devices = self.config.devices
+        if not devices:
+            return
+        for ts in self._arrivals(rate * len(devices)):
+            self._pulse('noise', self.random.choice(devices).key, ts)
+
+    # rate bursts per 'any', 'one', 'all' and 'majority' rule per hour, spread over up to spread seconds
+    def bursts(self, rate, spread):
+        spread = min(spread, self.config.time_threshold)
+        for rule in self.config.rules:
+            if rule.type == 'sequence':
+                continue
+            if not (rule.cameras and rule.detectors if rule.type == 'any' else rule.cameras or rule.detectors):
+                logging.warning(f"Rule {rule.name} ({rule.type}) can never confirm with the devices it lists; no bursts for it.")
+                continue
+            for ts in self._arrivals(rate):
+                if rule.type == 'any':
+                    slots = [self.random.choice(rule.cameras), self.random.choice(rule.detectors)]
+                elif rule.type == 'one':
+                    slots = [self.random.choice(rule.cameras + rule.detectors)]
+                else:
+                    slots = list(rule.cameras + rule.detectors)
+                    if rule.type == 'majority':
+                        slots = self.random.sample(slots, len(slots) // 2 + 1)
+                for slot in slots:
+                    self._pulse('burst', self.config.devices[slot].key, ts + self.random.uniform(0, spread))
+
+    # rate walks per 'sequence' rule per hour: its cameras then its detectors, one after the other
+    # within spread seconds; a misordered share of them visit the devices in another order
+    def walks(self, rate, spread, misordered):
+        spread = min(spread, self.config.time_threshold)
+        for rule in self.config.rules:
+            path = list(rule.cameras + rule.detectors)
+            if rule.type != 'sequence' or not path:
+                continue
+            step = spread / len(path)
+            for ts in self._arrivals(rate):
+                walk = list(path)
+                if len(walk) > 1 and self.random.random() < misordered:
+                    while walk == path:
+                        self.random.shuffle(walk)
+                for slot in walk:
+                    ts += self.random.uniform(step / 4, step)
+                    self._pulse('walk', self.config.devices[slot].key, ts)
+
+    # count devices that flap at hz presses per second, in episodes per hour each
+    def flapping(self, count, hz, episodes):
+        devices = self.random.sample(self.config.devices, min(count, len(self.config.devices)))
+        half = 0.5 / hz
+        for device in devices:
+            for start in self._arrivals(episodes):
+                ts = start
+                end = min(start + self.random.uniform(*FLAP_EPISODE_SECONDS), self.duration)
+                while ts < end:
+                    self._pulse('flapping', device.key, ts, half * self.random.uniform(0.5, 1.0))
+                    ts += 2 * half * self.random.uniform(0.8, 1.2)
+
+    # Edges in time order
+    def sorted_edges(self):
+        self.edges.sort(key=lambda edge: edge[0])
+        return self.edges
+
+
+# JSON lines as the event uplink sends triggers, for SensePro.py --replay
+def write_event_file(path, edges, start):
+    with open(path, 'w') as event_file:
+        for ts, key, edge in edges:
+            kind, _, device_id = key.partition(':')
+            event_file.write(json.dumps({'ts': round(start + ts, 6), 'type': 'trigger', 'device': device_id, 'kind': kind, 'edge': edge}) + '\n')
+
+
+def main():
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="Generate synthetic SensePro site traffic.")
+    parser.add_argument("--site", default=os.path.join(script_dir, 'config.json'), help="config.json, or a server document such as send_config.json")
+    parser.add_argument("--base", default=os.path.join(script_dir, 'config.json'), help="Site settings a server document is translated onto")
+    parser.add_argument("--scale", type=int, default=1, help="Copy the site this many times over")
+    parser.add_argument("--duration", type=float, default=3600, help="Seconds of traffic")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--noise", type=float, default=6, help="Background presses per device per hour")
+    parser.add_argument("--bursts", type=float, default=2, help="Correlated bursts per rule per hour")
+    parser.add_argument("--walks", type=float, default=2, help="Walks per sequence rule per hour")
+    parser.add_argument("--misordered", type=float, default=0.2, help="Share of walks out of order")
+    parser.add_argument("--spread", type=float, default=20, help="Seconds a burst or walk is spread over")
+    parser.add_argument("--flapping", type=int, default=0, help="Number of flapping devices")
+    parser.add_argument("--flap-hz", type=float, default=10, help="Presses per second of a flapping device")
+    parser.add_argument("--flap-episodes", type=float, default=4, help="Flapping episodes per device per hour")
+    parser.add_argument("--output", help="Write the edges to this file: an edge trace, or JSON lines when it ends in .ndjson or .jsonl")
+    parser.add_argument("--write-config", help="Write the (scaled) site as a config.json here, for replaying the output")
+    parser.add_argument("--engine", action="store_true", help="Feed the edges into the engine (the default without --output)")
+    parser.add_argument("--speed", type=float, default=0.0, help="Engine feed speed: 1 for real time, N for N times faster, 0 for as fast as possible")
+    args = parser.parse_args()
+
+    try:
+        raw = scale_site(load_site(args.site, args.base), args.scale)
+        config = SensePro_Config.compile_configuration(raw, None, None)
+    except (OSError, ValueError) as e:
+        print(f"Cannot load {args.site}: {e}")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    generator = TrafficGenerator(config, args.duration, args.seed)
+    generator.noise(args.noise)
+    generator.bursts(args.bursts, args.spread)
+    generator.walks(args.walks, args.spread, args.misordered)
+    generator.flapping(args.flapping, args.flap_hz, args.flap_episodes)
+    edges = generator.sorted_edges()
+    elapsed = time.perf_counter() - started
+
+    kinds = ', '.join(f"{count} {kind}" for kind, count in sorted(generator.counts.items())) or "none"
+    print(f"{config.slot_count} devices, {len(config.rules)} rules: {len(edges)} edges over {args.duration:g}s "
+          f"({len(edges) / args.duration:.1f}/s), presses: {kinds}; generated in {elapsed:.2f}s")
+
+    if args.write_config:
+        with open(args.write_config, 'w') as config_file:
+            json.dump(raw, config_file, indent=2)
+    if args.output:
+        if args.output.endswith(('.ndjson', '.jsonl')):
+            write_event_file(args.output, edges, time.time())
+        else:
+            SensePro_Trace.write_trace(args.output, config.slot_keys, edges)
+        print(f"Wrote {args.output}")
+
+    if args.engine or not args.output:
+        sink = SensePro_Trace.RecordingSink()
+        replay = SensePro_Trace.Replay(config, sink)
+        elapsed = SensePro_Trace.run_replay(replay, [(int(ts * 1e9), key, edge) for ts, key, edge in edges], args.speed)
+        outputs = ', '.join(f"{count} {output}" for output, count in sorted(sink.counts.items())) or "no outputs"
+        rate = replay.edges / elapsed if elapsed > 0 else 0.0
+        print(f"Engine: {replay.intrusions} intrusions ({outputs}) in {elapsed:.3f}s: {rate:,.0f} edges/s, "
+              f"{elapsed / max(replay.edges, 1) * 1e6:.2f} us/edge")
+
+
+if __name__ == "__main__":
+    main()
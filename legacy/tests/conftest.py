@@ -0,0 +1,69 @@
+# Tests for the SensePro modules in legacy/; run from the repository root with
+#
+#   python3 -m pytest -q legacy/tests
+import os
+import sys
+
+import pytest
+
+LEGACY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPOSITORY_DIR = os.path.dirname(LEGACY_DIR)  # send_message.py, send_config.json
+sys.path[:0] = [LEGACY_DIR, REPOSITORY_DIR]
+
+import SensePro_Config  # noqa: E402
+import SensePro_Engine  # noqa: E402
+import SensePro_Sources  # noqa: E402
+import SensePro_Trace  # noqa: E402
+
+
+# A config.json document with cameras 'Camera 0' .. (no pin) and detectors '0' .. (pins 5 ..);
+# time_threshold is in minutes, as in config.json
+def site_document(rules, cameras=3, detectors=3, time_threshold=1):
+    return {
+        'system_settings': {'arm_disarm_pin': 27, 'countdown_duration': 0, 'relay_output_pin': 26, 'reset_button_pin': 25},
+        'NVRs': {},
+        'ipcctv': {f'Camera {number}': {'protocol': 'http', 'ip': f'10.0.0.{number + 1}', 'pin': None} for number in range(cameras)},
+        'detectors': {str(number): {'pin': 5 + number, 'name': f'Detector {number}', 'associated_cameras': []} for number in range(detectors)},
+        'time_threshold': time_threshold,
+        'rules': rules,
+        'LED_Pattern': {},
+    }
+
+
+# Rule names of the intrusions the runtime confirms for edges [(ts, key, edge)], following the
+# handlers in SensePro.py: arm_system_immediately and begin_disarming clear the windows only when
+# they change the armed state, begin_reset always does, and every press is evaluated as
+# record_trigger + check_for_confirmed_intrusion. Countdown arming (system:arm press) is not covered.
+def runtime_intrusions(config, edges):
+    state = SensePro_Engine.RuntimeState(config)
+    slots = {device.key: device.slot for device in config.devices}
+    armed, found = False, []
+    for ts, key, edge in edges:
+        if key in slots:
+            if edge == SensePro_Sources.PRESS:
+                state.last_triggered[slots[key]] = ts
+                intrusion = SensePro_Engine.find_confirmed_intrusion(config, state.last_triggered, ts)
+                if intrusion is not None:
+                    SensePro_Engine.consume_detectors(state, intrusion)
+                    found.append(intrusion.rule.name)
+        elif key == SensePro_Trace.ARMED_KEY:
+            if not armed:
+                armed = True
+                state.last_triggered[:] = [None] * config.slot_count
+        elif key == SensePro_Trace.ARM_KEY and edge == SensePro_Sources.RELEASE:
+            if armed:
+                armed = False
+                state.last_triggered[:] = [None] * config.slot_count
+        elif key == SensePro_Trace.RESET_KEY and edge == SensePro_Sources.PRESS:
+            armed = False
+            state.last_triggered[:] = [None] * config.slot_count
+        else:
+            raise ValueError(f"runtime_intrusions does not cover {key}")
+    return found
+
+
+@pytest.fixture
+def compile_site():
+    def compile_site(rules, **document):
+        return SensePro_Config.compile_configuration(site_document(rules, **document), None, None)
+    return compile_site
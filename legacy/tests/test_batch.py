@@ -0,0 +1,67 @@
+import pytest
+
+import SensePro_Config
+import SensePro_Engine
+import SensePro_Benchmark
+from test_engine import rule
+
+numpy = pytest.importorskip('numpy')
+SensePro_Batch = pytest.importorskip('SensePro_Batch')
+
+
+# Intrusions per site as rule indexes, one press at a time through SensePro_Engine
+def engine_intrusions(configs, presses):
+    expected = []
+    for config, site_presses in zip(configs, presses):
+        state = SensePro_Engine.RuntimeState(config)
+        rule_indexes = {id(rule): index for index, rule in enumerate(config.rules)}
+        site_found = []
+        for ts, slot in site_presses:
+            intrusion = SensePro_Benchmark._evaluate(config, state, slot, ts)
+            if intrusion is not None:
+                site_found.append(rule_indexes[id(intrusion.rule)])
+        expected.append(site_found)
+    return expected
+
+
+def test_synthetic_sites_match_the_engine():
+    configs = [SensePro_Config.compile_configuration(SensePro_Benchmark.synthetic_site(26, 10, seed), None, None)
+               for seed in range(1, 21)]
+    presses = [SensePro_Benchmark.synthetic_presses(config, 300, seed) for seed, config in enumerate(configs, 1)]
+    found, ticks = SensePro_Batch.run_presses(SensePro_Batch.BatchEvaluator(configs), presses)
+    assert ticks == max(map(len, presses))
+    assert found == engine_intrusions(configs, presses)
+    assert sum(map(len, found)) > 0
+
+
+# Every rule type, and sites of different sizes and thresholds side by side
+def test_every_rule_type_matches_the_engine(compile_site):
+    configs = [
+        compile_site([rule('sequence', cameras=[0, 1], detectors=[0]), rule('any', cameras=[2], detectors=[1])]),
+        compile_site([rule('majority', cameras=[0, 1], detectors=[0, 1])], cameras=2, detectors=2),
+        compile_site([rule('all', cameras=[0], detectors=[0, 1, 2]), rule('one', detectors=[3])], detectors=4, time_threshold=2),
+    ]
+    presses = []
+    for number, config in enumerate(configs):
+        slots = [device.slot for device in config.devices]
+        # In order, out of order, then spread beyond the threshold
+        presses.append([(10.0 * tick + number, slots[tick % len(slots)]) for tick in range(12)]
+                       + [(200.0 + tick, slot) for tick, slot in enumerate(reversed(slots))]
+                       + [(400.0 + 70.0 * tick, slot) for tick, slot in enumerate(slots)])
+    found, _ = SensePro_Batch.run_presses(SensePro_Batch.BatchEvaluator(configs), presses)
+    assert found == engine_intrusions(configs, presses)
+    assert all(found)
+
+
+def test_intrusion_lists_the_recent_devices_of_the_rule(compile_site):
+    config = compile_site([rule('any', cameras=[0, 1], detectors=[0])])
+    evaluator = SensePro_Batch.BatchEvaluator([config])
+    slots = {device.key: device.slot for device in config.devices}
+    sites = numpy.array([0], numpy.intp)
+    evaluator.record(sites, [slots['camera:Camera 1']], numpy.array([100.0]))
+    evaluator.record(sites, [slots['detector:0']], numpy.array([101.0]))
+    intrusion = evaluator.intrusion(0, 0, 101.0)
+    assert intrusion.cameras == [slots['camera:Camera 1']] and intrusion.detectors == [slots['detector:0']]
+
+    assert list(evaluator.step(numpy.array([101.0]), sites)[1]) == [0]
+    assert list(evaluator.step(numpy.array([101.0]), sites)[1]) == []  # The detector was consumed
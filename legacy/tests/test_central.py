@@ -0,0 +1,90 @@
+import json
+import threading
+
+import SensePro_Config
+import SensePro_Sources
+import SensePro_Central
+from conftest import runtime_intrusions, site_document
+from test_engine import rule
+
+
+def evaluate(sites_dir, batches, workers):
+    results, lock = {}, threading.Lock()
+
+    def on_result(site_id, token, intrusions):
+        with lock:
+            assert token not in results  # One result per dispatched batch
+            results[token] = intrusions
+    service = SensePro_Central.CentralService(sites_dir, None, workers, on_result)
+    service.start()
+    for token, (site_id, body) in enumerate(batches):
+        service.dispatch(site_id, body, token)
+    totals = service.stop()
+    assert sorted(results) == list(range(len(batches)))
+    return [intrusion for token in sorted(results) for intrusion in results[token]], totals
+
+
+def by_site(intrusions):
+    return sorted(intrusions, key=lambda intrusion: (intrusion['site'], intrusion['ts']))
+
+
+def test_sharded_intrusions_match_an_in_process_replay(tmp_path):
+    batches, events, expected = SensePro_Central.benchmark_sites(str(tmp_path), 6, 12, 4, 200, 1)
+    assert expected > 0
+
+    shard = SensePro_Central.Shard(0, str(tmp_path))
+    in_process = [intrusion for site_id, body in batches for intrusion in shard.handle(site_id, body)]
+    assert len(in_process) == expected
+
+    found, totals = evaluate(str(tmp_path), batches, workers=2)
+    assert by_site(found) == by_site(in_process)
+    assert totals['events'] == events
+    assert totals['sites'] == 6 and totals['failed'] == 0
+
+
+def test_a_redelivered_batch_is_not_evaluated_twice(tmp_path):
+    batches, events, expected = SensePro_Central.benchmark_sites(str(tmp_path), 2, 12, 4, 200, 2)
+    found, totals = evaluate(str(tmp_path), batches + batches, workers=2)
+    assert len(found) == expected
+    assert totals['duplicates'] == len(batches) and totals['events'] == events
+
+
+def test_a_site_without_a_usable_config_is_skipped(tmp_path):
+    batches, events, expected = SensePro_Central.benchmark_sites(str(tmp_path), 2, 12, 4, 200, 3)
+    (tmp_path / 'site-00001.json').write_text('{"not": "a config"')
+    found, totals = evaluate(str(tmp_path), batches, workers=2)
+    assert {intrusion['site'] for intrusion in found} <= {'site-00000'}
+    assert totals['skipped'] > 0 and totals['failed'] == 0
+
+
+# The uplink lines of batches [(site id, body)] of one site as edges [(ts, key, edge)]
+def site_edges(batches, site_id):
+    edges = []
+    for batch_site, body in batches:
+        if batch_site != site_id:
+            continue
+        for line in body.splitlines():
+            event = json.loads(line)
+            if event['type'] == 'trigger':
+                edges.append((event['ts'], f"{event['kind']}:{event['device']}", event.get('edge', SensePro_Sources.PRESS)))
+            else:
+                edges.append((event['ts'], *SensePro_Central.SYSTEM_EVENTS[event['type']]))
+    return edges
+
+
+def test_sharded_intrusions_match_the_runtime(tmp_path):
+    batches, events, expected = SensePro_Central.benchmark_sites(str(tmp_path), 4, 12, 4, 200, 4)
+    idle = site_document([rule('any', cameras=[0], detectors=[0])])
+    (tmp_path / 'site-idle.json').write_text(json.dumps(idle))
+    lines = [{'ts': 100.0, 'type': 'trigger', 'device': 'Camera 0', 'kind': 'camera'},
+             {'ts': 101.0, 'type': 'disarmed'},  # Never armed: the controller's windows stay
+             {'ts': 102.0, 'type': 'trigger', 'device': '0', 'kind': 'detector'}]
+    batches.append(('site-idle', '\n'.join(map(json.dumps, lines)).encode()))
+
+    found, totals = evaluate(str(tmp_path), batches, workers=2)
+    assert totals['failed'] == 0
+    for site_id in sorted({site_id for site_id, _ in batches}):
+        config = SensePro_Config.load_configuration(str(tmp_path / f'{site_id}.json'), None, None, use_snapshot=False)
+        rules = [intrusion['rule'] for intrusion in by_site(found) if intrusion['site'] == site_id]
+        assert rules == runtime_intrusions(config, site_edges(batches, site_id))
+    assert [intrusion['rule'] for intrusion in found if intrusion['site'] == 'site-idle'] == ['any']
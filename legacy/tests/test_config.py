@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+import SensePro_Config
+from conftest import site_document
+
+
+def test_verify_defaults_to_true_and_survives_the_snapshot(tmp_path):
+    document = site_document([])
+    document['ipcctv']['Camera 1'].update(protocol='https', verify=False)
+    document['ipcctv']['Camera 2'].update(protocol='https', verify='/etc/sensepro/dahua-ca.pem')
+    document['NVRs']['NVR A'] = {'ip': '10.0.1.1', 'protocol': 'https', 'verify': False,
+                                 'arm': {'input': 'Alarm[0].SensorType', 'relay': 'NO'},
+                                 'disarm': {'input': 'Alarm[0].SensorType', 'relay': 'NC'}}
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(document))
+
+    compiled = SensePro_Config.load_configuration(str(path), 'user', 'password')
+    snapshotted = SensePro_Config.load_configuration(str(path), 'user', 'password')  # From config.json.snapshot
+    for config in (compiled, snapshotted):
+        assert [camera.verify for camera in config.cameras] == [True, False, '/etc/sensepro/dahua-ca.pem']
+        assert config.nvrs[0].verify is False
+
+
+@pytest.mark.parametrize('verify', ['', 0, None, ['ca.pem']])
+def test_invalid_verify_is_rejected(verify):
+    document = site_document([])
+    document['ipcctv']['Camera 0']['verify'] = verify
+    with pytest.raises(SensePro_Config.ConfigError, match="camera 'Camera 0' has invalid verify"):
+        SensePro_Config.compile_configuration(document, None, None)
+
+
+@pytest.mark.parametrize('time_threshold', [True, False, '1', 0, -1])
+def test_invalid_time_threshold_is_rejected(time_threshold):
+    with pytest.raises(SensePro_Config.ConfigError, match='invalid time_threshold'):
+        SensePro_Config.compile_configuration(site_document([], time_threshold=time_threshold), None, None)
+
+
+@pytest.mark.parametrize('entry', ['Rule 1', ['any', 'Camera 0'], None])
+def test_a_rule_that_is_not_an_object_is_rejected(entry):
+    document = site_document([{'name': 'Rule 0', 'type': 'one', 'ipcctvs': ['Camera 0'], 'detectors': []}, entry])
+    with pytest.raises(SensePro_Config.ConfigError, match=r'rule #1 is not an object') as raised:
+        SensePro_Config.compile_configuration(document, None, None)
+    assert len(raised.value.errors) == 1
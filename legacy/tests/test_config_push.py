@@ -0,0 +1,107 @@
+import copy
+import json
+import os
+import random
+
+import pytest
+
+import SensePro_Remote
+from conftest import REPOSITORY_DIR
+
+send_message = pytest.importorskip('send_message')  # Needs pika
+
+
+@pytest.fixture
+def document():
+    with open(os.path.join(REPOSITORY_DIR, 'send_config.json')) as config_file:
+        return json.load(config_file)
+
+
+# Random edits of a server document: renamed, moved, added and removed devices and rules
+def edited(document, seed):
+    randomizer = random.Random(seed)
+    document = copy.deepcopy(document)
+    devices = document['devices']
+    for _ in range(randomizer.randint(1, 5)):
+        action = randomizer.choice(('rename', 'pin', 'add', 'remove', 'rule'))
+        if action == 'rename' and devices:
+            randomizer.choice(devices)['name'] = f'Device {randomizer.randint(100, 999)} ~/ "quoted"'
+        elif action == 'pin' and devices:
+            randomizer.choice(devices)['pin'] = randomizer.choice([None, 5.0, 6, True])
+        elif action == 'add':
+            devices.insert(randomizer.randint(0, len(devices)), dict(copy.deepcopy(devices[0]), id=f'new-{seed}-{len(devices)}'))
+        elif action == 'remove' and devices:
+            devices.pop(randomizer.randrange(len(devices)))
+        elif action == 'rule' and document['rules']:
+            document['rules'].pop()
+    return document
+
+
+def test_content_hash_matches_on_both_sides(document):
+    assert send_message.content_hash(document) == SensePro_Remote.content_hash(document)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_a_delta_applies_to_the_new_document(document, seed):
+    new = edited(document, seed)
+    patched = SensePro_Remote.apply_patch(document, send_message.make_patch(document, new))
+    assert patched == new
+    assert SensePro_Remote.content_hash(patched) == send_message.content_hash(new)  # Types kept: 5.0 is not 5
+
+
+def test_make_patch_of_an_unchanged_document_is_empty(document):
+    assert send_message.make_patch(document, copy.deepcopy(document)) == []
+
+
+@pytest.mark.parametrize('seed', [None] + list(range(10)))
+def test_the_compact_form_decodes_to_an_equal_document(document, seed):
+    source = document if seed is None else edited(document, seed)
+    compact = send_message.encode_compact(source)
+    decoded = SensePro_Remote.decode_compact(json.loads(json.dumps(compact)))
+    assert decoded == source
+    assert list(decoded) == list(source)  # Key order too, so the versions agree
+    assert len(compact['devices']) <= len(source['devices']) + len(source.get('devicesAllowedInRules', []))
+
+
+def test_compact_rejects_an_unknown_format(document):
+    compact = dict(send_message.encode_compact(document), format=99)
+    with pytest.raises(ValueError):
+        SensePro_Remote.decode_compact(compact)
+
+
+def test_the_msgpack_encoding_decodes_to_the_same_message(document):
+    pytest.importorskip('msgpack')
+    message = {'type': 'full', 'version': send_message.content_hash(document), 'compact': send_message.encode_compact(document)}
+    body, content_type = send_message.encode_message(message, binary=True)
+    assert SensePro_Remote.decode_body(body, content_type) == json.loads(json.dumps(message))
+
+
+def test_full_then_delta_pushes_reach_the_controller(document, tmp_path):
+    applied = []
+    consumer = SensePro_Remote.ConfigConsumer('serial', lambda config, version: applied.append(version), str(tmp_path / 'document.json'))
+    state = {}
+
+    def push(config):
+        message = send_message.build_message(state, 'serial', config)
+        send_message.remember_sent(state, 'serial', message['version'], config)
+        body, content_type = send_message.encode_message(message)
+        status = consumer.handle(body, content_type)
+        send_message.process_status(state, status)
+        return message['type'], status['status']
+
+    assert push(document) == ('full', 'applied')
+    assert push(edited(document, 1)) == ('delta', 'applied')
+    assert applied == [send_message.content_hash(document), send_message.content_hash(edited(document, 1))]
+    assert send_message.build_message(state, 'serial', edited(document, 1)) is None  # Nothing to send
+
+
+def test_a_delta_against_another_base_asks_for_the_full_document(document, tmp_path):
+    consumer = SensePro_Remote.ConfigConsumer('serial', lambda config, version: None, str(tmp_path / 'document.json'))
+    delta = {'type': 'delta', 'base': 'not-the-applied-version', 'version': send_message.content_hash(document),
+             'patch': []}
+    status = consumer.handle(json.dumps(delta).encode())
+    assert status['status'] == 'mismatch'
+
+    state = {}
+    send_message.process_status(state, status)
+    assert send_message.build_message(state, 'serial', document)['type'] == 'full'
@@ -0,0 +1,71 @@
+import SensePro_Engine
+
+
+def rule(rule_type, cameras=(), detectors=()):
+    return {'name': rule_type, 'type': rule_type, 'ipcctvs': [f'Camera {number}' for number in cameras],
+            'detectors': [str(number) for number in detectors]}
+
+
+# The intrusion found at now after each device (key 'camera:Camera 0', 'detector:1', ...) fired at its time
+def confirm(config, triggers, now=100.0):
+    state = SensePro_Engine.RuntimeState(config)
+    slots = {device.key: device.slot for device in config.devices}
+    for key, ts in triggers.items():
+        state.last_triggered[slots[key]] = ts
+    return SensePro_Engine.find_confirmed_intrusion(config, state.last_triggered, now)
+
+
+def test_any_needs_a_camera_and_a_detector(compile_site):
+    config = compile_site([rule('any', cameras=[0, 1], detectors=[0, 1])])
+    assert confirm(config, {'camera:Camera 0': 99.0}) is None
+    assert confirm(config, {'detector:0': 99.0}) is None
+    intrusion = confirm(config, {'camera:Camera 1': 99.0, 'detector:0': 99.5})
+    assert intrusion is not None and len(intrusion.cameras) == 1 and len(intrusion.detectors) == 1
+
+
+def test_one_fires_on_a_single_device(compile_site):
+    config = compile_site([rule('one', cameras=[0, 1])])
+    assert confirm(config, {'camera:Camera 1': 99.0}) is not None
+    assert confirm(config, {'camera:Camera 2': 99.0}) is None
+
+
+def test_triggers_older_than_the_threshold_do_not_count(compile_site):
+    config = compile_site([rule('one', cameras=[0])], time_threshold=1)  # One minute
+    assert confirm(config, {'camera:Camera 0': 39.0}) is None
+    assert confirm(config, {'camera:Camera 0': 40.0}) is not None
+
+
+# Until majority and sequence rules were evaluated, both were accepted by the config and never confirmed
+def test_majority_needs_more_than_half_of_the_devices(compile_site):
+    config = compile_site([rule('majority', cameras=[0, 1], detectors=[0, 1])])
+    assert confirm(config, {'camera:Camera 0': 99.0, 'detector:0': 99.0}) is None  # Half is not a majority
+    intrusion = confirm(config, {'camera:Camera 0': 99.0, 'camera:Camera 1': 99.0, 'detector:1': 99.0})
+    assert intrusion is not None and intrusion.rule.type == 'majority'
+
+
+def test_sequence_needs_every_device_in_the_listed_order(compile_site):
+    config = compile_site([rule('sequence', cameras=[0, 1], detectors=[0])])
+    in_order = {'camera:Camera 0': 95.0, 'camera:Camera 1': 96.0, 'detector:0': 97.0}
+    assert confirm(config, in_order) is not None
+    assert confirm(config, {**in_order, 'camera:Camera 1': 94.0}) is None  # Out of order
+    assert confirm(config, {'camera:Camera 0': 95.0, 'camera:Camera 1': 96.0}) is None  # Detector missing
+    assert confirm(config, {**in_order, 'detector:0': 96.0}) is not None  # Equal times are in order
+
+
+def test_the_first_confirmed_rule_wins(compile_site):
+    config = compile_site([rule('all', cameras=[0], detectors=[0]), rule('one', cameras=[0]), rule('majority', cameras=[0])])
+    assert confirm(config, {'camera:Camera 0': 99.0}).rule.type == 'one'
+    assert confirm(config, {'camera:Camera 0': 99.0, 'detector:0': 99.0}).rule.type == 'all'
+
+
+def test_an_intrusion_consumes_its_detectors(compile_site):
+    config = compile_site([rule('any', cameras=[0], detectors=[0, 1])])
+    state = SensePro_Engine.RuntimeState(config)
+    slots = {device.key: device.slot for device in config.devices}
+    for key in ('camera:Camera 0', 'detector:0', 'detector:1'):
+        state.last_triggered[slots[key]] = 99.0
+    intrusion = SensePro_Engine.find_confirmed_intrusion(config, state.last_triggered, 100.0)
+    SensePro_Engine.consume_detectors(state, intrusion)
+    assert state.last_triggered[slots['camera:Camera 0']] == 99.0
+    assert state.last_triggered[slots['detector:0']] is None and state.last_triggered[slots['detector:1']] is None
+    assert SensePro_Engine.find_confirmed_intrusion(config, state.last_triggered, 100.0) is None
@@ -0,0 +1,29 @@
+import json
+
+import SensePro_Remote
+
+
+def spooled(uplink):
+    records, _ = uplink.spool.read_batch(100)
+    return [json.loads(record) for record in records]
+
+
+def test_events_are_spooled_without_pika(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(SensePro_Remote, 'pika', None)
+    monkeypatch.setenv('RASPBERRY_PI_SERIAL', 'serial')
+    uplink = SensePro_Remote.start_event_uplink(str(tmp_path))
+    uplink.publish('armed', ts=1.0)
+    assert uplink.thread is None
+    assert spooled(uplink) == [{'ts': 1.0, 'type': 'armed'}]
+    assert 'queued' in caplog.text
+
+
+def test_events_are_spooled_without_a_serial(tmp_path, monkeypatch):
+    monkeypatch.setattr(SensePro_Remote, 'controller_serial', lambda: None)
+    uplink = SensePro_Remote.start_event_uplink(str(tmp_path))
+    uplink.publish('trigger', device='0', kind='detector', ts=2.0)
+    uplink.spool.close()
+
+    reopened = SensePro_Remote.SensePro_Spool.Spool(str(tmp_path))  # Still there after a restart
+    records, _ = reopened.read_batch(100)
+    assert [json.loads(record) for record in records] == [{'ts': 2.0, 'type': 'trigger', 'device': '0', 'kind': 'detector'}]
@@ -0,0 +1,55 @@
+import SensePro_Engine
+import SensePro_Sources
+from test_engine import rule
+
+PRESS = SensePro_Sources.PRESS
+
+
+# Fusion in front of the rules as SensePro.py wires it: an accepted press is recorded and
+# evaluated (record_trigger, check_for_confirmed_intrusion), an earlier duplicate moves the
+# trigger back and is evaluated again (keep_earliest_trigger)
+class Runtime:
+    def __init__(self, config, window=1.0):
+        self.config = config
+        self.state = SensePro_Engine.RuntimeState(config)
+        self.slots = {device.key: device.slot for device in config.devices}
+        self.fusion = SensePro_Sources.Fusion(window, self.keep_earliest_trigger)
+        self.intrusions = []
+
+    def handle(self, key, source, ts):
+        event = SensePro_Sources.InputEvent(key, PRESS, source, ts)
+        if self.fusion.accept(event):
+            self.state.last_triggered[self.slots[key]] = ts
+            self.check(ts)
+
+    def keep_earliest_trigger(self, key, ts):
+        slot = self.slots[key]
+        if self.state.last_triggered[slot] is None or self.state.last_triggered[slot] <= ts:
+            return
+        self.state.last_triggered[slot] = ts
+        self.check(ts)
+
+    def check(self, now):
+        intrusion = SensePro_Engine.find_confirmed_intrusion(self.config, self.state.last_triggered, now)
+        if intrusion is not None:
+            SensePro_Engine.consume_detectors(self.state, intrusion)
+            self.intrusions.append(intrusion.rule.name)
+
+
+def test_an_earlier_duplicate_completes_a_sequence(compile_site):
+    runtime = Runtime(compile_site([rule('sequence', cameras=[0], detectors=[0])]))
+    runtime.handle('detector:0', 'gpio', 100.0)
+    runtime.handle('camera:Camera 0', 'gpio', 100.5)  # Out of order as far as the rules know
+    assert runtime.intrusions == []
+    runtime.handle('camera:Camera 0', 'stream', 99.8)  # The stream saw the camera first
+    assert runtime.intrusions == ['sequence']
+    assert runtime.fusion.duplicates == 1
+
+
+def test_a_later_duplicate_changes_nothing(compile_site):
+    runtime = Runtime(compile_site([rule('sequence', cameras=[0], detectors=[0])]))
+    runtime.handle('detector:0', 'gpio', 100.0)
+    runtime.handle('camera:Camera 0', 'gpio', 100.5)
+    runtime.handle('camera:Camera 0', 'stream', 100.9)
+    assert runtime.intrusions == []
+    assert runtime.state.last_triggered[runtime.slots['camera:Camera 0']] == 100.5
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import SensePro_LogImport
+
+LOG = (
+    "19/10/2026 18:00:01 - INFO - \033[41m\033[1m\033[37mSystem armed immediately at startup.\033[0m\n"
+    "19/10/2026 18:00:02 - DEBUG - Rule Harness (any): triggered IPCCTVs ['IPC 5 - CCTV'], detectors ['1']\n"
+    "19/10/2026 18:05:10 - INFO - \033[30m\033[46mIPC 5 - CCTV - 10.0.0.5 triggered\033[0m\n"
+    "19/10/2026 18:05:11 - INFO - \033[30m\033[43mDetector Back Door triggered\033[0m\n"
+    "19/10/2026 18:05:11 - INFO - \033[41m\033[1m\033[37mConfirmed intrusion detected by rule: Rule 1\033[0m\n"
+    "  a continuation line, e.g. of a traceback\n"
+    "19/10/2026 18:59:59 - ERROR - Unable to communicate with NVR at 10.0.1.1:8080. Retrying in 5 seconds...\n"
+    "19/10/2026 19:00:00 - INFO - Sending disarm command to LED device at 10.0.2.1\n"
+    "19/10/2026 19:00:00 - INFO - System disarmed.\n"
+)
+
+
+def epoch(text):
+    return int(datetime.strptime(text, '%d/%m/%Y %H:%M:%S').timestamp())
+
+
+def test_classify_recognises_every_event_kind():
+    classify = SensePro_LogImport.classify
+    assert classify(b'INFO', b'IPC 5 - CCTV - 10.0.0.5:8080 triggered') == (SensePro_LogImport.CAMERA_TRIGGER, b'IPC 5 - CCTV')
+    assert classify(b'INFO', b'Detector 3 triggered') == (SensePro_LogImport.DETECTOR_TRIGGER, b'3')
+    assert classify(b'INFO', b'Confirmed intrusion detected by rule: Perimeter') == (SensePro_LogImport.INTRUSION, b'Perimeter')
+    assert classify(b'INFO', b'System armed.') == (SensePro_LogImport.ARM, None)
+    assert classify(b'INFO', b'System disarmed.') == (SensePro_LogImport.DISARM, None)
+    assert classify(b'ERROR', b'Error setting NVR at 10.0.1.1 alarm state') == (SensePro_LogImport.NVR_ERROR, b'10.0.1.1')
+    assert classify(b'INFO', b'NVR at 10.0.1.1 answered') is None  # Only errors count
+    assert classify(b'INFO', b'Sending armed command to LED device at 10.0.2.1') is None
+
+
+def test_import_and_load_round_trip(tmp_path):
+    log_path = tmp_path / 'SensePro_19-10-2026_18-00-00.log'
+    log_path.write_bytes(LOG.encode())
+    archive = tmp_path / 'archive'
+
+    writer = SensePro_LogImport.ArchiveWriter(str(archive))
+    assert SensePro_LogImport.import_file(str(log_path), writer) == len(LOG.encode())
+    writer.close([str(log_path)])
+    columns = SensePro_LogImport.load_archive(str(archive))
+
+    kinds = [SensePro_LogImport.KINDS[kind] for kind in columns['kind']]
+    assert kinds == ['arm', 'camera_trigger', 'detector_trigger', 'intrusion', 'nvr_error', 'disarm']
+    subjects = [columns['strings'][index] if index >= 0 else None for index in columns['subject']]
+    assert subjects == [None, 'IPC 5 - CCTV', 'Back Door', 'Rule 1', '10.0.1.1:8080', None]
+    assert list(columns['ts']) == [epoch('19/10/2026 18:00:01'), epoch('19/10/2026 18:05:10'), epoch('19/10/2026 18:05:11'),
+                                   epoch('19/10/2026 18:05:11'), epoch('19/10/2026 18:59:59'), epoch('19/10/2026 19:00:00')]
+    assert columns['meta']['rows'] == 6
+
+
+def test_log_files_sort_by_the_time_in_their_name(tmp_path):
+    for name in ('SensePro_02-01-2026_08-00-00.log', 'SensePro_31-12-2025_23-59-59.log', 'SensePro_01-01-2026_10-00-00.log'):
+        (tmp_path / name).write_text('')
+    found = [path.rsplit('/', 1)[-1] for path in SensePro_LogImport.find_log_files([str(tmp_path)])]
+    assert found == ['SensePro_31-12-2025_23-59-59.log', 'SensePro_01-01-2026_10-00-00.log', 'SensePro_02-01-2026_08-00-00.log']
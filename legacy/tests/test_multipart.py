@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+import SensePro_Multipart
+
+
+def fields(events):
+    return [(event.code, event.action, event.index, event.data) for event in events]
+
+
+def expected(count, channels=1, data_every=0):
+    data = b'{\n   "RegionName" : [ "Region1" ]\n}'
+    return [('VideoMotion', 'Start' if number % 2 == 0 else 'Stop', number % channels,
+             data if data_every and number % data_every == 0 else None) for number in range(count)]
+
+
+def feed_in_reads(parser, stream, sizes):
+    events, offset = [], 0
+    for size in sizes:
+        events.extend(parser.feed(stream[offset:offset + size]))
+        offset += size
+    events.extend(parser.feed(stream[offset:]))
+    return events
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 7, 13, 1460, 1 << 20])
+def test_events_are_the_same_however_the_stream_is_split(read_size):
+    stream = SensePro_Multipart.synthetic_stream(200, channels=4, data_every=3)
+    parser = SensePro_Multipart.MultipartParser()
+    events = feed_in_reads(parser, stream, [read_size] * (len(stream) // read_size))
+    assert fields(events) == expected(200, channels=4, data_every=3)
+    assert parser.heartbeats == 40
+    assert len(parser.carry) < len(parser.delimiter)  # At most the start of a next delimiter
+
+
+def test_random_reads_and_memoryview_chunks():
+    stream = SensePro_Multipart.synthetic_stream(500, channels=32, data_every=7)
+    randomizer = random.Random(1)
+    parser = SensePro_Multipart.MultipartParser()
+    events, offset = [], 0
+    while offset < len(stream):
+        size = randomizer.randint(1, 300)
+        events.extend(parser.feed(memoryview(stream)[offset:offset + size]))
+        offset += size
+    assert fields(events) == expected(500, channels=32, data_every=7)
+
+
+def test_parts_without_content_length_and_other_field_orders():
+    stream = (b'--myboundary\r\nContent-Type: text/plain\r\n\r\n'
+              b'Code=VideoMotion;action=Start;index=2\r\nCode=AlarmLocal;index=1;action=Pulse\r\n'
+              b'--myboundary\r\nContent-Type: text/plain\r\n\r\nCode=VideoLoss\r\n'
+              b'--myboundary\r\n')
+    events = SensePro_Multipart.MultipartParser().feed(stream)
+    assert fields(events) == [('VideoMotion', 'Start', 2, None), ('AlarmLocal', 'Pulse', 1, None), ('VideoLoss', None, -1, None)]
+
+
+def test_a_custom_boundary_from_the_content_type():
+    boundary = SensePro_Multipart.boundary_from_content_type('multipart/x-mixed-replace; boundary="other"')
+    assert boundary == b'other'
+    stream = SensePro_Multipart.synthetic_stream(10, boundary=boundary)
+    assert fields(SensePro_Multipart.MultipartParser(boundary).feed(stream)) == expected(10)
+    assert SensePro_Multipart.boundary_from_content_type('text/plain') == SensePro_Multipart.DEFAULT_BOUNDARY
+
+
+def test_an_oversized_part_is_rejected():
+    parser = SensePro_Multipart.MultipartParser()
+    with pytest.raises(SensePro_Multipart.StreamFormatError):
+        parser.feed(b'--myboundary\r\nContent-Length: %d\r\n\r\n' % (SensePro_Multipart.MAX_PART_BYTES + 1))
+    parser = SensePro_Multipart.MultipartParser()
+    with pytest.raises(SensePro_Multipart.StreamFormatError):
+        parser.feed(b'--myboundary\r\nContent-Type: text/plain\r\n\r\n' + b'x' * (SensePro_Multipart.MAX_PART_BYTES + 1))
@@ -0,0 +1,35 @@
+import sys
+import importlib
+import tracemalloc
+
+import SensePro_Profiler
+
+FILTERED = (tracemalloc.__file__, '<frozen importlib._bootstrap>')
+
+
+def test_the_baseline_and_the_diff_leave_out_tracemalloc_and_imports(tmp_path, monkeypatch):
+    monkeypatch.setattr(SensePro_Profiler, '_logs_dir', str(tmp_path))
+    assert not tracemalloc.is_tracing()
+    start = tracemalloc.start
+
+    def start_while_importing(frames):  # Another thread imports as tracing starts
+        start(frames)
+        monkeypatch.delitem(sys.modules, 'json.tool', raising=False)
+        importlib.import_module('json.tool')
+    monkeypatch.setattr(tracemalloc, 'start', start_while_importing)
+    try:
+        assert SensePro_Profiler.write_tracemalloc_diff() is None
+        baseline = SensePro_Profiler._last_snapshot
+        grown = [bytearray(1000) for _ in range(1000)]
+        path = SensePro_Profiler.write_tracemalloc_diff(top=1000)
+    finally:
+        tracemalloc.stop()
+    assert not [trace for trace in baseline.traces if trace.traceback[-1].filename in FILTERED]
+
+    with open(path) as diff:
+        entries = diff.read().split('\n#')[1:]
+    # Frames are listed oldest first; the last one is where the memory was allocated
+    allocated_at = [[line for line in entry.splitlines() if line.strip().startswith('File ')][-1] for entry in entries]
+    assert not [line for line in allocated_at if any(f'File "{name}"' in line for name in FILTERED)]
+    assert 'test_profiler.py' in allocated_at[0]  # The real growth comes first
+    assert len(grown) == 1000
@@ -0,0 +1,115 @@
+import os
+import logging
+
+import SensePro_Spool
+
+
+def payloads(count, size=100):
+    return [f'{number:06d}'.encode().ljust(size, b'.') for number in range(count)]
+
+
+def drain(spool, batch=1000):
+    sent = []
+    while True:
+        records, position = spool.read_batch(batch)
+        if not records:
+            return sent
+        sent.extend(records)
+        spool.commit(position)
+
+
+def segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(SensePro_Spool.SEGMENT_SUFFIX))
+
+
+def test_records_come_back_in_order_across_segments(tmp_path):
+    spool = SensePro_Spool.Spool(str(tmp_path), segment_bytes=1000)
+    for payload in payloads(50):
+        spool.append(payload)
+    assert len(segment_files(tmp_path)) > 1
+    assert drain(spool, batch=7) == payloads(50)
+    assert len(segment_files(tmp_path)) == 1  # Drained segments are deleted
+    assert spool.backlog_bytes() == 0
+
+
+def test_the_cursor_survives_a_restart(tmp_path):
+    spool = SensePro_Spool.Spool(str(tmp_path), segment_bytes=1000)
+    for payload in payloads(30):
+        spool.append(payload)
+    records, position = spool.read_batch(12)
+    spool.commit(position)
+    spool.read_batch(5)  # Read but never confirmed
+    spool.close()
+
+    reopened = SensePro_Spool.Spool(str(tmp_path), segment_bytes=1000)
+    assert drain(reopened) == payloads(30)[12:]
+
+
+def test_a_torn_record_at_the_tail_is_cut_off(tmp_path):
+    spool = SensePro_Spool.Spool(str(tmp_path))
+    for payload in payloads(3):
+        spool.append(payload)
+    spool.close()
+    path = os.path.join(tmp_path, segment_files(tmp_path)[-1])
+    with open(path, 'ab') as segment_file:  # Header of a fourth record, then the power went
+        segment_file.write(SensePro_Spool.RECORD_HEADER.pack(100, 0) + b'half')
+
+    reopened = SensePro_Spool.Spool(str(tmp_path))
+    reopened.append(b'after the restart')
+    assert drain(reopened) == payloads(3) + [b'after the restart']
+
+
+def test_a_record_with_a_bad_crc_ends_the_segment(tmp_path, caplog):
+    spool = SensePro_Spool.Spool(str(tmp_path), segment_bytes=1000)
+    for payload in payloads(20):
+        spool.append(payload)
+    first = os.path.join(tmp_path, segment_files(tmp_path)[0])
+    with open(first, 'r+b') as segment_file:  # Corrupt the payload of the second record
+        segment_file.seek(SensePro_Spool.RECORD_HEADER.size * 2 + 100 + 10)
+        segment_file.write(b'X')
+
+    with caplog.at_level(logging.ERROR):
+        sent = drain(spool)
+    with open(os.path.join(tmp_path, segment_files(tmp_path)[-1]), 'rb') as segment_file:
+        per_segment = len(SensePro_Spool._scan(segment_file.read())[0])
+    assert sent[0] == payloads(20)[0]
+    assert payloads(20)[1] not in sent
+    assert sent[-per_segment:] == payloads(20)[-per_segment:]  # Later segments are still delivered
+    assert 'corrupt' in caplog.text
+
+
+def test_the_size_limit_drops_the_oldest_segments(tmp_path, caplog):
+    spool = SensePro_Spool.Spool(str(tmp_path), segment_bytes=1000, max_bytes=3000)
+    with caplog.at_level(logging.WARNING):
+        for payload in payloads(100):
+            spool.append(payload)
+    assert sum(os.path.getsize(os.path.join(tmp_path, name)) for name in segment_files(tmp_path)) <= 3000
+    assert 'dropped its oldest segment' in caplog.text
+
+    sent = drain(spool)
+    assert sent == payloads(100)[-len(sent):]  # The newest events, in order
+    assert 0 < len(sent) < 100
+
+
+def test_a_batch_read_before_its_segment_was_dropped_commits_cleanly(tmp_path):
+    spool = SensePro_Spool.Spool(str(tmp_path), segment_bytes=1000, max_bytes=3000)
+    for payload in payloads(5):
+        spool.append(payload)
+    records, position = spool.read_batch(5)
+    for payload in payloads(100)[5:]:
+        spool.append(payload)  # Drops the segment the batch came from
+    spool.commit(position)
+    sent = drain(spool)
+    assert sent and sent == payloads(100)[-len(sent):]
+
+
+def test_the_size_limit_applies_to_a_spool_left_by_a_previous_run(tmp_path):
+    spool = SensePro_Spool.Spool(str(tmp_path), segment_bytes=1000)
+    for payload in payloads(100):
+        spool.append(payload)
+    spool.close()
+
+    reopened = SensePro_Spool.Spool(str(tmp_path), segment_bytes=1000, max_bytes=3000)
+    assert reopened.total_bytes <= 3000
+    sent = drain(reopened)
+    assert sent == payloads(100)[-len(sent):]
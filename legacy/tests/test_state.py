@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+import SensePro_State
+
+KEYS = ['camera:Camera 0', 'detector:0', 'detector:1']
+
+
+def newest_bank_offset(state):
+    return SensePro_State.HEADER.size + (state.sequence % 2) * state.bank_size
+
+
+def test_armed_flag_and_trigger_times_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'state.bin')
+    state = SensePro_State.StateFile(path, KEYS)
+    state.set_armed(True)
+    state.set_triggered('detector:1', 1000.5)
+    state.close()
+
+    restored = SensePro_State.StateFile(path, KEYS)
+    assert restored.restored_armed is True
+    assert restored.restored_times == {'detector:1': 1000.5}
+
+
+def test_a_torn_bank_falls_back_to_the_other_one(tmp_path):
+    path = str(tmp_path / 'state.bin')
+    state = SensePro_State.StateFile(path, KEYS)
+    state.set_armed(True)
+    state.set_triggered('camera:Camera 0', 2000.0)  # Newest bank; the other one holds armed, no times
+    offset = newest_bank_offset(state)
+    state.close()
+
+    with open(path, 'r+b') as state_file:  # A power cut in the middle of the newest bank
+        state_file.seek(offset + SensePro_State.BANK_HEAD.size)
+        state_file.write(b'\xff' * 4)
+
+    restored = SensePro_State.StateFile(path, KEYS)
+    assert restored.restored_armed is True
+    assert restored.restored_times == {}
+
+
+def test_nothing_is_restored_when_both_banks_are_corrupt(tmp_path):
+    path = str(tmp_path / 'state.bin')
+    state = SensePro_State.StateFile(path, KEYS)
+    state.set_armed(True)
+    state.close()
+
+    with open(path, 'r+b') as state_file:
+        state_file.seek(SensePro_State.HEADER.size)
+        state_file.write(b'\x00' * (os.path.getsize(path) - SensePro_State.HEADER.size))
+
+    restored = SensePro_State.StateFile(path, KEYS)
+    assert restored.restored_armed is False and restored.restored_times == {}
+
+
+def test_a_changed_device_list_keeps_the_armed_flag_only(tmp_path):
+    path = str(tmp_path / 'state.bin')
+    state = SensePro_State.StateFile(path, KEYS)
+    state.set_armed(True)
+    state.set_triggered('detector:0', 3000.0)
+    state.close()
+
+    restored = SensePro_State.StateFile(path, KEYS + ['detector:2'])
+    assert restored.restored_armed is True
+    assert restored.restored_times == {}
+    assert os.path.getsize(path) == restored.size
+
+
+def test_rekey_keeps_the_times_of_remaining_devices(tmp_path):
+    path = str(tmp_path / 'state.bin')
+    state = SensePro_State.StateFile(path, KEYS)
+    state.set_armed(True)
+    state.set_triggered('detector:0', 4000.0)
+    state.set_triggered('detector:1', 4001.0)
+    state.rekey(['detector:1', 'camera:Camera 9'])
+    state.close()
+
+    restored = SensePro_State.StateFile(path, ['detector:1', 'camera:Camera 9'])
+    assert restored.restored_armed is True
+    assert restored.restored_times == {'detector:1': 4001.0}
+
+
+def test_a_crash_while_changing_the_layout_leaves_the_old_file_intact(tmp_path, monkeypatch):
+    path = str(tmp_path / 'state.bin')
+    state = SensePro_State.StateFile(path, KEYS)
+    state.set_armed(True)
+    state.set_triggered('detector:0', 5000.0)
+    state.close()
+
+    def crash(source, destination):
+        raise OSError("power cut")
+    monkeypatch.setattr(SensePro_State.os, 'replace', crash)
+    with pytest.raises(OSError):
+        SensePro_State.StateFile(path, ['detector:0'])
+    monkeypatch.undo()
+
+    restored = SensePro_State.StateFile(path, KEYS)
+    assert restored.restored_armed is True
+    assert restored.restored_times == {'detector:0': 5000.0}
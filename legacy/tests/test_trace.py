@@ -0,0 +1,42 @@
+import SensePro_Sources
+import SensePro_Trace
+from conftest import runtime_intrusions
+from test_engine import rule
+
+PRESS, RELEASE = SensePro_Sources.PRESS, SensePro_Sources.RELEASE
+
+
+class Outputs:
+    def __init__(self):
+        self.intrusions = []
+
+    def output(self, ts, output, target, action):
+        if output == 'intrusion':
+            self.intrusions.append(target)
+
+
+def replay_intrusions(config, edges):
+    sink = Outputs()
+    replay = SensePro_Trace.Replay(config, sink)
+    for ts, key, edge in edges:
+        replay.feed(key, edge, ts)
+    return sink.intrusions
+
+
+def test_a_disarm_while_disarmed_keeps_the_windows(compile_site):
+    config = compile_site([rule('any', cameras=[0], detectors=[0])])
+    edges = [(100.0, 'camera:Camera 0', PRESS),
+             (101.0, SensePro_Trace.ARM_KEY, RELEASE),  # Already disarmed: begin_disarming does nothing
+             (102.0, 'detector:0', PRESS)]
+    assert replay_intrusions(config, edges) == runtime_intrusions(config, edges) == ['any']
+
+
+def test_disarming_and_reset_clear_the_windows(compile_site):
+    config = compile_site([rule('any', cameras=[0], detectors=[0])])
+    for system_edge in [(101.0, SensePro_Trace.ARM_KEY, RELEASE), (101.0, SensePro_Trace.RESET_KEY, PRESS)]:
+        edges = [(99.0, SensePro_Trace.ARMED_KEY, PRESS), (100.0, 'camera:Camera 0', PRESS), system_edge,
+                 (102.0, 'detector:0', PRESS)]
+        assert replay_intrusions(config, edges) == runtime_intrusions(config, edges) == []
+
+    edges = [(100.0, 'camera:Camera 0', PRESS), (101.0, SensePro_Trace.RESET_KEY, PRESS), (102.0, 'detector:0', PRESS)]
+    assert replay_intrusions(config, edges) == runtime_intrusions(config, edges) == []  # Reset clears even when disarmed
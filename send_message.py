@@ -1,8 +1,34 @@
 import json
 import os
+import sys
+import time
+import glob
+import uuid
+import hashlib
+import argparse
+import functools
 import pika
 
+try:
+    import msgpack
+except ImportError:  # Binary encoding is optional; JSON is always available
+    msgpack = None
+
 SEND_CONFIG_FILE = "send_config.json"
+STATE_FILE = "send_message_state.json"  # Last version acknowledged by each controller
+STATUS_QUEUE = "controller-status"
+# Versioned full/delta envelopes go to controller-<serial>-config, read by the Python runtime
+# (SensePro_Remote.ConfigConsumer). controller-<serial> gets the plain document, which is all the
+# Java ControllerMessageListener can read; --no-plain skips it for sites without the Java side.
+CONFIG_QUEUE_SUFFIX = "-config"
+STATUS_TIMEOUT = 10  # Seconds to wait for the controller to report back
+FLEET_WINDOW = 256  # Unconfirmed publishes allowed in flight in fleet mode
+FLEET_ATTEMPTS = 3  # Publishes per controller before a nack is reported as a failure
+COMMANDS = ("arm", "disarm", "reset", "status")
+REPLY_TO = "amq.rabbitmq.reply-to"  # RabbitMQ direct reply-to, no reply queue to declare
+COMPACT_FORMAT = 1
+JSON_TYPE = "application/json"
+MSGPACK_TYPE = "application/msgpack"
 
 def load_send_config():
     if not os.path.exists(SEND_CONFIG_FILE):
@@ -12,34 +38,546 @@ def load_send_config():
     with open(SEND_CONFIG_FILE, "r") as f:
         return json.load(f)
 
-def send_message_to_queue():
-    # Load configuration to send
-    config = load_send_config()
-    if config is None:
+# Version of a document; must match SensePro_Remote.content_hash on the controller
+def content_hash(document):
+    canonical = json.dumps(document, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def _escape(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+# JSON patch operations (add, remove, replace) that turn old into new
+def make_patch(old, new, path=''):
+    if isinstance(old, dict) and isinstance(new, dict):
+        patch = [{"op": "remove", "path": f"{path}/{_escape(key)}"} for key in old if key not in new]
+        for key, value in new.items():
+            if key in old:
+                patch.extend(make_patch(old[key], value, f"{path}/{_escape(key)}"))
+            else:
+                patch.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+        return patch
+    if isinstance(old, list) and isinstance(new, list):
+        common = min(len(old), len(new))
+        patch = []
+        for index in range(common):
+            patch.extend(make_patch(old[index], new[index], f"{path}/{index}"))
+        for index in range(len(old) - 1, common - 1, -1):
+            patch.append({"op": "remove", "path": f"{path}/{index}"})
+        for index in range(common, len(new)):
+            patch.append({"op": "add", "path": f"{path}/{index}", "value": new[index]})
+        return patch
+    # 1 == 1.0 == True in Python but not in the canonical JSON the versions are hashed from
+    if type(old) is type(new) and old == new:
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+# Normalised form of a document: every distinct device object is stored once, as a row of
+# values for one of a few key lists ("shapes"), and device lists, rules and selectedDevices
+# refer to rows by index. Must decode with SensePro_Remote.decode_compact to an equal document.
+def encode_compact(document):
+    shapes, shape_indexes = [], {}
+    rows, row_indexes, id_indexes = [], {}, {}
+
+    def ref(device):
+        shape = tuple(device)
+        shape_index = shape_indexes.get(shape)
+        if shape_index is None:
+            shape_index = shape_indexes[shape] = len(shapes)
+            shapes.append(list(shape))
+        row = [shape_index, *device.values()]
+        row_key = json.dumps(row)
+        index = row_indexes.get(row_key)
+        if index is None:
+            index = row_indexes[row_key] = len(rows)
+            rows.append(row)
+            id_indexes.setdefault(device.get("id"), index)
+        return index
+
+    def refs(devices):
+        return [ref(device) for device in devices]
+
+    compact = {"format": COMPACT_FORMAT, "shapes": shapes, "devices": rows}
+    for key, value in document.items():
+        if key in ("devices", "devicesAllowedInRules"):
+            compact.setdefault("lists", {})[key] = refs(value)
+        elif key == "rules":
+            compact["rules"] = []
+            for entry in value:
+                entry = dict(entry)
+                if isinstance(entry.get("rule"), dict) and "devices" in entry["rule"]:
+                    entry["rule"] = dict(entry["rule"], devices=refs(entry["rule"]["devices"]))
+                if "devices" in entry:
+                    entry["devices"] = refs(entry["devices"])
+                compact["rules"].append(entry)
+        else:
+            compact.setdefault("other", {})[key] = value
+    # Selected device ids become row indexes once every device has been seen
+    for entry in compact.get("rules", []):
+        if "selectedDevices" in entry:
+            entry["selectedDevices"] = [id_indexes.get(device_id, device_id) for device_id in entry["selectedDevices"]]
+    compact["order"] = list(document)
+    return compact
+
+# Encode a message in chunks, so a large fleet payload is never held twice in memory
+def iter_encode(message, binary=False):
+    if not binary:
+        yield from json.JSONEncoder(separators=(',', ':')).iterencode(message)
+        return
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed; use the JSON encoding")
+    packer = msgpack.Packer()
+    yield packer.pack_map_header(len(message))
+    for key, value in message.items():
+        yield packer.pack(key)
+        if isinstance(value, dict) and key == "compact":
+            yield packer.pack_map_header(len(value))
+            for compact_key, compact_value in value.items():
+                yield packer.pack(compact_key)
+                if compact_key == "devices":
+                    yield packer.pack_array_header(len(compact_value))
+                    for row in compact_value:
+                        yield packer.pack(row)
+                else:
+                    yield packer.pack(compact_value)
+        else:
+            yield packer.pack(value)
+
+def encode_message(message, binary=False):
+    chunks = [chunk.encode() if isinstance(chunk, str) else chunk for chunk in iter_encode(message, binary)]
+    return b"".join(chunks), MSGPACK_TYPE if binary else JSON_TYPE
+
+def write_encoded(message, stream, binary=False):
+    size = 0
+    for chunk in iter_encode(message, binary):
+        chunk = chunk.encode() if isinstance(chunk, str) else chunk
+        stream.write(chunk)
+        size += len(chunk)
+    return size
+
+# Read messages back from an encoded stream (one JSON document, or consecutive msgpack objects)
+def read_encoded(stream, binary=False):
+    if not binary:
+        yield json.load(stream)
         return
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed; use the JSON encoding")
+    yield from msgpack.Unpacker(stream, raw=False)
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE, "r") as f:
+        return json.load(f)
 
+def save_state(state):
+    with open(STATE_FILE + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(STATE_FILE + ".tmp", STATE_FILE)
+
+def controller_state(state, serial):
+    return state.setdefault(serial, {"acked": None, "pending": None, "full_next": False, "documents": {}})
+
+# Keep a sent document until the controller reports on it; it becomes the next delta base
+def remember_sent(state, serial, version, config):
+    controller = controller_state(state, serial)
+    controller["pending"] = version
+    controller["documents"][version] = config
+
+# Record a status reported by a controller; returns (serial, status, version)
+def process_status(state, status):
+    controller = controller_state(state, status["controller"])
+    controller["acked"] = status.get("version")
+    controller["full_next"] = status["status"] == "mismatch"
+    # Only the acknowledged and the in-flight documents can be the base of a delta
+    controller["documents"] = {version: document for version, document in controller["documents"].items()
+                               if version in (controller["acked"], controller.get("pending"))}
+    if status["status"] == "rejected":
+        print(f"Controller {status['controller']} rejected the configuration: {status.get('error')}")
+    return status["controller"], status["status"], status.get("version")
+
+def drain_statuses(channel, state):
+    statuses = []
+    while True:
+        method, _, body = channel.basic_get(queue=STATUS_QUEUE, auto_ack=True)
+        if method is None:
+            return statuses
+        statuses.append(process_status(state, json.loads(body)))
+
+# Full document or delta against the controller's acknowledged version
+def build_message(state, serial, config, force_full=False):
+    version = content_hash(config)
+    controller = state.get(serial, {})
+    base = controller.get("acked")
+    full = {"type": "full", "version": version, "compact": encode_compact(config)}
+    if force_full or controller.get("full_next") or base not in controller.get("documents", {}):
+        return full
+    if base == version:
+        return None
+    delta = {"type": "delta", "base": base, "version": version,
+             "patch": make_patch(controller["documents"][base], config)}
+    # A rewrite of most of the document is cheaper to send whole
+    return delta if len(json.dumps(delta)) < len(json.dumps(full)) else full
+
+def publish(channel, queue_name, message, binary=False):
+    body, content_type = encode_message(message, binary)
+    channel.basic_publish(exchange='', routing_key=queue_name, body=body,
+                          properties=pika.BasicProperties(content_type=content_type, delivery_mode=2))
+    return len(body)
+
+def wait_for_status(channel, state, serial, version):
+    deadline = time.monotonic() + STATUS_TIMEOUT
+    while time.monotonic() < deadline:
+        for controller, status, reported in drain_statuses(channel, state):
+            if controller == serial and (status == "mismatch" or reported == version or status == "rejected"):
+                return status
+        time.sleep(0.2)
+    return None
+
+def connection_parameters():
     # RabbitMQ connection settings
     rabbitmq_host = "localhost"
     rabbitmq_username = "user"
     rabbitmq_password = "password"
-    queue_name = "controller-0000000000000000"
+    credentials = pika.PlainCredentials(rabbitmq_username, rabbitmq_password)
+    return pika.ConnectionParameters(host=rabbitmq_host, credentials=credentials)
+
+def config_queue_name(serial):
+    return f"controller-{serial}{CONFIG_QUEUE_SUFFIX}"
+
+def plain_queue_name(serial):
+    return f"controller-{serial}"
+
+# The document as the Java listener reads it: the bare Config JSON
+def encode_plain(config):
+    return json.dumps(config, separators=(',', ':')).encode()
+
+def publish_plain(channel, serial, config):
+    body = encode_plain(config)
+    channel.basic_publish(exchange='', routing_key=plain_queue_name(serial), body=body,
+                          properties=pika.BasicProperties(content_type=JSON_TYPE, delivery_mode=2))
+    return len(body)
+
+def declare_controller_queue(channel, queue_name, callback=None):
+    # Durable, newest configuration only, as declared by the controller
+    kwargs = {"callback": callback} if callback else {}
+    return channel.queue_declare(queue=queue_name, durable=True, arguments={"x-max-length": 1}, **kwargs)
+
+def send_message_to_queue(serial="0000000000000000", force_full=False, binary=False, plain=True):
+    # Load configuration to send
+    config = load_send_config()
+    if config is None:
+        return
+
+    queue_name = config_queue_name(serial)
 
     # RabbitMQ connection
-    credentials = pika.PlainCredentials(rabbitmq_username, rabbitmq_password)
-    connection_params = pika.ConnectionParameters(host=rabbitmq_host, credentials=credentials)
-    connection = pika.BlockingConnection(connection_params)
+    connection = pika.BlockingConnection(connection_parameters())
     channel = connection.channel()
 
-    # Declare queue
-    channel.queue_declare(queue=queue_name)
+    # Declare queues
+    declare_controller_queue(channel, queue_name)
+    if plain:
+        declare_controller_queue(channel, plain_queue_name(serial))
+    channel.queue_declare(queue=STATUS_QUEUE, durable=True)
 
-    # Convert config to JSON string and send as message
-    message = json.dumps(config)
-    channel.basic_publish(exchange='', routing_key=queue_name, body=message)
+    state = load_state()
+    drain_statuses(channel, state)
 
-    print(f"Configuration sent to queue {queue_name}")
+    version = content_hash(config)
+    if plain:
+        size = publish_plain(channel, serial, config)
+        print(f"Plain configuration {version[:12]} sent to queue {plain_queue_name(serial)} ({size} bytes)")
+    message = build_message(state, serial, config, force_full)
+    if message is None:
+        print(f"Controller {serial} already has configuration {version[:12]}")
+    else:
+        remember_sent(state, serial, version, config)
+        size = publish(channel, queue_name, message, binary)
+        print(f"Configuration {version[:12]} sent to queue {queue_name} as {message['type']} ({size} bytes)")
 
+        status = wait_for_status(channel, state, serial, version)
+        if status == "mismatch":
+            size = publish(channel, queue_name, build_message(state, serial, config, force_full=True), binary)
+            print(f"Controller {serial} reported a version mismatch; full configuration sent ({size} bytes)")
+            status = wait_for_status(channel, state, serial, version)
+        print(f"Controller {serial} status: {status or 'no reply'}")
+
+    save_state(state)
     connection.close()
 
+# Send a remote command to a controller and wait for its reply; returns the reply or None
+def send_command(serial, command, timeout=STATUS_TIMEOUT):
+    connection = pika.BlockingConnection(connection_parameters())
+    channel = connection.channel()
+    queue_name = f"controller-{serial}-commands"
+    # Same arguments as the controller's declaration: commands expire after a minute
+    channel.queue_declare(queue=queue_name, durable=True, arguments={"x-message-ttl": 60000})
+
+    command_id = uuid.uuid4().hex
+    replies = []
+    def on_reply(ch, method, properties, body):
+        if properties.correlation_id == command_id:
+            replies.append(json.loads(body))
+    channel.basic_consume(queue=REPLY_TO, on_message_callback=on_reply, auto_ack=True)
+
+    started = time.monotonic()
+    channel.basic_publish(exchange='', routing_key=queue_name, body=json.dumps({"id": command_id, "command": command}),
+                          properties=pika.BasicProperties(content_type="application/json", delivery_mode=2,
+                                                          reply_to=REPLY_TO, correlation_id=command_id))
+    deadline = started + timeout
+    while not replies and time.monotonic() < deadline:
+        connection.process_data_events(time_limit=deadline - time.monotonic())
+    elapsed = time.monotonic() - started
+    connection.close()
+
+    if not replies:
+        print(f"No reply from controller {serial} to {command} within {timeout}s")
+        return None
+    reply = replies[0]
+    print(f"Controller {serial} {command}: {reply['result']} in {elapsed * 1e3:.0f} ms, state {reply.get('state')}"
+          f"{', ' + reply['error'] if reply.get('error') else ''}")
+    return reply
+
+# (serial, config) pairs from a directory of <serial>.json files, or a JSON-lines file/stdin
+# ("-") with one {"serial": ..., "config": {...}} object per line
+def iter_fleet_configs(source):
+    if os.path.isdir(source):
+        for path in sorted(glob.glob(os.path.join(source, "*.json"))):
+            with open(path, "r") as f:
+                yield os.path.splitext(os.path.basename(path))[0], json.load(f)
+        return
+    stream = sys.stdin if source == "-" else open(source, "r")
+    try:
+        for line in stream:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["serial"], entry["config"]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+class FleetPublisher:
+    # Publishes to many controllers over one connection. Queue declarations and publishes are
+    # pipelined, with at most `window` publishes awaiting a broker confirm; controller status
+    # replies are consumed on the same channel while publishing, and a mismatch is answered
+    # with a full configuration straight away.
+    def __init__(self, jobs, state, window=FLEET_WINDOW, binary=False, wait=0, plain=True):
+        self.jobs = iter(jobs)
+        self.state = state
+        self.window = window
+        self.binary = binary
+        self.wait = wait
+        self.plain = plain  # Also publish the plain document for the Java listener
+        self.connection = None
+        self.channel = None
+        self.configs = {}
+        self.results = {}
+        self.in_flight = {}  # delivery tag -> serial
+        self.pending = 0  # Declared or being declared, not yet published
+        self.delivery_tag = 0
+        self.exhausted = False
+        self.wait_scheduled = self.wait_elapsed = False
+        self.closing = False
+        self.error = None
+        self.started = self.finished = None
+
+    def run(self):
+        self.started = time.monotonic()
+        self.connection = pika.SelectConnection(
+            connection_parameters(),
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_error,
+            on_close_callback=self._on_connection_closed,
+        )
+        self.connection.ioloop.start()
+        self.finished = time.monotonic()
+        return self.results
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, connection, error):
+        self.error = error
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        if not self.closing:
+            self.error = reason
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self.channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.add_on_return_callback(self._on_return)
+        channel.confirm_delivery(self._on_confirm)
+        channel.queue_declare(queue=STATUS_QUEUE, durable=True, callback=self._on_status_queue)
+
+    # The broker closes the channel on errors such as a queue declared with other arguments
+    def _on_channel_closed(self, channel, reason):
+        if not self.closing:
+            self.error = reason
+            self.closing = True
+            self.connection.close()
+
+    def _on_status_queue(self, frame):
+        self.channel.basic_consume(queue=STATUS_QUEUE, on_message_callback=self._on_status, auto_ack=True)
+        self._fill()
+
+    # Start declares and publishes until the window is full or the jobs run out
+    def _fill(self):
+        while not self.exhausted and len(self.in_flight) + self.pending < self.window:
+            try:
+                serial, config = next(self.jobs)
+            except StopIteration:
+                self.exhausted = True
+                break
+            except (OSError, ValueError, KeyError) as e:
+                self.results.setdefault("<input>", {"outcome": "error", "error": str(e)})
+                continue
+            self._send(serial, config)
+        self._maybe_finish()
+
+    def _send(self, serial, config, force_full=False):
+        result = self.results.setdefault(serial, {"bytes": 0, "publishes": 0, "outcome": None, "status": None})
+        self.configs[serial] = config
+        try:
+            message = build_message(self.state, serial, config, force_full)
+            if message is None:
+                result["outcome"] = "up to date"
+                return
+            body, content_type = encode_message(message, self.binary)
+        except Exception as e:
+            result.update(outcome="error", error=str(e))
+            return
+        remember_sent(self.state, serial, message["version"], config)
+        result.update(type=message["type"], version=message["version"], outcome="pending")
+        self.pending += 1
+        publish = functools.partial(self._publish, serial, body, content_type, encode_plain(config) if self.plain else None)
+        if self.plain:
+            declare = functools.partial(declare_controller_queue, self.channel, plain_queue_name(serial), callback=publish)
+            declare_controller_queue(self.channel, config_queue_name(serial), callback=lambda frame: declare())
+        else:
+            declare_controller_queue(self.channel, config_queue_name(serial), callback=publish)
+
+    def _publish(self, serial, body, content_type, plain_body, frame):
+        self.pending -= 1
+        result = self.results[serial]
+        self.channel.basic_publish(exchange='', routing_key=config_queue_name(serial), body=body, mandatory=True,
+                                   properties=pika.BasicProperties(content_type=content_type, delivery_mode=2))
+        self.delivery_tag += 1
+        self.in_flight[self.delivery_tag] = serial
+        result["bytes"] += len(body)
+        if plain_body is not None:
+            self.channel.basic_publish(exchange='', routing_key=plain_queue_name(serial), body=plain_body, mandatory=True,
+                                       properties=pika.BasicProperties(content_type=JSON_TYPE, delivery_mode=2))
+            self.delivery_tag += 1
+            self.in_flight[self.delivery_tag] = serial
+            result["plain_bytes"] = result.get("plain_bytes", 0) + len(plain_body)
+        result["publishes"] += 1
+        result["published_at"] = time.monotonic()
+
+    def _on_return(self, channel, method, properties, body):
+        serial = method.routing_key[len("controller-"):].removesuffix(CONFIG_QUEUE_SUFFIX)
+        if serial in self.results:
+            self.results[serial].update(outcome="returned", error=method.reply_text)
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        tags = [tag for tag in self.in_flight if tag <= method.delivery_tag] if method.multiple else [method.delivery_tag]
+        now = time.monotonic()
+        for tag in tags:
+            serial = self.in_flight.pop(tag, None)
+            if serial is None:
+                continue
+            result = self.results[serial]
+            result["confirm_seconds"] = now - result["published_at"]
+            # With the plain copy a controller has two publishes; it is confirmed once both are
+            if result["outcome"] == "pending":
+                if not acked:
+                    result["outcome"] = "nacked"
+                elif serial not in self.in_flight.values():
+                    result["outcome"] = "confirmed"
+            if result["outcome"] == "nacked" and result["publishes"] < FLEET_ATTEMPTS and not self.closing:
+                self._send(serial, self.configs[serial])
+        self._fill()
+
+    def _on_status(self, channel, method, properties, body):
+        serial, status, version = process_status(self.state, json.loads(body))
+        if serial not in self.results:
+            return
+        self.results[serial]["status"] = status
+        if status == "mismatch" and serial in self.configs and not self.closing:
+            self._send(serial, self.configs[serial], force_full=True)
+
+    def _maybe_finish(self):
+        if self.closing or not self.exhausted or self.in_flight or self.pending:
+            return
+        if self.wait_elapsed or not self.wait:
+            self.closing = True
+            self.connection.close()
+        elif not self.wait_scheduled:
+            # Give controllers time to report back (and answer mismatches) before closing
+            self.wait_scheduled = True
+            self.connection.ioloop.call_later(self.wait, self._on_wait_elapsed)
+
+    def _on_wait_elapsed(self):
+        self.wait_elapsed = True
+        self._maybe_finish()
+
+    def report(self):
+        elapsed = max((self.finished or time.monotonic()) - self.started, 1e-9)
+        outcomes = {}
+        total_bytes = 0
+        for serial, result in sorted(self.results.items()):
+            outcomes[result["outcome"]] = outcomes.get(result["outcome"], 0) + 1
+            total_bytes += result.get("bytes", 0)
+            if result["outcome"] not in ("confirmed", "up to date") or result.get("status") in ("mismatch", "rejected"):
+                print(f"  {serial}: {result['outcome']}, status {result.get('status') or 'no reply'}"
+                      f"{', ' + result['error'] if result.get('error') else ''}")
+        published = sum(result.get("publishes", 0) for result in self.results.values())
+        confirms = sorted(result["confirm_seconds"] for result in self.results.values() if "confirm_seconds" in result)
+        print(f"{len(self.results)} controllers, {published} publishes, {total_bytes / 1e6:.2f} MB in {elapsed:.2f}s "
+              f"({published / elapsed:.0f} msg/s, {total_bytes / 1e6 / elapsed:.2f} MB/s)")
+        if confirms:
+            print(f"Confirm latency p50 {confirms[len(confirms) // 2] * 1e3:.1f} ms, "
+                  f"max {confirms[-1] * 1e3:.1f} ms")
+        print("Outcomes: " + ", ".join(f"{outcome} {count}" for outcome, count in sorted(outcomes.items())))
+        if self.error:
+            print(f"Connection error: {self.error}")
+
+def publish_fleet(source, window=FLEET_WINDOW, binary=False, wait=0, plain=True):
+    state = load_state()
+    publisher = FleetPublisher(iter_fleet_configs(source), state, window, binary, wait, plain)
+    publisher.run()
+    save_state(state)
+    publisher.report()
+    return publisher.results
+
 if __name__ == "__main__":
-    send_message_to_queue()
+    parser = argparse.ArgumentParser(description="Publish send_config.json to a controller.")
+    parser.add_argument("serial", nargs="?", default="0000000000000000", help="Controller serial number")
+    parser.add_argument("--full", action="store_true", help="Send the full configuration instead of a delta")
+    parser.add_argument("--binary", action="store_true", help="Encode with msgpack instead of JSON")
+    parser.add_argument("--output", help="Write the encoded full message to this file instead of publishing")
+    parser.add_argument("--fleet", help="Publish every config in a directory of <serial>.json files, "
+                                        "or a JSON-lines file ('-' for stdin) of {serial, config} objects")
+    parser.add_argument("--window", type=int, default=FLEET_WINDOW, help="Fleet mode: unconfirmed publishes in flight")
+    parser.add_argument("--wait", type=float, default=0, help="Fleet mode: seconds to wait for controller status replies")
+    parser.add_argument("--command", choices=COMMANDS, help="Send a remote command instead of the configuration")
+    parser.add_argument("--no-plain", action="store_true",
+                        help="Do not also publish the plain document to controller-<serial> for the Java controller")
+    args = parser.parse_args()
+    if args.command:
+        send_command(args.serial, args.command)
+    elif args.fleet:
+        publish_fleet(args.fleet, args.window, args.binary, args.wait, not args.no_plain)
+    elif args.output:
+        config = load_send_config()
+        if config is not None:
+            message = build_message({}, args.serial, config, force_full=True)
+            with open(args.output, "wb") as f:
+                size = write_encoded(message, f, args.binary)
+            print(f"Configuration {message['version'][:12]} written to {args.output} ({size} bytes)")
+    else:
+        send_message_to_queue(args.serial, args.full, args.binary, not args.no_plain)
@@ -14,6 +14,15 @@ import sensepro.controller.service.PinService;
 
 import java.util.Set;
 
+/**
+ * Applies configuration pushes from the controller-&lt;serial&gt; queue.
+ * <p>
+ * This queue carries only the plain {@link Config} document. The versioned full/delta envelopes
+ * ({@code {"type", "version", "compact" | "patch"}}) that send_message.py sends to the Python runtime
+ * go to controller-&lt;serial&gt;-config, which this listener does not read, so both runtimes get every
+ * push without consuming each other's messages. send_message.py --no-plain stops publishing here,
+ * for controllers that no longer run this listener.
+ */
 @Slf4j
 @Component
 public class ControllerMessageListener {